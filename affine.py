@@ -0,0 +1,86 @@
+# FILENAME: affine.py
+
+#
+# Аффинные преобразования плоскости матрицами 3×3 (однородные координаты):
+#
+#   | a  b  tx |   x' = a·x + b·y + tx
+#   | c  d  ty |   y' = c·x + d·y + ty
+#   | 0  0  1  |
+#
+# Перестановка осей, масштаб, поворот и сдвиг собираются в одну матрицу
+# (compose), и она применяется ко всему массиву вершин (N, 2) за один
+# векторный проход (apply). Промежуточного округления нет: координаты
+# округляются один раз, при экспорте polygon.json (export.precision).
+#
+# Калибровки (Stage 2, ручная подстройка, записи манифеста) —
+# {"scale", "rotation_deg", "offset_x", "offset_y"}; similarity(tr) даёт их
+# матрицу. swap_axes(m) — та же трансформация для пар, записанных в другом
+# порядке осей ([y, x] вместо [x, y]).
+#
+# Нижняя строка не (0, 0, 1) — проективная матрица (control_points):
+# apply делит на w = g·x + h·y + 1.
+
+import math
+
+import numpy as np
+
+SWAP = np.array([[0.0, 1.0, 0.0],
+                 [1.0, 0.0, 0.0],
+                 [0.0, 0.0, 1.0]])
+
+
+def identity():
+    return np.eye(3)
+
+
+def translation(tx, ty):
+    m = np.eye(3)
+    m[0, 2], m[1, 2] = tx, ty
+    return m
+
+
+def scaling(s):
+    return np.diag([s, s, 1.0])
+
+
+def rotation(deg):
+    ang = math.radians(deg)
+    ca, sa = math.cos(ang), math.sin(ang)
+    return np.array([[ca, -sa, 0.0],
+                     [sa, ca, 0.0],
+                     [0.0, 0.0, 1.0]])
+
+
+def compose(*matrices):
+    """Матрица, применяющая matrices по порядку: сначала первую."""
+    out = np.eye(3)
+    for m in matrices:
+        out = m @ out
+    return out
+
+
+def similarity(tr):
+    """Калибровка {"scale", "rotation_deg", "offset_x", "offset_y"}: масштаб, поворот, сдвиг."""
+    return compose(scaling(tr["scale"]), rotation(tr["rotation_deg"]),
+                   translation(tr["offset_x"], tr["offset_y"]))
+
+
+def swap_axes(m):
+    """m для пар в обратном порядке осей: SWAP · m · SWAP."""
+    return SWAP @ m @ SWAP
+
+
+def apply(m, xy):
+    """
+    Матрица к массиву вершин (N, 2) → новый массив (N, 2). Считается
+    поэлементно (a·x + b·y + tx), без BLAS: результат не зависит от порядка
+    осей, в котором записаны пары, — swap_axes(m) к [y, x] даёт ровно те же
+    числа, что m к [x, y].
+    """
+    xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+    x, y = xy[:, 0], xy[:, 1]
+    out = np.column_stack((m[0, 0] * x + m[0, 1] * y + m[0, 2],
+                           m[1, 0] * x + m[1, 1] * y + m[1, 2]))
+    if m[2, 0] or m[2, 1] or m[2, 2] != 1.0:
+        out /= (m[2, 0] * x + m[2, 1] * y + m[2, 2])[:, None]
+    return out
@@ -0,0 +1,153 @@
+# FILENAME: batch_calibrate.py
+
+#
+# Калибровка многих проектов одной командой, без input() и отдельных
+# консолей: каждый проект (папка с polygon.parcels / polygon.json) — в
+# своём процессе. Трансформация ложится на стек калибровок проекта, как
+# после stage2_transform.py / manual_adjust_polygon.py.
+#
+# Трансформация задаётся одним из способов:
+#   --pairs bm74:ai76 as92:as97        квадраты сетки Stage 2 (шаг --step);
+#   --control-points points.csv        CSV (control_points); относительный
+#                                      путь — внутри каждого проекта;
+#   --scale/--shift-x/--shift-y/--rotation   явные параметры, как в ручной
+#                                      подстройке.
+#
+#   python batch_calibrate.py sites/* --control-points points.csv --model affine
+#   python batch_calibrate.py sites/a sites/b --shift-x 1.5 --workers 4
+
+import argparse
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from control_points import MODELS, load_control_points
+from manual_adjust_polygon import adjust
+from stage2_transform import DEFAULT_STEP, calibrate
+
+
+def parse_pair(text):
+    src, sep, dst = text.partition(":")
+    if not sep or not src or not dst:
+        raise argparse.ArgumentTypeError(f"пара вида исходный:целевой, а не {text}")
+    return src, dst
+
+
+def run_project(job):
+    """Один проект (в процессе пула). (папка, результат или None, ошибка или None)."""
+    project_dir, spec = job
+    try:
+        if spec["mode"] == "manual":
+            tr, exported = adjust(project_dir, export=spec["export"], **spec["params"])
+            return project_dir, {"transform": tr, "rms": None, "exported": exported}, None
+        pairs = spec["pairs"]
+        if pairs is None:
+            path = spec["control_points"]
+            pairs = load_control_points(path if os.path.isabs(path) else os.path.join(project_dir, path))
+        result = calibrate(project_dir, pairs, spec["model"], spec["allow_rotation"], spec["step"],
+                           export=spec["export"])
+        return project_dir, result, None
+    except Exception as e:
+        # любая ошибка — только этого проекта: остальные считаются и попадают в отчёт
+        return project_dir, None, f"{type(e).__name__}: {e}"
+
+
+def calibrate_projects(dirs, spec, workers=None):
+    """
+    run_project для каждой папки, в нескольких процессах; результаты — в
+    порядке dirs. Вызывающий скрипт должен быть защищён
+    `if __name__ == "__main__"` (на Windows процессы стартуют через spawn).
+    """
+    workers = min(workers or os.cpu_count() or 1, len(dirs))
+    jobs = [(d, spec) for d in dirs]
+    if workers <= 1:
+        return [run_project(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run_project, jobs))
+
+
+def project_dirs(patterns):
+    """
+    Папки проектов по шаблонам, каждая один раз (sites/a и sites/a/ — одна
+    папка: два процесса не должны переписывать один манифест).
+    Возвращает (папки, [(путь или шаблон, ошибка)]): опечатка в имени
+    проекта не должна молча выпасть из отчёта.
+    """
+    dirs = []
+    missing = []
+    seen = set()
+    for pattern in patterns:
+        # имя со скобками ([, ]) как шаблон может не совпасть само с собой
+        matched = sorted(glob.glob(pattern)) or ([pattern] if os.path.exists(pattern) else [])
+        if not matched:
+            missing.append((pattern, "не найдено"))
+            continue
+        for path in matched:
+            real = os.path.realpath(path)
+            if not os.path.isdir(path):
+                missing.append((path, "не папка"))
+            elif real not in seen:
+                seen.add(real)
+                dirs.append(path)
+    return dirs, missing
+
+
+def main():
+    p = argparse.ArgumentParser(description="Калибровка многих проектов (Stage 2 / ручная подстройка)")
+    p.add_argument("projects", nargs="+", help="папки проектов (можно шаблоном: sites/*)")
+    p.add_argument("--pairs", nargs="+", type=parse_pair, help="пары квадратов сетки: bm74:ai76 ...")
+    p.add_argument("--control-points", help="CSV контрольных точек")
+    p.add_argument("--model", choices=MODELS, default="similarity")
+    p.add_argument("--no-rotation", action="store_true", help="подобие без поворота")
+    p.add_argument("--step", type=int, default=DEFAULT_STEP, help="шаг сетки для имён квадратов")
+    p.add_argument("--scale", type=float, help="ручная подстройка: масштаб")
+    p.add_argument("--shift-x", type=float, help="ручная подстройка: смещение по X")
+    p.add_argument("--shift-y", type=float, help="ручная подстройка: смещение по Y")
+    p.add_argument("--rotation", type=float, help="ручная подстройка: поворот, градусы")
+    p.add_argument("--export", action="store_true", default=None, help="выгрузить polygon.json")
+    p.add_argument("--no-export", dest="export", action="store_false", default=None,
+                   help="не выгружать polygon.json (только стек калибровок)")
+    p.add_argument("--workers", type=int, help="процессов (по умолчанию — по числу ядер)")
+    args = p.parse_args()
+
+    params = {k: getattr(args, k) for k in ("scale", "shift_x", "shift_y", "rotation")
+              if getattr(args, k) is not None}
+    modes = [m for m, given in (("pairs", args.pairs), ("csv", args.control_points), ("manual", params)) if given]
+    if len(modes) != 1:
+        p.error("нужен ровно один способ: --pairs, --control-points или --scale/--shift-x/--shift-y/--rotation")
+
+    spec = {
+        "mode": modes[0],
+        "pairs": args.pairs,
+        "control_points": args.control_points,
+        "model": args.model,
+        "allow_rotation": not args.no_rotation,
+        "step": args.step,
+        "params": params,
+        "export": args.export,
+    }
+
+    dirs, missing = project_dirs(args.projects)
+    total = len(dirs) + len(missing)
+    print(f"🧭 Проектов: {total}")
+    failed = len(missing)
+    for path, error in missing:
+        print(f"❌ {path}: {error}")
+    if not dirs:
+        print(f"=== Готово: 0 из {total} ===")
+        return
+
+    for project_dir, result, error in calibrate_projects(dirs, spec, args.workers):
+        if error:
+            failed += 1
+            print(f"❌ {project_dir}: {error}")
+            continue
+        rms = "" if result["rms"] is None else f", RMS {result['rms']:.3f}"
+        exported = ", polygon.json выгружен" if result["exported"] else ""
+        print(f"✅ {project_dir}{rms}{exported}")
+
+    print(f"=== Готово: {total - failed} из {total} ===")
+
+
+if __name__ == "__main__":
+    main()
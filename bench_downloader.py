@@ -0,0 +1,162 @@
+# FILENAME: bench_downloader.py
+
+#
+# Офлайн-бенчмарк загрузчика get_geojson_by_list.py против локальной
+# заглушки росреестра (rosreestr_stub.py).
+#
+# Для каждой пары (бэкенд, число потоков) прогоняет те же проходы с
+# повторами, что и main() загрузчика, во временном каталоге и печатает:
+# участков в секунду, число повторов, задержку запроса p50/p95/p99.
+# Заглушка детерминирована, поэтому все сценарии видят одинаковые отказы.
+#
+# Пример:
+#   python bench_downloader.py --count 200 --latency 80 --jitter 30 \
+#       --error-rate 0.05 --workers 1 4 8 --backends subprocess inprocess
+
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import get_geojson_by_list as dl
+from download_cache import DownloadCache
+from download_journal import Journal
+from downloader_control import ControlState
+from rosreestr_backend import make_backend
+from rosreestr_stub import DEFAULT_PORT, start_server
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STUB_SCRIPT = os.path.join(BASE_DIR, "rosreestr_stub.py")
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(q / 100.0 * (len(values) - 1)))))
+    return values[k]
+
+
+def attempt_latencies(events):
+    """Длительность каждой попытки: от start до исхода по тому же номеру."""
+    started = {}
+    out = []
+    for e in events:
+        cad, ev = e.get("cad"), e.get("event")
+        if ev == "start":
+            started[cad] = datetime.fromisoformat(e["ts"])
+        elif ev in ("success", "error", "retry") and cad in started:
+            out.append((datetime.fromisoformat(e["ts"]) - started.pop(cad)).total_seconds() * 1000)
+    return out
+
+
+def run_scenario(backend, workers, cads, args):
+    """Настраивает модуль загрузчика на временный каталог и гоняет проходы."""
+    work = tempfile.mkdtemp(prefix="bench_dl_")
+    try:
+        dl.OUTPUT_DIR = os.path.join(work, "output")
+        dl.TEMP_DIR = os.path.join(work, "temp")
+        os.makedirs(dl.OUTPUT_DIR, exist_ok=True)
+        os.makedirs(dl.TEMP_DIR, exist_ok=True)
+        dl.MAX_WORKERS = workers
+        dl.control = ControlState(workers=workers)
+        dl.backend = backend
+        dl.limiter = dl.RateLimiter(args.delay, dynamic=args.dynamic)
+        dl.cache = DownloadCache(os.path.join(work, "cache.json"))
+        dl.journal = Journal(os.path.join(work, "journal.jsonl"))
+        dl.text_log = Journal(os.path.join(work, "log.txt"), fsync=False)
+        dl.telemetry.clear()
+
+        retry = list(cads)
+        passes = 0
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            while retry and passes < args.cycles:
+                _, _, retry = dl.process_pass(retry)
+                passes += 1
+        elapsed = time.perf_counter() - t0
+
+        events = list(dl.telemetry)
+        done = sum(1 for e in events if e["event"] == "success") + \
+            sum(1 for e in events if e["event"] == "error")
+        lat = attempt_latencies(events)
+        return {
+            "elapsed": elapsed,
+            "rate": done / elapsed if elapsed else 0.0,
+            "done": done,
+            "left": len(retry),
+            "retries": sum(1 for e in events if e["event"] == "retry"),
+            "passes": passes,
+            "p50": percentile(lat, 50),
+            "p95": percentile(lat, 95),
+            "p99": percentile(lat, 99)
+        }
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Бенчмарк загрузчика на локальной заглушке росреестра")
+    p.add_argument("--fixtures", default=os.path.join(BASE_DIR, "output"),
+                   help="каталог с записанными .geojson (если пусто — синтетический участок)")
+    p.add_argument("--count", type=int, default=0, help="число участков (0 — по числу фикстур)")
+    p.add_argument("--port", type=int, default=DEFAULT_PORT)
+    p.add_argument("--latency", type=float, default=80.0, help="задержка ответа, мс")
+    p.add_argument("--jitter", type=float, default=30.0, help="разброс задержки ±, мс")
+    p.add_argument("--error-rate", type=float, default=0.05, help="доля ответов 429/503")
+    p.add_argument("--not-found-rate", type=float, default=0.02, help="доля номеров 'не найдено'")
+    p.add_argument("--max-rps", type=int, default=0, help="порог троттлинга заглушки, запр/с")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    p.add_argument("--backends", nargs="+", default=["subprocess", "inprocess"],
+                   choices=["subprocess", "inprocess"])
+    p.add_argument("--delay", type=float, default=0.0, help="интервал лимитера, с")
+    p.add_argument("--dynamic", action="store_true", help="AIMD-лимитер (dynamic_backoff)")
+    p.add_argument("--cycles", type=int, default=dl.RETRY_CYCLES, help="максимум проходов")
+    args = p.parse_args()
+
+    server, state = start_server(
+        args.fixtures, port=args.port, latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, not_found_rate=args.not_found_rate,
+        max_rps=args.max_rps, seed=args.seed
+    )
+    url = f"http://127.0.0.1:{args.port}"
+
+    cads = sorted(state.fixtures)
+    count = args.count or len(cads) or 100
+    cads = (cads + [f"99:99:0000000:{i}" for i in range(count)])[:count]
+
+    print(f"🧪 Заглушка: {url}, фикстур {len(state.fixtures)}, участков {count}, "
+          f"задержка {args.latency}±{args.jitter} мс, отказы {args.error_rate:.0%}")
+    print(f"{'backend':<11} {'workers':>7} {'parcels/s':>10} {'retries':>8} {'passes':>6} "
+          f"{'left':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'time s':>8}")
+
+    try:
+        for name in args.backends:
+            for workers in args.workers:
+                if name == "subprocess":
+                    backend = make_backend(
+                        "subprocess",
+                        command=[sys.executable, STUB_SCRIPT, "cli", "--server", url]
+                    )
+                else:
+                    backend = make_backend("inprocess", pool_size=workers, api_root=url)
+                    if backend.name != "inprocess":
+                        print("⚠️ rosreestr2coord не установлен — inprocess пропущен")
+                        break
+                state.reset()
+                r = run_scenario(backend, workers, cads, args)
+                print(f"{backend.name:<11} {workers:>7} {r['rate']:>10.1f} {r['retries']:>8} "
+                      f"{r['passes']:>6} {r['left']:>5} {r['p50']:>8.1f} {r['p95']:>8.1f} "
+                      f"{r['p99']:>8.1f} {r['elapsed']:>8.2f}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
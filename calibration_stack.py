@@ -0,0 +1,64 @@
+# FILENAME: calibration_stack.py
+
+#
+# Стек калибровок проекта (polygon.manifest.json): просмотр, отмена и повтор.
+# Рабочий файл не переписывается — меняется только манифест, затем
+# polygon.json выгружается заново (если store.export_json).
+#
+#   python calibration_stack.py          — список калибровок
+#   python calibration_stack.py undo     — отменить последнюю
+#   python calibration_stack.py redo     — вернуть отменённую
+
+import argparse
+import os
+
+from polygon_manifest import load_manifest, redo_calibration, undo_calibration
+from polygon_store import export_working
+
+
+def describe(tr):
+    if "matrix" in tr:
+        kind = "аффинная" if tr["matrix"][2] == [0.0, 0.0, 1.0] else "проективная"
+        return f"{tr['source']}: {kind} матрица " + str([[round(v, 6) for v in row] for row in tr["matrix"]])
+    return (f"{tr['source']}: масштаб {tr['scale']:.6f}, поворот {tr['rotation_deg']:.4f}°, "
+            f"сдвиг ({tr['offset_x']:.3f}, {tr['offset_y']:.3f})")
+
+
+def show(manifest):
+    calibration = manifest["calibration"]
+    if not calibration:
+        print("📭 Калибровок нет.")
+    for i, tr in enumerate(calibration):
+        mark = "  (вписана в координаты)" if i < manifest["baked"] else ""
+        print(f"{i + 1:3}. {describe(tr)}{mark}")
+    if manifest["redo"]:
+        print(f"↪️ Можно вернуть: {len(manifest['redo'])}")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Стек калибровок polygon.json")
+    p.add_argument("action", nargs="?", choices=["list", "undo", "redo"], default="list")
+    args = p.parse_args()
+
+    polygon_path = os.path.join(os.getcwd(), "polygon.json")
+    manifest = load_manifest(polygon_path)
+    if manifest is None:
+        print("❌ Нет polygon.manifest.json — сначала Stage 1.")
+        return
+
+    if args.action == "list":
+        show(manifest)
+        return
+
+    step = undo_calibration if args.action == "undo" else redo_calibration
+    tr = step(polygon_path)
+    if tr is None:
+        print("⚠️ Нечего " + ("отменять." if args.action == "undo" else "возвращать."))
+        return
+    print(("↩️ Отменена: " if args.action == "undo" else "↪️ Возвращена: ") + describe(tr))
+    if export_working(polygon_path):
+        print("💾 polygon.json выгружен заново.")
+
+
+if __name__ == "__main__":
+    main()
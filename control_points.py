@@ -0,0 +1,183 @@
+# FILENAME: control_points.py
+
+#
+# Калибровка по N контрольным точкам: пары «исходная → целевая» в осях
+# [x, y] ParcelSet (локальные метры Stage 1 с уже применёнными калибровками).
+#
+# Модели (solve → матрица 3×3 для affine):
+#   similarity  — масштаб, поворот, сдвиг (от 2 пар; без поворота — масштаб
+#                 и сдвиг), линейный МНК;
+#   affine      — полная аффинная (от 3 пар), линейный МНК;
+#   projective  — проективная (от 4 пар), DLT: SVD нормированной системы.
+#
+# residuals — отклонение каждой точки после трансформации, rms — общее.
+# Больше пар, чем минимум, — ошибки ввода усредняются, а большой остаток
+# сразу показывает неверно выбранную пару.
+#
+# CSV (load_control_points), с заголовком:
+#   src,dst                      — имена квадратов сетки Stage 2 (aa03);
+#   src_x,src_y,dst_x,dst_y      — координаты.
+
+import csv
+import math
+
+import numpy as np
+
+import affine
+
+MODELS = ("similarity", "affine", "projective")
+MIN_POINTS = {"similarity": 2, "affine": 3, "projective": 4}
+# сингулярное число меньше этой доли наибольшего — система вырождена
+SINGULAR_RTOL = 1e-10
+
+
+def _as_points(src, dst):
+    src = np.asarray(src, dtype=np.float64).reshape(-1, 2)
+    dst = np.asarray(dst, dtype=np.float64).reshape(-1, 2)
+    if len(src) != len(dst):
+        raise ValueError("разное число исходных и целевых точек")
+    return src, dst
+
+
+def _lstsq(a, b, what):
+    """np.linalg.lstsq с проверкой ранга: ValueError, если решение не единственно."""
+    coef, _, rank, sv = np.linalg.lstsq(a, b, rcond=None)
+    if rank < a.shape[1] or sv[-1] <= SINGULAR_RTOL * sv[0]:
+        raise ValueError(what)
+    return coef
+
+
+def _check_not_degenerate(m, what):
+    """Матрица не сжимает плоскость в линию или точку."""
+    if abs(np.linalg.det(m[:2, :2])) <= SINGULAR_RTOL * max(np.abs(m[:2, :2]).max(), 1.0) ** 2:
+        raise ValueError(what)
+
+
+def solve_similarity(src, dst, allow_rotation=True):
+    src, dst = _as_points(src, dst)
+    n = len(src)
+    x, y = src[:, 0], src[:, 1]
+    one, zero = np.ones(n), np.zeros(n)
+    if allow_rotation:
+        # x' = a·x − b·y + tx,  y' = b·x + a·y + ty
+        a = np.vstack((np.column_stack((x, -y, one, zero)),
+                       np.column_stack((y, x, zero, one))))
+        sa, sb, tx, ty = _lstsq(a, np.concatenate((dst[:, 0], dst[:, 1])), "исходные точки совпадают")
+    else:
+        a = np.vstack((np.column_stack((x, one, zero)),
+                       np.column_stack((y, zero, one))))
+        sa, tx, ty = _lstsq(a, np.concatenate((dst[:, 0], dst[:, 1])), "исходные точки совпадают")
+        sb = 0.0
+    m = np.array([[sa, -sb, tx],
+                  [sb, sa, ty],
+                  [0.0, 0.0, 1.0]])
+    _check_not_degenerate(m, "целевые точки совпадают (масштаб 0)")
+    return m
+
+
+def solve_affine(src, dst):
+    src, dst = _as_points(src, dst)
+    a = np.column_stack((src, np.ones(len(src))))
+    coef = _lstsq(a, dst, "исходные точки совпадают или лежат на одной прямой")
+    m = np.vstack((coef.T, [0.0, 0.0, 1.0]))
+    _check_not_degenerate(m, "целевые точки совпадают или лежат на одной прямой")
+    return m
+
+
+def _normalizer(points):
+    """Сдвиг в центр масс и масштаб до среднего расстояния √2 (устойчивость DLT)."""
+    c = points.mean(axis=0)
+    d = np.sqrt(((points - c) ** 2).sum(axis=1)).mean()
+    s = math.sqrt(2) / d if d > 0 else 1.0
+    return np.array([[s, 0.0, -s * c[0]],
+                     [0.0, s, -s * c[1]],
+                     [0.0, 0.0, 1.0]])
+
+
+def solve_projective(src, dst):
+    src, dst = _as_points(src, dst)
+    ts, td = _normalizer(src), _normalizer(dst)
+    ps = src @ ts[:2, :2].T + ts[:2, 2]
+    pd = dst @ td[:2, :2].T + td[:2, 2]
+    rows = []
+    for (x, y), (u, v) in zip(ps, pd):
+        rows.append([-x, -y, -1.0, 0.0, 0.0, 0.0, u * x, u * y, u])
+        rows.append([0.0, 0.0, 0.0, -x, -y, -1.0, v * x, v * y, v])
+    for points, what in ((ps, "исходные"), (pd, "целевые")):
+        sv = np.linalg.svd(np.column_stack((points, np.ones(len(points)))), compute_uv=False)
+        if sv[-1] <= SINGULAR_RTOL * sv[0]:
+            raise ValueError(f"{what} точки совпадают или лежат на одной прямой")
+    _, sv, vt = np.linalg.svd(np.array(rows))
+    # у единственного решения ядро одномерно: ранг системы — 8
+    if (sv > SINGULAR_RTOL * sv[0]).sum() < 8:
+        raise ValueError("проективная модель не определяется этими точками (три на одной прямой?)")
+    h = np.linalg.inv(td) @ vt[-1].reshape(3, 3) @ ts
+    if abs(h[2, 2]) <= SINGULAR_RTOL * np.abs(h).max():
+        raise ValueError("проективная модель вырождена (h33 ≈ 0)")
+    h = h / h[2, 2]
+    _check_not_degenerate(h, "проективная модель вырождена")
+    return h
+
+
+def solve(src, dst, model="similarity", allow_rotation=True):
+    """Матрица 3×3 модели model по парам точек (N ≥ MIN_POINTS[model])."""
+    if model not in MODELS:
+        raise ValueError(f"неизвестная модель: {model}")
+    if len(src) < MIN_POINTS[model]:
+        raise ValueError(f"для модели {model} нужно не меньше {MIN_POINTS[model]} пар")
+    if model == "similarity":
+        return solve_similarity(src, dst, allow_rotation)
+    if model == "affine":
+        return solve_affine(src, dst)
+    return solve_projective(src, dst)
+
+
+def residuals(m, src, dst):
+    """Расстояние от трансформированной исходной точки до целевой, (N,)."""
+    src, dst = _as_points(src, dst)
+    return np.hypot(*(affine.apply(m, src) - dst).T)
+
+
+def rms(res):
+    return float(np.sqrt(np.mean(np.square(res)))) if len(res) else 0.0
+
+
+def similarity_params(m):
+    """Матрица подобия → {"scale", "rotation_deg", "offset_x", "offset_y"}."""
+    return {
+        "scale": float(math.hypot(m[0, 0], m[1, 0])),
+        "rotation_deg": float(math.degrees(math.atan2(m[1, 0], m[0, 0]))),
+        "offset_x": float(m[0, 2]),
+        "offset_y": float(m[1, 2]),
+    }
+
+
+def load_control_points(path):
+    """
+    Пары из CSV: [(src, dst)], где точка — имя квадрата (str) или (x, y).
+    """
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        fields = set(reader.fieldnames or [])
+        if {"src_x", "src_y", "dst_x", "dst_y"} <= fields:
+            keys = ("src_x", "src_y", "dst_x", "dst_y")
+        elif {"src", "dst"} <= fields:
+            keys = ("src", "dst")
+        else:
+            raise ValueError(f"{path}: нужны столбцы src,dst или src_x,src_y,dst_x,dst_y")
+        pairs = []
+        for r in reader:
+            values = [(r.get(k) or "").strip() for k in keys]
+            if not any(values):
+                continue
+            if not all(values):
+                raise ValueError(f"{path}, строка {reader.line_num}: пустая ячейка")
+            if len(keys) == 2:
+                pairs.append((values[0], values[1]))
+                continue
+            try:
+                x0, y0, x1, y1 = map(float, values)
+            except ValueError:
+                raise ValueError(f"{path}, строка {reader.line_num}: не число") from None
+            pairs.append(((x0, y0), (x1, y1)))
+    return pairs
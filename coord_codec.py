@@ -0,0 +1,60 @@
+# FILENAME: coord_codec.py
+
+#
+# Компактная запись координат для веба: квантование + дельты по кольцу.
+#
+# Каждая координата умножается на scale и округляется до целого (scale=100 —
+# сантиметры для метров polygon.json, scale=1000 — тысячные градуса для
+# ath/atv krpano). Кольцо записывается плоским списком целых:
+#   [x0, y0, x1 - x0, y1 - y0, x2 - x1, y2 - y1, ...]
+# Соседние вершины близки, поэтому дельты — короткие числа (3–5 знаков вместо
+# ~12 у "3358.871234"), и gzip/brotli сжимают их ещё лучше.
+#
+# Декодирование — накопленная сумма, делённая на scale: decode_ring здесь и
+# decodeRing в coord_decoder.js дают одно и то же.
+#
+# В заголовке файла: "encoding": {"type": "delta", "scale": 100}.
+
+import numpy as np
+
+ENCODING = "delta"
+
+
+def encoding_header(scale):
+    return {"type": ENCODING, "scale": scale}
+
+
+def encode_ring(ring, scale):
+    """Кольцо (N, 2) → плоский список целых: первая точка и дельты."""
+    q = np.rint(np.asarray(ring, dtype=np.float64).reshape(-1, 2) * scale).astype(np.int64)
+    q[1:] = np.diff(q, axis=0)
+    return q.ravel().tolist()
+
+
+def decode_ring(flat, scale):
+    """Обратно: плоский список → список пар [x, y]."""
+    q = np.cumsum(np.asarray(flat, dtype=np.int64).reshape(-1, 2), axis=0)
+    return (q / scale).tolist()
+
+
+def encode_item(item, scale):
+    """Участок polygon.json с закодированными кольцами (остальные поля — как есть)."""
+    item = dict(item)
+    item["coordinates"] = [encode_ring(ring, scale) for ring in item["coordinates"]]
+    return item
+
+
+def decode_item(item, scale):
+    """Обратно к encode_item: кольца — списки пар [x, y]."""
+    item = dict(item)
+    item["coordinates"] = [decode_ring(ring, scale) for ring in item["coordinates"]]
+    return item
+
+
+def decode_items(items, encoding):
+    """Участки файла с заголовком encoding (или без него — как есть)."""
+    if not encoding:
+        return items
+    if encoding.get("type") != ENCODING:
+        raise ValueError(f"неизвестное кодирование координат: {encoding.get('type')}")
+    return [decode_item(item, encoding["scale"]) for item in items]
@@ -0,0 +1,46 @@
+// FILENAME: coord_decoder.js
+//
+// Декодер координат, записанных coord_codec.py (квантование + дельты).
+// В файле: "encoding": {"type": "delta", "scale": S}; кольцо — плоский
+// список целых [x0, y0, dx1, dy1, ...].
+//
+//   decodePolygonPayload(json)          — polygon.json → обычные [[x, y], ...]
+//   addEncodedHotspots(krpano, json)    — hotspots_grid.json → хотспоты krpano
+
+function decodeRing(flat, scale) {
+  var out = new Array(flat.length / 2), x = 0, y = 0;
+  for (var i = 0, j = 0; i < flat.length; i += 2, j++) {
+    x += flat[i];
+    y += flat[i + 1];
+    out[j] = [x / scale, y / scale];
+  }
+  return out;
+}
+
+function decodePolygonPayload(payload) {
+  if (!payload.encoding) return payload;
+  var scale = payload.encoding.scale;
+  for (var i = 0; i < payload.data.length; i++) {
+    var item = payload.data[i];
+    item.coordinates = item.coordinates.map(function (ring) { return decodeRing(ring, scale); });
+  }
+  delete payload.encoding;
+  return payload;
+}
+
+function addEncodedHotspots(krpano, payload) {
+  var scale = payload.encoding.scale;
+  payload.hotspots.forEach(function (h) {
+    var hs = krpano.addhotspot(h.name);
+    hs.loadstyle(h.style);
+    decodeRing(h.points, scale).forEach(function (p, k) {
+      var pt = hs.point.createarrayitem(k);
+      pt.ath = p[0];
+      pt.atv = p[1];
+    });
+  });
+}
+
+if (typeof module !== "undefined") {
+  module.exports = { decodeRing: decodeRing, decodePolygonPayload: decodePolygonPayload, addEncodedHotspots: addEncodedHotspots };
+}
@@ -0,0 +1,108 @@
+# FILENAME: download_cache.py
+
+#
+# Индекс уже скачанных участков для get_geojson_by_list.py.
+#
+# На каждый кадастровый номер хранится: имя файла в output/, sha256 его
+# содержимого, размер и время загрузки. Участок считается свежим, если файл
+# на месте, хэш совпадает, а возраст записи меньше max_age (в часах;
+# None — без ограничения, 0 — всегда перекачивать).
+#
+# Файлы, скачанные до появления индекса, принимаются, если это валидный
+# GeoJSON с координатами (Polygon или MultiPolygon — как их разбирает
+# geo_normalize, см. feature_ring); время загрузки берётся из mtime файла.
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _ring_area(ring):
+    xs = [float(pt[0]) for pt in ring]
+    ys = [float(pt[1]) for pt in ring]
+    return abs(sum(x0 * y1 - x1 * y0 for x0, y0, x1, y1 in zip(xs, ys, xs[1:] + xs[:1], ys[1:] + ys[:1])))
+
+
+def feature_ring(feature):
+    """
+    Внешнее кольцо участка: у Polygon — coordinates[0], у MultiPolygon —
+    внешнее кольцо самой большой по площади части.
+    """
+    geometry = feature.get("geometry") or {}
+    coords = geometry.get("coordinates") or [[]]
+    if geometry.get("type") == "MultiPolygon":
+        return max((part[0] for part in coords if part), key=_ring_area, default=[])
+    return coords[0]
+
+
+def is_valid_geojson(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        feature = data.get("features", [data])[0]
+        return len(feature_ring(feature)) >= 3
+    except Exception:
+        return False
+
+
+class DownloadCache:
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not os.path.isfile(self.index_path):
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            print(f"⚠️ Индекс кэша повреждён, начинаю заново: {self.index_path}")
+            self.entries = {}
+
+    def save(self):
+        tmp = self.index_path + ".tmp"
+        with self.lock:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.index_path)
+
+    def record(self, cad, path, fetched_at=None):
+        entry = {
+            "file": os.path.basename(path),
+            "sha256": file_sha256(path),
+            "size": os.path.getsize(path),
+            "fetched_at": fetched_at if fetched_at is not None else time.time()
+        }
+        with self.lock:
+            self.entries[cad] = entry
+        return entry
+
+    def is_fresh(self, cad, path, max_age=None):
+        if max_age == 0 or not os.path.isfile(path):
+            return False
+
+        entry = self.entries.get(cad)
+        if entry is None:
+            # файл из прошлых запусков без записи в индексе
+            if not is_valid_geojson(path):
+                return False
+            entry = self.record(cad, path, fetched_at=os.path.getmtime(path))
+        elif entry.get("size") != os.path.getsize(path) or entry.get("sha256") != file_sha256(path):
+            return False
+
+        if max_age is None:
+            return True
+        return time.time() - entry["fetched_at"] < max_age * 3600
@@ -0,0 +1,90 @@
+# FILENAME: download_journal.py
+
+#
+# Буферизованный append-only журнал для get_geojson_by_list.py.
+#
+# Строки копятся в памяти и сбрасываются на диск пачкой — каждые
+# batch_size событий или не реже, чем раз в flush_interval секунд
+# (проверяется при записи), плюс явный flush() в конце прохода и при выходе.
+# Файл открывается один раз, а не на каждое событие. При жёстком падении
+# теряется не больше одной пачки; недописанная последняя строка JSONL
+# при чтении пропускается.
+
+import json
+import os
+import threading
+import time
+
+
+class Journal:
+    def __init__(self, path, batch_size=20, flush_interval=2.0, fsync=True):
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.buffer = []
+        self.last_flush = time.monotonic()
+        self.f = None
+        self.lock = threading.Lock()
+
+    def _flush_locked(self):
+        if self.buffer:
+            if self.f is None:
+                self.f = open(self.path, "a", encoding="utf-8")
+            self.f.write("".join(self.buffer))
+            self.f.flush()
+            if self.fsync:
+                os.fsync(self.f.fileno())
+            self.buffer = []
+        self.last_flush = time.monotonic()
+
+    def write_line(self, line):
+        with self.lock:
+            self.buffer.append(line + "\n")
+            if (len(self.buffer) >= self.batch_size
+                    or time.monotonic() - self.last_flush >= self.flush_interval):
+                self._flush_locked()
+
+    def write_event(self, entry):
+        self.write_line(json.dumps(entry, ensure_ascii=False))
+
+    def flush(self):
+        with self.lock:
+            self._flush_locked()
+
+    def truncate(self):
+        """Начинает журнал заново (новый запуск, а не продолжение)."""
+        with self.lock:
+            self.buffer = []
+            if self.f is not None:
+                self.f.close()
+            self.f = open(self.path, "w", encoding="utf-8")
+
+    def close(self):
+        with self.lock:
+            self._flush_locked()
+            if self.f is not None:
+                self.f.close()
+                self.f = None
+
+
+def read_events(path):
+    events = []
+    if not os.path.isfile(path):
+        return events
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                # оборванная при падении строка
+                continue
+    return events
+
+
+def is_unfinished(events):
+    """Журнал прерванного запуска: есть события, но нет run_end."""
+    return bool(events) and not any(e.get("event") == "run_end" for e in events)
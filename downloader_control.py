@@ -0,0 +1,180 @@
+# FILENAME: downloader_control.py
+
+#
+# Канал управления работающим загрузчиком (get_geojson_by_list.py).
+#
+# Загрузчик слушает TCP-порт на 127.0.0.1 (downloader.control_port):
+# loopback-сокет одинаково работает на Windows, где запускается GUI, и на
+# Linux. Протокол — одна JSON-строка запроса, одна JSON-строка ответа:
+#
+#   {"cmd": "pause"}                     — не начинать новые запросы
+#   {"cmd": "resume"}                    — продолжить
+#   {"cmd": "stop"}                      — дождаться текущих запросов, отчёт, выход
+#   {"cmd": "set", "delay": 0.5}         — интервал между запросами, с
+#   {"cmd": "set", "workers": 2}         — число одновременных запросов
+#   {"cmd": "status"}                    — состояние
+#
+# Из консоли:
+#   python downloader_control.py pause
+#   python downloader_control.py set --delay 1.5 --workers 2
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+
+DEFAULT_PORT = 47615
+
+
+class _ControlTCPServer(socketserver.ThreadingTCPServer):
+    # на Windows SO_REUSEADDR позволил бы второму загрузчику занять тот же порт
+    allow_reuse_address = os.name != "nt"
+    daemon_threads = True
+
+
+class ControlState:
+    def __init__(self, workers=1, max_workers=64):
+        self.workers = workers
+        self.max_workers = max_workers
+        self.stopping = False
+        self.running = threading.Event()
+        self.running.set()
+        self.lock = threading.Lock()
+
+    @property
+    def paused(self):
+        return not self.running.is_set()
+
+    def pause(self):
+        self.running.clear()
+
+    def resume(self):
+        self.running.set()
+
+    def stop(self):
+        with self.lock:
+            self.stopping = True
+        # разбудить цикл, если он стоит на паузе
+        self.running.set()
+
+    def set_workers(self, n):
+        with self.lock:
+            self.workers = max(1, min(self.max_workers, int(n)))
+        return self.workers
+
+    def wait_while_paused(self):
+        self.running.wait()
+
+
+class ControlServer:
+    """
+    Фоновый сервер команд. on_set_delay(delay) вызывается для команды
+    set --delay, on_set_workers(n) — для set --workers (с уже ограниченным
+    числом), status_fn() дополняет ответ на status.
+    """
+
+    def __init__(self, state, port=DEFAULT_PORT, on_set_delay=None, status_fn=None, on_set_workers=None):
+        self.state = state
+        self.on_set_delay = on_set_delay
+        self.on_set_workers = on_set_workers
+        self.status_fn = status_fn
+
+        control = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                line = self.rfile.readline()
+                try:
+                    reply = control.execute(json.loads(line.decode("utf-8")))
+                except Exception as e:
+                    reply = {"ok": False, "error": str(e)}
+                self.wfile.write((json.dumps(reply, ensure_ascii=False) + "\n").encode("utf-8"))
+
+        self.server = _ControlTCPServer(("127.0.0.1", port), Handler)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def status(self):
+        st = {
+            "paused": self.state.paused,
+            "stopping": self.state.stopping,
+            "workers": self.state.workers
+        }
+        if self.status_fn:
+            st.update(self.status_fn())
+        return st
+
+    def execute(self, req):
+        cmd = req.get("cmd")
+        if cmd == "pause":
+            self.state.pause()
+            print("⏸ Пауза: новые запросы не отправляются")
+        elif cmd == "resume":
+            self.state.resume()
+            print("▶ Продолжаем загрузку")
+        elif cmd == "stop":
+            self.state.stop()
+            print("⛔ Получена команда stop — дожидаюсь текущих запросов...")
+        elif cmd == "set":
+            if req.get("workers") is not None:
+                n = self.state.set_workers(req["workers"])
+                if self.on_set_workers:
+                    self.on_set_workers(n)
+                print(f"🔧 Потоков: {n}")
+            if req.get("delay") is not None:
+                delay = float(req["delay"])
+                if delay < 0:
+                    raise ValueError("delay < 0")
+                if self.on_set_delay:
+                    self.on_set_delay(delay)
+                print(f"🔧 Интервал между запросами: {delay} с")
+        elif cmd != "status":
+            raise ValueError(f"unknown command: {cmd}")
+        return {"ok": True, "status": self.status()}
+
+
+def send_command(cmd, port=DEFAULT_PORT, timeout=3.0, **params):
+    """Отправляет команду загрузчику. ConnectionError, если он не запущен."""
+    req = {"cmd": cmd}
+    req.update({k: v for k, v in params.items() if v is not None})
+    with socket.create_connection(("127.0.0.1", port), timeout=timeout) as sock:
+        sock.sendall((json.dumps(req) + "\n").encode("utf-8"))
+        data = sock.makefile("rb").readline()
+    if not data:
+        raise ConnectionError("пустой ответ")
+    return json.loads(data.decode("utf-8"))
+
+
+def main():
+    p = argparse.ArgumentParser(description="Управление запущенным get_geojson_by_list.py")
+    p.add_argument("cmd", choices=["pause", "resume", "stop", "set", "status"])
+    p.add_argument("--delay", type=float, help="интервал между запросами, с (для set)")
+    p.add_argument("--workers", type=int, help="число одновременных запросов (для set)")
+    p.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = p.parse_args()
+
+    try:
+        reply = send_command(args.cmd, port=args.port, delay=args.delay, workers=args.workers)
+    except OSError as e:
+        print(f"❌ Загрузчик не отвечает на порту {args.port}: {e}")
+        sys.exit(1)
+
+    if not reply.get("ok"):
+        print(f"❌ {reply.get('error')}")
+        sys.exit(1)
+    print(json.dumps(reply["status"], ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# FILENAME: export_polygon.py
+
+#
+# Экспорт рабочего файла пайплайна (polygon.parcels) в polygon.json формата
+# Yandex карты. Stage 1 / Stage 2 / ручная подстройка делают это сами, если
+# в config.json store.export_json = true; иначе — этим скриптом.
+#
+# Настройки по умолчанию — секция export в config.json (см. polygon_export);
+# ключи командной строки их перекрывают.
+#
+# --tiles grid|quadtree|quarter — вместо одного polygon.json плитки и
+# index.json в export.tiles.dir (см. polygon_tiles).
+
+import argparse
+import os
+
+from polygon_export import export_json, export_options, tiles_options
+from polygon_store import load_parcels, mark_exported, read_header, store_path, sync_edits
+from polygon_tiles import TILE_MODES, export_tiles
+
+
+def main():
+    base = os.getcwd()
+    p = argparse.ArgumentParser(description="Экспорт polygon.parcels → polygon.json")
+    p.add_argument("--input", "-i", default=store_path(os.path.join(base, "polygon.json")),
+                   help="рабочий файл (polygon.parcels)")
+    p.add_argument("--output", "-o", default=os.path.join(base, "polygon.json"), help="polygon.json")
+    p.add_argument("--minify", action="store_true", default=None, help="без отступов и пробелов")
+    p.add_argument("--pretty", dest="minify", action="store_false", default=None, help="с отступами (indent=2)")
+    p.add_argument("--precision", type=int, help="знаков после запятой в координатах")
+    p.add_argument("--compress", nargs="*", choices=["gz", "br"], help="сжатые копии рядом (без значений — не писать)")
+    p.add_argument("--quantize", type=int, help="делений на метр для кодирования дельтами (100 — см; 0 — без)")
+    p.add_argument("--hit-index", action="store_true", default=None, help="индекс поиска участка под курсором")
+    p.add_argument("--no-hit-index", dest="hit_index", action="store_false", default=None,
+                   help="без индекса поиска (прежний удаляется)")
+    p.add_argument("--tiles", choices=TILE_MODES, help="разбить на плитки для ленивой загрузки")
+    p.add_argument("--tiles-dir", help="папка плиток (export.tiles.dir)")
+    p.add_argument("--tile-size", type=float, help="сторона плитки grid, м (export.tiles.tile_size)")
+    p.add_argument("--max-per-tile", type=int, help="участков в плитке quadtree (export.tiles.max_per_tile)")
+    args = p.parse_args()
+
+    options = export_options(base)
+    tiles = tiles_options(base)
+    for key in ("minify", "precision", "compress", "quantize", "hit_index"):
+        if getattr(args, key) is not None:
+            options[key] = getattr(args, key)
+
+    if not os.path.isfile(args.input):
+        print(f"❌ Не найден {args.input} — сначала Stage 1.")
+        return
+
+    # polygon.json проекта: ручные правки в нём сначала переносятся в рабочий файл
+    own = os.path.abspath(store_path(args.output)) == os.path.abspath(args.input)
+    if own:
+        sync_edits(args.output)
+
+    # со стеком калибровок из манифеста
+    parcels = load_parcels(args.input)
+    header = read_header(args.input)
+
+    if args.tiles:
+        out_dir = os.path.join(base, args.tiles_dir or tiles["dir"])
+        index = export_tiles(
+            parcels, out_dir, header["swap_axes"], mode=args.tiles,
+            tile_size=args.tile_size or tiles["tile_size"],
+            max_per_tile=args.max_per_tile or tiles["max_per_tile"], **options
+        )
+        print(f"🧩 Плиток: {len(index['tiles'])}, участков: {index['count']} → {out_dir}")
+        return
+
+    written = export_json(parcels, args.output, header["swap_axes"], **options)
+    if own:
+        mark_exported(args.output)
+    extra = "".join(f" (+.{ext})" for ext in written)
+    print(f"📤 Участков: {len(parcels)} → {args.output}{extra}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+# FILENAME: geo_normalize.py
+
+#
+# Разбор и нормализация скачанных участков: GeoJSON (EPSG:4326) →
+# кольцо в EPSG:3857 без слишком близких точек + метаданные участка.
+#
+# Используется Stage 1, get_interactive_debug_tool.py и потоковым режимом
+# загрузчика (downloader.pipeline): загрузчик нормализует каждый готовый
+# файл в отдельном процессе, пока остальные запросы ждут сеть. Результаты
+# лежат в общем дисковом кэше (GeometryCache) с ключом по хэшу содержимого,
+# так что повторные сборки и просмотры не разбирают и не перепроецируют
+# уже виденные файлы.
+#
+# Перепроекция пакетная: вершины всех колец собираются в плоские массивы
+# NumPy со смещениями колец и переводятся одним вызовом pyproj, после чего
+# кольца нарезаются обратно по смещениям.
+#
+# ingest_files раскладывает список файлов на куски по процессам
+# (ProcessPoolExecutor); каждый кусок разбирается и перепроецируется
+# целиком, результаты склеиваются в исходном порядке файлов.
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from pyproj import Transformer
+
+from download_cache import feature_ring, file_sha256
+from geo_simplify import distance_filter
+
+MIN_DISTANCE_BETWEEN_POINTS = 2.0
+TARGET_CRS = "EPSG:3857"
+DEFAULT_CACHE_BYTES = 256 * 2**20
+# версия записей кэша: растёт, когда меняется результат очистки
+# (2 — не меньше трёх вершин после фильтра по расстоянию)
+CACHE_VERSION = 2
+
+transformer = Transformer.from_crs("EPSG:4326", TARGET_CRS, always_xy=True)
+
+
+def read_feature(filename):
+    with open(filename, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data.get("features", [data])[0]
+
+
+def ring_offsets(rings):
+    """Смещения колец в плоском массиве: кольцо i — [offsets[i]:offsets[i+1]]."""
+    offsets = np.zeros(len(rings) + 1, dtype=np.int64)
+    np.cumsum([len(r) for r in rings], out=offsets[1:])
+    return offsets
+
+
+def ring_array(ring):
+    """
+    Кольцо [[lon, lat(, z)], ...] → массив (N, 2); ValueError, если это не
+    кольцо (лишний уровень вложенности, точки разной длины и т.п.).
+    """
+    try:
+        arr = np.array([pt[:2] for pt in ring], dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValueError("кольцо неправильной формы") from None
+    if not len(arr):
+        return np.empty((0, 2))
+    if arr.ndim != 2 or arr.shape[1] != 2:
+        raise ValueError(f"кольцо неправильной формы: {arr.shape}")
+    return arr
+
+
+def reproject_rings(rings):
+    """
+    Список колец (массивы (N, 2) из ring_array, EPSG:4326) → список
+    массивов (N, 2) в EPSG:3857. Один вызов transformer.transform на все
+    вершины.
+    """
+    offsets = ring_offsets(rings)
+    if offsets[-1] == 0:
+        return [np.empty((0, 2)) for _ in rings]
+    flat = np.concatenate(rings)
+    xs, ys = transformer.transform(flat[:, 0], flat[:, 1])
+    xy = np.column_stack((xs, ys))
+    return [xy[offsets[i]:offsets[i + 1]] for i in range(len(rings))]
+
+
+def clean_polygon(coords, tolerance=MIN_DISTANCE_BETWEEN_POINTS):
+    """Точки ближе tolerance к предыдущей оставленной выбрасываются."""
+    return distance_filter(coords, tolerance)
+
+
+def feature_metadata(feature):
+    props = feature.get("properties", {})
+    opts = props.get("options", {})
+    return {
+        "kadastr": props.get("label", ""),
+        "price": "",
+        "size": opts.get("specified_area"),
+        "adres": opts.get("readable_address", "")
+    }
+
+
+def read_parcel(filename):
+    """
+    Только разбор файла: (внешнее кольцо в EPSG:4326 массивом (N, 2),
+    метаданные); у MultiPolygon — кольцо самой большой части. Неправильная геометрия — ValueError здесь, до общей
+    перепроекции куска.
+    """
+    feature = read_feature(filename)
+    return ring_array(feature_ring(feature)), feature_metadata(feature)
+
+
+def normalize_parcels(parcels, tolerance=MIN_DISTANCE_BETWEEN_POINTS):
+    """
+    [(кольцо EPSG:4326, метаданные), ...] → [{"ring", "meta"} | None, ...]
+    в том же порядке; None — если в кольце меньше трёх различных вершин
+    (очистка сама оставляет не меньше трёх).
+    """
+    projected = reproject_rings([ring for ring, _ in parcels])
+    results = []
+    for xy, (_, meta) in zip(projected, parcels):
+        coords = clean_polygon(xy, tolerance)
+        if len(np.unique(coords, axis=0)) < 3:
+            results.append(None)
+        else:
+            results.append({"ring": coords.tolist(), "meta": meta})
+    return results
+
+
+def normalize_file(filename, tolerance=MIN_DISTANCE_BETWEEN_POINTS):
+    """Кольцо в EPSG:3857 и метаданные; None, если различных вершин меньше трёх."""
+    return normalize_parcels([read_parcel(filename)], tolerance)[0]
+
+
+def ingest_chunk(files, tolerance=MIN_DISTANCE_BETWEEN_POINTS):
+    """[(результат | None, текст ошибки | None), ...] в порядке files."""
+    out = [(None, None)] * len(files)
+    parsed = []
+    for i, filename in enumerate(files):
+        try:
+            parsed.append((i, read_parcel(filename)))
+        except Exception as e:
+            out[i] = (None, str(e))
+    for (i, _), rec in zip(parsed, normalize_parcels([p for _, p in parsed], tolerance)):
+        out[i] = (rec, None)
+    return out
+
+
+def ingest_files(files, tolerance=MIN_DISTANCE_BETWEEN_POINTS, workers=None, chunk_size=256):
+    """
+    Разбор и нормализация многих файлов в нескольких процессах.
+    Возвращает то же, что ingest_chunk, для всего списка, в порядке files.
+    Вызывающий скрипт должен быть защищён `if __name__ == "__main__"`
+    (на Windows процессы стартуют через spawn).
+    """
+    chunks = [files[i:i + chunk_size] for i in range(0, len(files), chunk_size)]
+    workers = min(workers or os.cpu_count() or 1, len(chunks))
+
+    if workers <= 1:
+        results = [ingest_chunk(chunk, tolerance) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(ingest_chunk, chunks, [tolerance] * len(chunks)))
+
+    return [r for chunk in results for r in chunk]
+
+
+class GeometryCache:
+    """
+    Общий дисковый кэш нормализованных участков для всех, кто читает
+    output/**/*.geojson (Stage 1, get_interactive_debug_tool.py, потоковый
+    режим загрузчика).
+
+    Ключ — sha256 содержимого исходного файла + целевая проекция + допуск
+    очистки: <cache_dir>/<sha[:2]>/<sha>_<crs>_<допуск>_v<версия>.json. Переименование
+    или повторная загрузка того же участка попадают в ту же запись.
+    Участки, из которых не вышло кольца, тоже кэшируются (ring = None).
+
+    Размер ограничен max_bytes: при чтении запись "трогается" (mtime), evict()
+    удаляет давно не читанные, пока кэш не уложится в лимит. Записи — отдельные
+    файлы, поэтому кэш можно одновременно заполнять из нескольких процессов.
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_CACHE_BYTES, crs=TARGET_CRS):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.crs = crs
+
+    def entry_path(self, sha, tolerance):
+        name = f"{sha}_{self.crs.split(':')[-1]}_{tolerance}_v{CACHE_VERSION}.json"
+        return os.path.join(self.cache_dir, sha[:2], name)
+
+    def get(self, source, tolerance=MIN_DISTANCE_BETWEEN_POINTS, sha=None):
+        """{"ring", "meta", ...} или None при промахе."""
+        try:
+            path = self.entry_path(sha or file_sha256(source), tolerance)
+            with open(path, "r", encoding="utf-8") as f:
+                rec = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return rec
+
+    def put(self, source, result, tolerance=MIN_DISTANCE_BETWEEN_POINTS, sha=None):
+        sha = sha or file_sha256(source)
+        rec = {
+            "sha256": sha,
+            "crs": self.crs,
+            "tolerance": tolerance,
+            "ring": result["ring"] if result else None,
+            "meta": result["meta"] if result else None
+        }
+        path = self.entry_path(sha, tolerance)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(rec, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        return rec
+
+    def evict(self):
+        """Удаляет самые давние записи сверх max_bytes. Возвращает их число."""
+        entries = []
+        total = 0
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+
+def cache_from_config(base_dir):
+    """GeometryCache по config.json проекта (paths.normalized_dir, normalize.cache_max_mb)."""
+    cfg = {}
+    config_path = os.path.join(base_dir, "config.json")
+    if os.path.isfile(config_path):
+        with open(config_path, "r", encoding="utf-8") as f:
+            cfg = json.load(f)
+    cache_dir = cfg.get("paths", {}).get("normalized_dir", "output_normalized")
+    max_mb = cfg.get("normalize", {}).get("cache_max_mb", DEFAULT_CACHE_BYTES // 2**20)
+    return GeometryCache(os.path.join(base_dir, cache_dir), int(max_mb * 2**20))
+
+
+def load_normalized(files, cache, tolerance=MIN_DISTANCE_BETWEEN_POINTS, workers=None):
+    """
+    То же, что ingest_files, но сначала из кэша; промахи разбираются
+    (параллельно) и кладутся в кэш. Возвращает (результаты, число попаданий).
+    """
+    results = [None] * len(files)
+    missed = []     # (индекс, sha)
+    for i, file in enumerate(files):
+        try:
+            sha = file_sha256(file)
+        except OSError as e:
+            results[i] = (None, str(e))
+            continue
+        rec = cache.get(file, tolerance, sha)
+        if rec is not None:
+            results[i] = (rec if rec["ring"] else None, None)
+        else:
+            missed.append((i, sha))
+
+    parsed = ingest_files([files[i] for i, _ in missed], tolerance, workers=workers)
+    for (i, sha), (rec, err) in zip(missed, parsed):
+        results[i] = (rec, err)
+        if err is None:
+            cache.put(files[i], rec, tolerance, sha)
+
+    return results, len(files) - len(missed)
+
+
+def normalize_to_cache(source, cache_dir, tolerance=MIN_DISTANCE_BETWEEN_POINTS):
+    """Задача для пула процессов загрузчика: нормализовать и положить в кэш."""
+    GeometryCache(cache_dir).put(source, normalize_file(source, tolerance), tolerance)
+    return source
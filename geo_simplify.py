@@ -0,0 +1,327 @@
+# FILENAME: geo_simplify.py
+
+#
+# Упрощение колец участков на NumPy.
+#
+#   distance_filter  — прежняя очистка Stage 1: выбрасывает точки ближе
+#                      tolerance к последней оставленной (без цикла по
+#                      точкам: для каждой точки ищется следующая далёкая,
+#                      цепочка от первой точки собирается удвоением);
+#   douglas_peucker  — Дуглас — Пекер: оставляет точки, отклоняющиеся от
+#                      упрощённой линии больше чем на tolerance;
+#   visvalingam      — Висвалингам — Уайатт: выбрасывает вершины с самой
+#                      маленькой "эффективной площадью", пока она < tolerance².
+#
+# Как и перепроекция в geo_normalize, упрощение пакетное: вершины всех колец
+# лежат в одном плоском массиве со смещениями колец, и каждый шаг алгоритма
+# выполняется сразу для всех колец (Дуглас — Пекер — сразу для всех
+# отрезков текущего уровня рекурсии).
+#
+# Кольца — массивы (N, 2) без замыкающей точки (как в кэше геометрии) или с
+# ней: замыкающая точка сохраняется. Упрощение не оставляет меньше трёх
+# различных вершин.
+#
+# simplify_lines — то же для ломаных с закреплёнными концами (дуги общих
+# границ из geo_topology): соседние участки упрощаются одинаково.
+#
+# simplify_lods строит несколько уровней детализации (например, для разных
+# масштабов карты): уровень i — упрощение всех колец с tolerances[i].
+
+import numpy as np
+
+METHODS = ("distance", "douglas_peucker", "visvalingam")
+
+
+def _next_far(xy, tolerance):
+    """
+    nxt[j] — первая точка после j не ближе tolerance к точке j (len(xy) —
+    такой нет). Цикл — по сдвигу k, а не по точкам: на каждом шаге сразу
+    все ещё не найденные j; сдвигов столько, какова самая длинная серия
+    близких точек.
+    """
+    n = len(xy)
+    nxt = np.full(n + 1, n)
+    todo = np.arange(n - 1)
+    k = 1
+    while len(todo):
+        todo = todo[todo + k < n]
+        cand = todo + k
+        far = np.hypot(*(xy[cand] - xy[todo]).T) >= tolerance
+        nxt[todo[far]] = cand[far]
+        todo = todo[~far]
+        k += 1
+    return nxt
+
+
+def _chain(nxt):
+    """0, nxt[0], nxt[nxt[0]], ... до len(nxt) - 1 — удвоением переходов."""
+    end = len(nxt) - 1
+    path = np.zeros(1, dtype=np.int64)
+    jump = nxt
+    while path[-1] < end:
+        path = np.concatenate((path, jump[path]))
+        jump = jump[jump]
+    return path[path < end]
+
+
+def _distinct(xy):
+    return len(np.unique(xy, axis=0))
+
+
+def _three_vertices(xy):
+    """Три различные вершины кольца, охватывающие его как можно шире."""
+    i1 = int(np.argmax(np.hypot(*(xy - xy[0]).T)))
+    d = xy[i1] - xy[0]
+    area = np.abs(d[0] * (xy[:, 1] - xy[0, 1]) - d[1] * (xy[:, 0] - xy[0, 0]))
+    area[[0, i1]] = -1.0
+    i2 = int(np.argmax(area))
+    if area[i2] <= 0:
+        # все точки на одной прямой — любая третья отличная
+        other = np.flatnonzero((xy != xy[0]).any(axis=1) & (xy != xy[i1]).any(axis=1))
+        i2 = int(other[0])
+    return np.sort([0, i1, i2])
+
+
+def distance_filter(xy, tolerance, min_vertices=3):
+    """
+    Точки ближе tolerance к предыдущей оставленной выбрасываются. Если
+    различных вершин остаётся меньше min_vertices (а в исходном кольце их
+    было больше), оставляются три самые далёкие друг от друга вершины.
+    """
+    xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+    if len(xy) < 2:
+        return xy
+    step = np.hypot(*np.diff(xy, axis=0).T)
+    if (step >= tolerance).all():
+        return xy
+
+    out = xy[_chain(_next_far(xy, tolerance))]
+    if min_vertices >= 3 and _distinct(out) < 3 <= _distinct(xy):
+        idx = _three_vertices(xy)
+        if (xy[0] == xy[-1]).all():
+            idx = np.append(idx, len(xy) - 1)
+        out = xy[idx]
+    return out
+
+
+def _open_rings(rings):
+    """Кольца без замыкающей точки + признак, была ли она."""
+    out, closed = [], []
+    for xy in rings:
+        xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+        c = len(xy) > 1 and bool((xy[0] == xy[-1]).all())
+        out.append(xy[:-1] if c else xy)
+        closed.append(c)
+    return out, closed
+
+
+def _close_rings(rings, closed):
+    return [np.vstack((xy, xy[:1])) if c and len(xy) else xy for xy, c in zip(rings, closed)]
+
+
+def _offsets(rings):
+    offsets = np.zeros(len(rings) + 1, dtype=np.int64)
+    np.cumsum([len(r) for r in rings], out=offsets[1:])
+    return offsets
+
+
+def _segment_distances(p, a, b):
+    """Расстояния от точек p до отрезков ab (построчно)."""
+    ab = b - a
+    ap = p - a
+    denom = np.einsum("ij,ij->i", ab, ab)
+    t = np.einsum("ij,ij->i", ap, ab) / np.where(denom == 0, 1.0, denom)
+    t = np.where(denom == 0, 0.0, np.clip(t, 0.0, 1.0))
+    d = ap - t[:, None] * ab
+    return np.hypot(d[:, 0], d[:, 1])
+
+
+def _dp_flat(xy, keep, tolerance):
+    """
+    Дуглас — Пекер по плоскому массиву ломаных. keep — обязательные точки
+    (концы ломаных); отрезки между соседними обязательными точками делятся
+    в самой дальней точке, пока она дальше tolerance.
+    """
+    n = len(xy)
+    idx = np.arange(n)
+    while True:
+        left = np.maximum.accumulate(np.where(keep, idx, 0))
+        right = np.minimum.accumulate(np.where(keep, idx, n - 1)[::-1])[::-1]
+        inner = np.flatnonzero(~keep)
+        if not len(inner):
+            break
+        d = _segment_distances(xy[inner], xy[left[inner]], xy[right[inner]])
+        over = d > tolerance
+        if not over.any():
+            break
+        inner, d, seg = inner[over], d[over], left[inner[over]]
+        # в каждом отрезке — самая дальняя точка (при равенстве — первая)
+        order = np.lexsort((inner, -d, seg))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = seg[order][1:] != seg[order][:-1]
+        keep[inner[order[first]]] = True
+    return keep
+
+
+def douglas_peucker_rings(rings, tolerance):
+    rings, closed = _open_rings(rings)
+
+    # каждое кольцо — ломаная от первой точки через самую дальнюю от неё
+    # обратно к первой; эти три точки обязательны
+    paths, fars = [], []
+    for ring in rings:
+        n = len(ring)
+        far = int(np.argmax(np.hypot(*(ring - ring[0]).T))) if n else 0
+        paths.append(np.vstack((ring, ring[:1])) if n else ring)
+        fars.append(far)
+    offsets = _offsets(paths)
+    xy = np.vstack(paths) if offsets[-1] else np.empty((0, 2))
+    keep = np.zeros(len(xy), dtype=bool)
+    for i, far in enumerate(fars):
+        if offsets[i + 1] > offsets[i]:
+            keep[[offsets[i], offsets[i] + far, offsets[i + 1] - 1]] = True
+
+    keep = _dp_flat(xy, keep, tolerance)
+
+    out = []
+    for i, ring in enumerate(rings):
+        n = len(ring)
+        if n <= 3:
+            out.append(ring)
+            continue
+        k = keep[offsets[i]:offsets[i] + n].copy()
+        if k.sum() < 3 and fars[i]:
+            # вырожденный результат: добавить самую удалённую от хорды вершину
+            rest = np.flatnonzero(~k)
+            a = np.repeat(ring[:1], len(rest), axis=0)
+            b = np.repeat(ring[fars[i]:fars[i] + 1], len(rest), axis=0)
+            k[rest[int(np.argmax(_segment_distances(ring[rest], a, b)))]] = True
+        out.append(ring[k])
+    return _close_rings(out, closed)
+
+
+def _triangle_areas(xy, prev, nxt, idx):
+    a, b, c = xy[prev[idx]], xy[idx], xy[nxt[idx]]
+    return 0.5 * np.abs((b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) -
+                        (c[:, 0] - a[:, 0]) * (b[:, 1] - a[:, 1]))
+
+
+def _visvalingam_flat(parts, tolerance, cyclic):
+    """
+    Маски оставленных вершин для колец (cyclic) или ломаных с закреплёнными
+    концами. Кольцо не сокращается меньше трёх вершин, ломаная — двух.
+    """
+    offsets = _offsets(parts)
+    total = int(offsets[-1])
+    if not total:
+        return [np.ones(0, dtype=bool) for _ in parts]
+
+    xy = np.vstack(parts)
+    sizes = np.diff(offsets)
+    ring_of = np.repeat(np.arange(len(parts)), sizes)
+    idx = np.arange(total)
+    start = offsets[:-1][ring_of]
+    prev = start + (idx - start - 1) % sizes[ring_of]
+    nxt = start + (idx - start + 1) % sizes[ring_of]
+
+    area = _triangle_areas(xy, prev, nxt, idx)
+    if not cyclic:
+        area[offsets[:-1][sizes > 0]] = np.inf
+        area[offsets[1:][sizes > 0] - 1] = np.inf
+    alive = np.ones(total, dtype=bool)
+    count = sizes.copy()
+    minimum = 3 if cyclic else 2
+    threshold = tolerance * tolerance
+    starts = offsets[:-1][sizes > 0]
+    nonempty = np.flatnonzero(sizes > 0)
+
+    # за шаг из каждого кольца уходит его вершина с наименьшей площадью;
+    # кольца независимы, так что порядок тот же, что у последовательного
+    # алгоритма по каждому кольцу отдельно
+    while True:
+        cand = np.where(alive, area, np.inf)
+        ring_min = np.full(len(parts), np.inf)
+        ring_min[nonempty] = np.minimum.reduceat(cand, starts)
+        active = (ring_min < threshold) & (count > minimum)
+        if not active.any():
+            break
+        hit = np.flatnonzero(active[ring_of] & (cand == ring_min[ring_of]))
+        _, first = np.unique(ring_of[hit], return_index=True)
+        k = hit[first]
+
+        alive[k] = False
+        count[ring_of[k]] -= 1
+        p, q = prev[k], nxt[k]
+        nxt[p] = q
+        prev[q] = p
+        # площадь соседей не может стать меньше удалённой вершины;
+        # концы ломаных остаются закреплёнными (inf)
+        area[p] = np.maximum(_triangle_areas(xy, prev, nxt, p), np.where(area[p] == np.inf, np.inf, cand[k]))
+        area[q] = np.maximum(_triangle_areas(xy, prev, nxt, q), np.where(area[q] == np.inf, np.inf, cand[k]))
+
+    return [alive[offsets[i]:offsets[i + 1]] for i in range(len(parts))]
+
+
+def visvalingam_rings(rings, tolerance):
+    """tolerance — в метрах: порог площади tolerance²."""
+    rings, closed = _open_rings(rings)
+    masks = _visvalingam_flat(rings, tolerance, cyclic=True)
+    return _close_rings([ring[m] for ring, m in zip(rings, masks)], closed)
+
+
+def simplify_lines(lines, tolerance, method="douglas_peucker"):
+    """
+    Упрощение ломаных (дуг) с закреплёнными концами. Замкнутые дуги
+    (первая точка = последней) упрощаются как кольца.
+    """
+    lines = [np.asarray(xy, dtype=np.float64).reshape(-1, 2) for xy in lines]
+    out = list(lines)
+    is_closed = [len(xy) > 3 and bool((xy[0] == xy[-1]).all()) for xy in lines]
+    closed_idx = [i for i, c in enumerate(is_closed) if c]
+    open_idx = [i for i, c in enumerate(is_closed) if not c and len(lines[i]) > 2]
+
+    for i, xy in zip(closed_idx, simplify_rings([lines[i] for i in closed_idx], tolerance, method)):
+        out[i] = xy
+
+    parts = [lines[i] for i in open_idx]
+    if method == "distance":
+        for i, xy in zip(open_idx, parts):
+            kept = distance_filter(xy, tolerance, min_vertices=2)
+            if not (kept[-1] == xy[-1]).all():
+                kept = np.vstack((kept[:-1], xy[-1:])) if len(kept) > 1 else np.vstack((kept, xy[-1:]))
+            out[i] = kept
+    elif method == "douglas_peucker":
+        offsets = _offsets(parts)
+        if offsets[-1]:
+            keep = np.zeros(int(offsets[-1]), dtype=bool)
+            keep[offsets[:-1]] = True
+            keep[offsets[1:] - 1] = True
+            keep = _dp_flat(np.vstack(parts), keep, tolerance)
+            for k, i in enumerate(open_idx):
+                out[i] = lines[i][keep[offsets[k]:offsets[k + 1]]]
+    elif method == "visvalingam":
+        for i, xy, m in zip(open_idx, parts, _visvalingam_flat(parts, tolerance, cyclic=False)):
+            out[i] = xy[m]
+    else:
+        raise ValueError(f"неизвестный метод упрощения: {method}")
+    return out
+
+
+def simplify_rings(rings, tolerance, method="douglas_peucker"):
+    """Список колец → список упрощённых колец (массивы (N, 2))."""
+    if method == "distance":
+        return [distance_filter(xy, tolerance) for xy in rings]
+    if method == "douglas_peucker":
+        return douglas_peucker_rings(rings, tolerance)
+    if method == "visvalingam":
+        return visvalingam_rings(rings, tolerance)
+    raise ValueError(f"неизвестный метод упрощения: {method}")
+
+
+def simplify(xy, tolerance, method="douglas_peucker"):
+    return simplify_rings([xy], tolerance, method)[0]
+
+
+def simplify_lods(rings, tolerances, method="douglas_peucker"):
+    """[уровень][кольцо]: все кольца, упрощённые с каждым допуском из tolerances."""
+    return [simplify_rings(rings, tol, method) for tol in tolerances]
@@ -0,0 +1,285 @@
+# FILENAME: geo_topology.py
+
+#
+# Хранилище общих границ участков в духе TopoJSON.
+#
+# Соседние участки делят большую часть границ, и в polygon.json каждая
+# общая граница записана дважды. build_topology режет кольца в узлах (точках,
+# где сходятся границы разных участков) на дуги и хранит каждую дугу один
+# раз; участок — список ссылок на дуги: i — дуга i как есть, ~i (= -i-1) —
+# дуга i в обратном порядке. Последняя точка дуги совпадает с первой точкой
+# следующей дуги кольца.
+#
+# Перед поиском узлов кольца сводятся к общим вершинам:
+#   snap_rings — вершины ближе snap друг к другу (соседи, записанные с
+#                расхождением в миллиметры) заменяются одной;
+#   node_rings — вершина соседа, лежащая на ребре (не дальше snap), —
+#                Т-образный стык — вставляется в это ребро.
+# После этого координаты сравниваются точно, и expand_topology
+# восстанавливает сведённые кольца — с точностью до начальной вершины
+# (кольцо, разрезанное в узлах, начинается с первого узла) и без повторов
+# одной точки подряд.
+#
+# transform_arcs применяет калибровку (матрицу affine) один раз к каждой
+# вершине дуги, а не к каждому вхождению в кольца; affine.apply считает
+# поэлементно, поэтому общие узлы остаются общими.
+#
+# Выигрыш по вершинам есть не всегда: в плотной нарезке почти каждая
+# вершина — угол трёх и более участков, дуги выходят по два узла, и каждая
+# повторяет узел соседней (vertex_counts — оба числа; polygon_derived не
+# пишет polygon_topo.json, если он не меньше колец). Главное здесь —
+# упрощение по дугам (simplify_topology): узлы закреплены, и общая граница
+# соседей упрощается одинаково, без щелей и наложений.
+#
+# Файл (save_topology) — TopoJSON: {"type": "Topology", "arcs": [...],
+# "objects": {"parcels": {"type": "GeometryCollection", "geometries": [
+#   {"type": "Polygon", "arcs": [[0, ~3, ...]], "properties": {...}}, ...]}}}
+# В properties — все поля участка из polygon.json, кроме coordinates.
+
+import json
+import math
+
+import numpy as np
+
+import affine
+from coord_codec import decode_items
+from geo_simplify import simplify_lines, simplify_rings
+
+
+def _open(ring):
+    # без замыкающей точки и без повторов подряд (в polygon.json кольцо из
+    # уже замкнутого GeoJSON замыкается ещё раз — последняя точка дважды)
+    out = []
+    for pt in ring:
+        pt = tuple(pt)
+        if not out or out[-1] != pt:
+            out.append(pt)
+    while len(out) > 1 and out[0] == out[-1]:
+        out.pop()
+    return out
+
+
+def snap_rings(rings, snap):
+    """
+    Кольца (списки кортежей) с вершинами, сведёнными к первой встреченной
+    вершине не дальше snap. Поиск — по сетке с ячейкой snap (3×3 соседних).
+    """
+    if not snap:
+        return rings
+    cells = {}
+    reps = {}       # вершина → её представитель
+    out = []
+    for ring in rings:
+        new = []
+        for pt in ring:
+            rep = reps.get(pt)
+            if rep is None:
+                cx, cy = math.floor(pt[0] / snap), math.floor(pt[1] / snap)
+                rep, best = pt, snap
+                for dx in (-1, 0, 1):
+                    for dy in (-1, 0, 1):
+                        for q in cells.get((cx + dx, cy + dy), ()):
+                            d = math.hypot(q[0] - pt[0], q[1] - pt[1])
+                            if d <= best:
+                                rep, best = q, d
+                if rep is pt:
+                    cells.setdefault((cx, cy), []).append(pt)
+                reps[pt] = rep
+            new.append(rep)
+        out.append(_open(new))
+    return out
+
+
+def node_rings(rings, snap):
+    """
+    Вставляет в рёбра колец чужие вершины, лежащие на ребре не дальше snap
+    (Т-образные стыки): у обоих соседей общая граница получает одни и те же
+    вершины. Кандидаты — по сетке с ячейкой порядка длины ребра.
+    """
+    edges = [math.hypot(b[0] - a[0], b[1] - a[1])
+             for ring in rings for a, b in zip(ring, ring[1:] + ring[:1])]
+    if not edges:
+        return rings
+    size = max(float(np.median(edges)), snap, 1e-9)
+    grid = {}
+    for k, ring in enumerate(rings):
+        for pt in set(ring):
+            grid.setdefault((math.floor(pt[0] / size), math.floor(pt[1] / size)), []).append((pt, k))
+
+    out = []
+    for k, ring in enumerate(rings):
+        new = []
+        for a, b in zip(ring, ring[1:] + ring[:1]):
+            new.append(a)
+            dx, dy = b[0] - a[0], b[1] - a[1]
+            length2 = dx * dx + dy * dy
+            if not length2:
+                continue
+            on_edge = []
+            for cx in range(math.floor((min(a[0], b[0]) - snap) / size),
+                            math.floor((max(a[0], b[0]) + snap) / size) + 1):
+                for cy in range(math.floor((min(a[1], b[1]) - snap) / size),
+                                math.floor((max(a[1], b[1]) + snap) / size) + 1):
+                    for q, owner in grid.get((cx, cy), ()):
+                        if owner == k or q == a or q == b:
+                            continue
+                        t = ((q[0] - a[0]) * dx + (q[1] - a[1]) * dy) / length2
+                        if 0.0 < t < 1.0 and abs((q[0] - a[0]) * dy - (q[1] - a[1]) * dx) <= snap * math.sqrt(length2):
+                            on_edge.append((t, q))
+            new.extend(dict.fromkeys(q for _, q in sorted(on_edge)))
+        out.append(_open(new))
+    return out
+
+
+def _junctions(rings):
+    """Вершины, у которых в разных вхождениях разные соседи."""
+    neighbours = {}
+    for ring in rings:
+        n = len(ring)
+        for i, pt in enumerate(ring):
+            pair = frozenset((ring[i - 1], ring[(i + 1) % n]))
+            seen = neighbours.get(pt)
+            if seen is None:
+                neighbours[pt] = pair
+            elif seen is not True and seen != pair:
+                neighbours[pt] = True
+    return {pt for pt, v in neighbours.items() if v is True}
+
+
+def build_topology(rings, snap=0.0):
+    """
+    rings — кольца участков (замкнутые или нет); snap — допуск сведения
+    вершин и Т-образных стыков (0 — только точные совпадения). Возвращает
+    (arcs, refs): дуги — списки точек, refs[k] — ссылки кольца k.
+    """
+    rings = [_open(r) for r in rings]
+    if snap:
+        rings = node_rings(snap_rings(rings, snap), snap)
+    junctions = _junctions(rings)
+
+    arcs = []
+    index = {}      # кортеж точек дуги → номер
+
+    def add(arc):
+        key = tuple(arc)
+        i = index.get(key)
+        if i is not None:
+            return i
+        i = index.get(key[::-1])
+        if i is not None:
+            return ~i
+        index[key] = len(arcs)
+        arcs.append(arc)
+        return len(arcs) - 1
+
+    refs = []
+    for ring in rings:
+        cuts = [i for i, pt in enumerate(ring) if pt in junctions]
+        if not ring:
+            refs.append([])
+        elif not cuts:
+            # кольцо без узлов — одна замкнутая дуга; начало и направление
+            # канонические, чтобы совпадающие участки делили дугу
+            k = min(range(len(ring)), key=ring.__getitem__)
+            fwd = ring[k:] + ring[:k]
+            refs.append([add(fwd + fwd[:1])])
+        else:
+            ring_refs = []
+            for a, b in zip(cuts, cuts[1:] + [cuts[0] + len(ring)]):
+                ring_refs.append(add([ring[j % len(ring)] for j in range(a, b + 1)]))
+            refs.append(ring_refs)
+    return [list(arc) for arc in arcs], refs
+
+
+def expand_ring(arcs, ring_refs):
+    """Ссылки кольца → замкнутое кольцо (список точек)."""
+    out = []
+    for ref in ring_refs:
+        arc = arcs[ref] if ref >= 0 else arcs[~ref][::-1]
+        out.extend(arc if not out else arc[1:])
+    return [list(pt) for pt in out]
+
+
+def expand_topology(arcs, refs):
+    return [expand_ring(arcs, r) for r in refs]
+
+
+def simplify_topology(arcs, refs, tolerances, method="douglas_peucker"):
+    """
+    Уровни детализации по дугам: [уровень][кольцо]. Узлы закреплены,
+    поэтому общие границы соседей упрощаются одинаково. Если кольцо
+    схлопнулось меньше чем до трёх вершин, оно упрощается само по себе.
+    """
+    rings = None
+    lines = [np.asarray(arc, dtype=np.float64) for arc in arcs]
+    levels = []
+    for tol in tolerances:
+        simple = [a.tolist() for a in simplify_lines(lines, tol, method)]
+        level = expand_topology(simple, refs)
+        bad = [k for k, ring in enumerate(level) if len(ring) < 4]
+        if bad:
+            if rings is None:
+                rings = expand_topology(arcs, refs)
+            fixed = simplify_rings([np.asarray(rings[k], dtype=np.float64) for k in bad], tol, method)
+            for k, ring in zip(bad, fixed):
+                level[k] = ring.tolist()
+        levels.append(level)
+    return levels
+
+
+def transform_arcs(arcs, matrix):
+    """Дуги после матрицы 3×3 (affine): все вершины одним вызовом affine.apply."""
+    if matrix is None or not arcs:
+        return arcs
+    offsets = np.zeros(len(arcs) + 1, dtype=np.int64)
+    np.cumsum([len(a) for a in arcs], out=offsets[1:])
+    xy = affine.apply(matrix, np.array([pt for arc in arcs for pt in arc], dtype=np.float64))
+    return [xy[offsets[i]:offsets[i + 1]].tolist() for i in range(len(arcs))]
+
+
+def topology_from_items(items, snap=0.0):
+    """Участки polygon.json → (arcs, refs) по внешним кольцам."""
+    return build_topology([item["coordinates"][0] for item in items], snap)
+
+
+def save_topology(path, items, arcs, refs):
+    geometries = []
+    for item, ring_refs in zip(items, refs):
+        props = {k: v for k, v in item.items() if k != "coordinates"}
+        geometries.append({"type": "Polygon", "arcs": [ring_refs], "properties": props})
+    topo = {
+        "type": "Topology",
+        "arcs": [[list(pt) for pt in arc] for arc in arcs],
+        "objects": {"parcels": {"type": "GeometryCollection", "geometries": geometries}}
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(topo, f, ensure_ascii=False, separators=(",", ":"))
+
+
+def items_from_topology(topo):
+    """TopoJSON → участки в формате polygon.json (с развёрнутыми кольцами)."""
+    arcs = topo["arcs"]
+    items = []
+    for geom in topo["objects"]["parcels"]["geometries"]:
+        item = dict(geom.get("properties", {}))
+        item["coordinates"] = [expand_ring(arcs, geom["arcs"][0])]
+        items.append(item)
+    return items
+
+
+def load_items(path):
+    """
+    data из polygon.json или из TopoJSON-файла — одинаково; кольца,
+    закодированные дельтами (export.quantize), раскрываются.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("type") == "Topology":
+        return items_from_topology(data)
+    return decode_items(data.get("data") or [], data.get("encoding"))
+
+
+def vertex_counts(arcs, refs):
+    """(вершин в дугах, вершин в развёрнутых кольцах)."""
+    ring_total = sum(len(r) for r in expand_topology(arcs, refs))
+    return sum(len(a) for a in arcs), ring_total
@@ -1,15 +1,32 @@
 # FILENAME: get_geojson_by_list.py
-# Version 3.2 – config-driven, emoji output, telemetry summary,
-#               pending list saved to pending.txt (always overwritten).
-
+# Version 3.3 – config-driven, emoji output, telemetry summary,
+#               pending list saved to pending.txt (always overwritten),
+#               bounded worker pool (downloader.max_workers),
+#               adaptive AIMD rate limiter (downloader.dynamic_backoff),
+#               in-process rosreestr2coord backend (downloader.backend),
+#               download cache: fresh parcels in output/ are skipped
+#               (--refresh / --max-age HOURS),
+#               crash-safe JSONL journal with automatic resume (--no-resume),
+#               streaming normalize stage for Stage 1 (downloader.pipeline),
+#               live control channel: pause/resume/stop/set (downloader_control.py).
+
+import argparse
+import atexit
 import os
-import subprocess
 import shutil
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing import get_context
 from datetime import datetime
 import json
 import sys
 
+from download_cache import DownloadCache
+from download_journal import Journal, read_events, is_unfinished
+from downloader_control import ControlState, ControlServer
+from rosreestr_backend import make_backend
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CONFIG_PATH = os.path.join(BASE_DIR, "config.json")
 
@@ -22,31 +39,70 @@ else:
         "downloader": {
             "delay_seconds": 0.1,
             "retry_cycles": 10,
-            "dynamic_backoff": False
+            "dynamic_backoff": False,
+            "min_delay_seconds": 0.02,
+            "max_delay_seconds": 30.0,
+            "rate_step": 0.2,
+            "backoff_factor": 2.0,
+            "max_workers": 1,
+            "backend": "subprocess",
+            "cli_command": "rosreestr2coord",
+            "api_root": None,
+            "request_timeout": 5,
+            "cache_max_age_hours": None,
+            "journal_batch": 20,
+            "journal_flush_seconds": 2.0,
+            "pipeline": False,
+            "pipeline_workers": 2,
+            "control_port": 47615
         },
         "paths": {
             "output_dir": "output",
             "temp_dir": "output_temp",
-            "log_dir": "."
+            "log_dir": ".",
+            "cache_index": "download_cache.json",
+            "journal": "rosreestr_journal.jsonl",
+            "normalized_dir": "output_normalized"
         }
     }
 
 DELAY = cfg["downloader"]["delay_seconds"]
 RETRY_CYCLES = cfg["downloader"]["retry_cycles"]
+DYNAMIC_BACKOFF = bool(cfg["downloader"].get("dynamic_backoff", False))
+MIN_DELAY = cfg["downloader"].get("min_delay_seconds", 0.02)
+MAX_DELAY = cfg["downloader"].get("max_delay_seconds", 30.0)
+RATE_STEP = cfg["downloader"].get("rate_step", 0.2)
+BACKOFF_FACTOR = cfg["downloader"].get("backoff_factor", 2.0)
+MAX_WORKERS = max(1, int(cfg["downloader"].get("max_workers", 1)))
+BACKEND = cfg["downloader"].get("backend", "subprocess")
+CLI_COMMAND = cfg["downloader"].get("cli_command", "rosreestr2coord")
+API_ROOT = cfg["downloader"].get("api_root")
+REQUEST_TIMEOUT = cfg["downloader"].get("request_timeout", 5)
+CACHE_MAX_AGE = cfg["downloader"].get("cache_max_age_hours")
+JOURNAL_BATCH = cfg["downloader"].get("journal_batch", 20)
+JOURNAL_FLUSH = cfg["downloader"].get("journal_flush_seconds", 2.0)
+PIPELINE = bool(cfg["downloader"].get("pipeline", False))
+PIPELINE_WORKERS = max(1, int(cfg["downloader"].get("pipeline_workers", 2)))
+CONTROL_PORT = cfg["downloader"].get("control_port", 47615)
 
 OUTPUT_DIR = os.path.join(BASE_DIR, cfg["paths"]["output_dir"])
 TEMP_DIR = os.path.join(BASE_DIR, cfg["paths"]["temp_dir"])
 LOG_DIR = os.path.join(BASE_DIR, cfg["paths"]["log_dir"])
+NORMALIZED_DIR = os.path.join(BASE_DIR, cfg["paths"].get("normalized_dir", "output_normalized"))
+CACHE_INDEX = os.path.join(BASE_DIR, cfg["paths"].get("cache_index", "download_cache.json"))
 
 INPUT_FILE = os.path.join(BASE_DIR, "cad_nums.txt")
 LOG_TEXT = os.path.join(LOG_DIR, "rosreestr_custom.log")
 LOG_JSON = os.path.join(LOG_DIR, "rosreestr_telemetry.json")
+JOURNAL_PATH = os.path.join(LOG_DIR, cfg["paths"].get("journal", "rosreestr_journal.jsonl"))
 PENDING_FILE = os.path.join(BASE_DIR, "pending.txt")
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 os.makedirs(TEMP_DIR, exist_ok=True)
 
 telemetry = []
+journal = Journal(JOURNAL_PATH, batch_size=JOURNAL_BATCH, flush_interval=JOURNAL_FLUSH)
+text_log = Journal(LOG_TEXT, batch_size=JOURNAL_BATCH, flush_interval=JOURNAL_FLUSH, fsync=False)
 
 def ts():
     return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -55,13 +111,98 @@ def ts_iso():
     return datetime.now().isoformat()
 
 def log_text(event, msg):
-    with open(LOG_TEXT, "a", encoding="utf-8") as f:
-        f.write(f"{ts()} | {event:<7} | {msg}\n")
+    text_log.write_line(f"{ts()} | {event:<7} | {msg}")
 
 def log_json(event, cad, **kwargs):
     entry = {"ts": ts_iso(), "cad": cad, "event": event}
     entry.update(kwargs)
     telemetry.append(entry)
+    journal.write_event(entry)
+
+def flush_logs():
+    journal.flush()
+    text_log.flush()
+
+atexit.register(flush_logs)
+
+class RateLimiter:
+    """
+    Общий для всех потоков ограничитель частоты запросов.
+
+    dynamic=False — фиксированный интервал `delay` между стартами запросов.
+    dynamic=True  — AIMD: пока сервер отвечает (success / not_found), частота
+    растёт на `step` запросов/с; на каждый отказ (retry) частота делится на
+    `factor`, т.е. интервал растёт экспоненциально. Так загрузчик держится
+    чуть ниже порога троттлинга росреестра, а не угадывает константу.
+    """
+
+    def __init__(self, delay, dynamic=False, min_delay=0.02, max_delay=30.0,
+                 step=0.2, factor=2.0):
+        self.dynamic = dynamic
+        self.min_delay = min(min_delay, delay) if delay > 0 else min_delay
+        self.max_delay = max(max_delay, delay)
+        self.step = step
+        self.factor = factor
+        self.delay = delay
+        self.backoff_level = 0
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        # резервируем ближайший свободный слот и ждём его вне блокировки
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.delay
+        if slot > now:
+            time.sleep(slot - now)
+
+    def report(self, status):
+        """Учитывает исход запроса. Возвращает True, если ушли в backoff."""
+        if not self.dynamic:
+            return False
+        with self.lock:
+            if status == "retry":
+                self.backoff_level += 1
+                self.delay = min(self.max_delay, max(self.delay, self.min_delay) * self.factor)
+                # отодвигаем уже выданные слоты, чтобы пауза подействовала сразу
+                self.next_slot = max(self.next_slot, time.monotonic() + self.delay)
+                return True
+            self.backoff_level = 0
+            rate = 1.0 / self.delay if self.delay > 0 else 1.0 / self.min_delay
+            self.delay = max(self.min_delay, 1.0 / (rate + self.step))
+            return False
+
+    def set_delay(self, delay):
+        with self.lock:
+            self.delay = delay
+            self.min_delay = min(self.min_delay, delay) if delay > 0 else self.min_delay
+            self.max_delay = max(self.max_delay, delay)
+            self.next_slot = min(self.next_slot, time.monotonic() + delay)
+
+    def state(self):
+        with self.lock:
+            rate = 1.0 / self.delay if self.delay > 0 else None
+            return {
+                "rate": round(rate, 3) if rate else None,
+                "delay": round(self.delay, 4),
+                "backoff": self.backoff_level
+            }
+
+limiter = RateLimiter(
+    DELAY,
+    dynamic=DYNAMIC_BACKOFF,
+    min_delay=MIN_DELAY,
+    max_delay=MAX_DELAY,
+    step=RATE_STEP,
+    factor=BACKOFF_FACTOR
+)
+
+control = ControlState(workers=MAX_WORKERS)
+
+backend = make_backend(BACKEND, pool_size=MAX_WORKERS, timeout=REQUEST_TIMEOUT,
+                       command=CLI_COMMAND, api_root=API_ROOT)
+cache = DownloadCache(CACHE_INDEX)
 
 def classify_error(stderr_text):
     if not stderr_text:
@@ -76,16 +217,26 @@ def classify_error(stderr_text):
             return "not_found"
     return "retry"
 
+def worker_temp_dir():
+    # У каждого потока пула свой подкаталог во временной папке,
+    # чтобы параллельные rosreestr2coord не затирали файлы друг друга.
+    path = os.path.join(TEMP_DIR, threading.current_thread().name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def cad_filename(cad_num):
+    return cad_num.replace(":", "_") + ".geojson"
+
 def run_single_download(cad_num, index=None, total=None):
-    filename = cad_num.replace(":", "_") + ".geojson"
-    temp_path = os.path.join(TEMP_DIR, filename)
+    filename = cad_filename(cad_num)
+    temp_path = os.path.join(worker_temp_dir(), filename)
     final_path = os.path.join(OUTPUT_DIR, filename)
 
     if index is not None and total is not None:
         print(f"📦 [{index}/{total}] Запрашиваем: {cad_num}")
 
     log_text("START", cad_num)
-    log_json("start", cad_num)
+    log_json("start", cad_num, **limiter.state())
 
     if os.path.isfile(temp_path):
         os.remove(temp_path)
@@ -93,11 +244,7 @@ def run_single_download(cad_num, index=None, total=None):
         shutil.rmtree(temp_path)
 
     try:
-        result = subprocess.run(
-            ["rosreestr2coord", "-c", cad_num, "-o", temp_path],
-            text=True,
-            capture_output=True
-        )
+        stderr = backend.fetch(cad_num, temp_path)
     except KeyboardInterrupt:
         raise
     except Exception as e:
@@ -109,7 +256,7 @@ def run_single_download(cad_num, index=None, total=None):
 
     if os.path.isfile(temp_path):
         shutil.copy2(temp_path, final_path)
-        size = os.path.getsize(final_path)
+        size = cache.record(cad_num, final_path)["size"]
         print(f"  ✅ Скопировано: {final_path}")
         log_text("OK", f"{final_path} | {size} bytes")
         log_json("success", cad_num, file=filename, size=size)
@@ -119,13 +266,13 @@ def run_single_download(cad_num, index=None, total=None):
         nested = os.path.join(temp_path, "geojson", filename)
         if os.path.isfile(nested):
             shutil.copy2(nested, final_path)
-            size = os.path.getsize(final_path)
+            size = cache.record(cad_num, final_path)["size"]
             print(f"  ✅ Извлечено из структуры: {final_path}")
             log_text("OK", f"{final_path} | {size} bytes")
             log_json("success", cad_num, file=filename, size=size)
             return ("success", final_path)
 
-    err_type = classify_error(result.stderr)
+    err_type = classify_error(stderr)
     if err_type == "not_found":
         print(f"  ❌ Не найдено: {cad_num}")
         log_text("ERROR", f"{cad_num} | not found")
@@ -133,30 +280,115 @@ def run_single_download(cad_num, index=None, total=None):
         return ("not_found", None)
     else:
         print(f"  🔁 Сервер отказал → retry: {cad_num}")
-        log_text("RETRY", f"{cad_num} | {result.stderr.strip()}")
-        log_json("retry", cad_num, error=result.stderr.strip())
+        log_text("RETRY", f"{cad_num} | {stderr.strip()}")
+        log_json("retry", cad_num, error=stderr.strip())
         return ("retry", None)
 
+def stop_requested():
+    # stop.flag оставлен для совместимости со старыми версиями GUI
+    return control.stopping or os.path.exists('stop.flag')
+
+# ---- Потоковая нормализация (downloader.pipeline) ----------------
+# Каждый скачанный файл сразу разбирается, переводится в EPSG:3857 и
+# чистится в отдельном процессе; результат ложится в общий кэш геометрии
+# (NORMALIZED_DIR), откуда его забирают Stage 1 и отладочный просмотр.
+# CPU-работа идёт, пока остальные запросы ждут сеть.
+
+normalize_pool = None
+normalize_futures = []
+
+def start_pipeline():
+    global normalize_pool
+    if PIPELINE and normalize_pool is None:
+        # spawn: не форкаем процесс, в котором уже работают потоки загрузки
+        normalize_pool = ProcessPoolExecutor(
+            max_workers=PIPELINE_WORKERS,
+            mp_context=get_context("spawn")
+        )
+
+def submit_normalize(cad, path):
+    if normalize_pool is None:
+        return
+    from geo_normalize import normalize_to_cache
+
+    def on_done(fut):
+        err = fut.exception()
+        if err is None:
+            log_json("normalized", cad)
+        else:
+            log_text("NORMERR", f"{cad} | {err}")
+            log_json("normalize_error", cad, error=str(err))
+
+    fut = normalize_pool.submit(normalize_to_cache, path, NORMALIZED_DIR)
+    fut.add_done_callback(on_done)
+    normalize_futures.append(fut)
+
+def finish_pipeline():
+    global normalize_pool
+    if normalize_pool is None:
+        return
+    wait(normalize_futures)
+    normalize_pool.shutdown()
+    normalize_pool = None
+    failed = sum(1 for fut in normalize_futures if fut.exception() is not None)
+    print(f"🧩 Нормализовано для Stage 1: {len(normalize_futures) - failed} (ошибок: {failed})")
+
+    # тот же лимит normalize.cache_max_mb, что у Stage 1: долгая загрузка
+    # не раздувает общий кэш без предела
+    from geo_normalize import cache_from_config
+    removed = cache_from_config(BASE_DIR).evict()
+    if removed:
+        print(f"🧹 Из кэша геометрии вытеснено записей: {removed}")
+
+def download_task(cad, index, total):
+    limiter.acquire()
+    status, path = run_single_download(cad, index, total)
+    if status == "success":
+        submit_normalize(cad, path)
+    if limiter.report(status):
+        st = limiter.state()
+        print(f"  🐢 Backoff x{st['backoff']}: пауза {st['delay']} с")
+        log_text("BACKOFF", f"{cad} | delay {st['delay']} s | level {st['backoff']}")
+        log_json("backoff", cad, **st)
+    return status
+
 def process_pass(cads):
-    success = []
-    not_found = []
-    retry = []
+    statuses = {}
     total = len(cads)
-    for idx, cad in enumerate(cads, 1):
-        # STOP FLAG CHECK
-        if os.path.exists('stop.flag'):
-            print('⛔ Обнаружен stop.flag — завершаю и формирую отчёт...')
-            try: os.remove('stop.flag')
-            except: pass
-            graceful_exit()
-        status, _ = run_single_download(cad, idx, total)
-        if status == "success":
-            success.append(cad)
-        elif status == "not_found":
-            not_found.append(cad)
-        else:
-            retry.append(cad)
-        time.sleep(DELAY)
+    stopped = False
+
+    # пул рассчитан на максимум, фактическое число одновременных запросов —
+    # control.workers, его можно менять на ходу через канал управления
+    with ThreadPoolExecutor(max_workers=control.max_workers, thread_name_prefix="worker") as pool:
+        in_flight = {}
+        for idx, cad in enumerate(cads, 1):
+            control.wait_while_paused()
+            # STOP CHECK
+            if stop_requested():
+                stopped = True
+                break
+            while len(in_flight) >= control.workers:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    statuses[in_flight.pop(fut)] = fut.result()
+            in_flight[pool.submit(download_task, cad, idx, total)] = idx
+
+        # дожидаемся запросов, которые уже в работе
+        for fut in wait(in_flight).done:
+            statuses[in_flight[fut]] = fut.result()
+
+    flush_logs()
+
+    if stopped:
+        print('⛔ Запрошена остановка — завершаю и формирую отчёт...')
+        try: os.remove('stop.flag')
+        except: pass
+        graceful_exit()
+
+    # порядок списков — как во входном файле, независимо от порядка завершения
+    success = [c for i, c in enumerate(cads, 1) if statuses.get(i) == "success"]
+    not_found = [c for i, c in enumerate(cads, 1) if statuses.get(i) == "not_found"]
+    retry = [c for i, c in enumerate(cads, 1) if statuses.get(i) == "retry"]
     return success, not_found, retry
 
 def compute_summary_from_telemetry():
@@ -166,7 +398,7 @@ def compute_summary_from_telemetry():
     except FileNotFoundError:
         all_cads = []
 
-    success_set = {e["cad"] for e in telemetry if e.get("event") == "success"}
+    success_set = {e["cad"] for e in telemetry if e.get("event") in ("success", "cached")}
     not_found_set = {
         e["cad"] for e in telemetry
         if e.get("event") == "error" and e.get("error") == "not_found"
@@ -184,7 +416,11 @@ def write_pending_file(pending):
 def graceful_exit():
     print("\n⛔ Прервано пользователем. Идёт сохранение логов...")
 
+    finish_pipeline()
     shutil.rmtree(TEMP_DIR, ignore_errors=True)
+    cache.save()
+    # без run_end: следующий запуск продолжит с этого места
+    flush_logs()
 
     with open(LOG_JSON, "w", encoding="utf-8") as f:
         json.dump(telemetry, f, ensure_ascii=False, indent=2)
@@ -201,13 +437,85 @@ def graceful_exit():
     print("==============================================\n")
     sys.exit(1)
 
+def parse_args():
+    p = argparse.ArgumentParser(description="Загрузка участков из росреестра по списку cad_nums.txt")
+    p.add_argument("--refresh", action="store_true",
+                   help="перекачать все участки, игнорируя кэш")
+    p.add_argument("--max-age", type=float, default=CACHE_MAX_AGE, metavar="HOURS",
+                   help="перекачивать участки, скачанные раньше чем HOURS часов назад")
+    p.add_argument("--no-resume", action="store_true",
+                   help="не продолжать прерванную загрузку, начать журнал заново")
+    return p.parse_args()
+
+def open_journal(resume):
+    """
+    Если прошлый запуск оборвался (в журнале нет run_end), подхватывает его
+    события в telemetry и дописывает журнал дальше. Иначе начинает новый.
+    """
+    events = read_events(JOURNAL_PATH) if resume else []
+    if is_unfinished(events):
+        telemetry.extend(e for e in events if e.get("cad"))
+        log_json("resume", None)
+        return True
+    journal.truncate()
+    log_json("run_start", None, input=INPUT_FILE)
+    return False
+
+def start_control_server():
+    if not CONTROL_PORT:
+        return None
+    try:
+        server = ControlServer(
+            control,
+            port=CONTROL_PORT,
+            on_set_delay=limiter.set_delay,
+            # пул соединений общей HTTP-сессии — под новое число потоков
+            on_set_workers=backend.set_pool_size,
+            status_fn=lambda: {
+                "limiter": limiter.state(),
+                "success": sum(1 for e in telemetry if e.get("event") == "success"),
+                "retry": sum(1 for e in telemetry if e.get("event") == "retry")
+            }
+        ).start()
+    except OSError as e:
+        print(f"⚠️ Канал управления недоступен (порт {CONTROL_PORT}): {e}")
+        return None
+    print(f"🎛 Канал управления: 127.0.0.1:{server.port}")
+    return server
+
 def main():
+    args = parse_args()
+    start_control_server()
+    max_age = 0 if args.refresh else args.max_age
+
     with open(INPUT_FILE, "r", encoding="utf-8") as f:
         cads = [x.strip() for x in f if x.strip()]
 
+    done = set()
+    if open_journal(resume=not args.no_resume):
+        success_set, not_found_set, pending = compute_summary_from_telemetry()
+        done = success_set | not_found_set
+        print(f"🔄 Продолжаю прерванную загрузку: скачано {len(success_set)}, "
+              f"не найдено {len(not_found_set)}, осталось {len(pending)}")
+
+    fresh = {c for c in cads if cache.is_fresh(c, os.path.join(OUTPUT_DIR, cad_filename(c)), max_age)}
+    for cad in fresh:
+        log_json("cached", cad)
+    if fresh:
+        print(f"♻️ Уже скачано и актуально: {len(fresh)} — пропускаю")
+
+    start_pipeline()
+    if PIPELINE:
+        from geo_normalize import cache_from_config
+        geometry_cache = cache_from_config(BASE_DIR)
+        for cad in cads:
+            path = os.path.join(OUTPUT_DIR, cad_filename(cad))
+            if cad in fresh and geometry_cache.get(path) is None:
+                submit_normalize(cad, path)
+
     success_all = []
     not_found_all = []
-    retry_list = cads
+    retry_list = [c for c in cads if c not in fresh and c not in done]
 
     try:
         s, nf, r = process_pass(retry_list)
@@ -226,7 +534,11 @@ def main():
     except KeyboardInterrupt:
         graceful_exit()
 
+    finish_pipeline()
     shutil.rmtree(TEMP_DIR, ignore_errors=True)
+    cache.save()
+    log_json("run_end", None)
+    flush_logs()
 
     with open(LOG_JSON, "w", encoding="utf-8") as f:
         json.dump(telemetry, f, ensure_ascii=False, indent=2)
@@ -238,6 +550,8 @@ def main():
     print(f"Успешно скачано:  {len(success_set)}")
     print(f"Не найдено:        {len(not_found_set)}")
     print(f"После {RETRY_CYCLES} попыток недогружено: {len(pending)}")
+    if DYNAMIC_BACKOFF:
+        print(f"Итоговая частота:  {limiter.state()['rate']} запр/с")
     print(f"Список недогрузок сохранён в: {PENDING_FILE}")
     print("==========================================\n")
 
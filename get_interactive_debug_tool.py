@@ -1,23 +1,20 @@
 ﻿# FILENAME: get_interactive_debug_tool.py
 
 import os
-import json
 import glob
 import matplotlib.pyplot as plt
-from pyproj import Transformer
 
-# Преобразование WGS84 → Web Mercator (EPSG:3857)
-transformer = Transformer.from_crs("EPSG:4326", "EPSG:3857", always_xy=True)
+from geo_normalize import cache_from_config, load_normalized
 
-def extract_coords(filename):
-    with open(filename, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    geom = data.get("features", [data])[0].get("geometry", data.get("geometry"))
-    return geom["coordinates"][0]
-
-def reproject(coords):
-    return [transformer.transform(lon, lat) for lon, lat in coords]
+def load_rings(files, base):
+    # кольца EPSG:3857 из общего кэша геометрии (тот же, что у Stage 1);
+    # разбираются и перепроецируются только файлы, которых в кэше нет
+    cache = cache_from_config(base)
+    results, hits = load_normalized(files, cache)
+    cache.evict()
+    if hits:
+        print(f"⚡ Из кэша геометрии: {hits}")
+    return results
 
 def interactive_plot(coords_list, labels):
     fig, ax = plt.subplots()
@@ -68,21 +65,29 @@ if __name__ == "__main__":
 
     coords_list = []
     labels = []
-
-    for file in files:
+    dropped = []    # меньше трёх различных вершин — рисовать нечего
+
+    for file, (rec, err) in zip(files, load_rings(files, base)):
+        if err:
+            print(f"❌ Ошибка чтения {file}: {err}")
+            continue
+        if rec is None:
+            dropped.append(file)
+            continue
         name = os.path.splitext(os.path.basename(file))[0]
-        try:
-            coords = reproject(extract_coords(file))
-            coords_list.append(coords)
+        coords_list.append(rec["ring"])
+
+        # Берём последнюю часть кадастра как подпись
+        labels.append(name.split("_")[-1])
 
-            # Берём последнюю часть кадастра как подпись
-            labels.append(name.split("_")[-1])
-        except Exception as e:
-            print(f"❌ Ошибка чтения {file}: {e}")
+    if dropped:
+        print(f"⚠️ Не показаны (меньше трёх различных вершин): {len(dropped)}")
+        for file in dropped:
+            print(f"   {os.path.relpath(file, base)}")
 
     if coords_list:
         print(f"✅ Загружено участков: {len(coords_list)}")
         interactive_plot(coords_list, labels)
-    else:
+    elif not dropped:
         print("❌ Не найдено ни одного GeoJSON-файла внутри ./output/")
 
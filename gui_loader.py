@@ -4,14 +4,18 @@
 
 import sys
 import os
+import json
 import subprocess
 from PySide6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QPushButton,
-    QTextEdit, QLabel, QFileDialog, QHBoxLayout
+    QTextEdit, QLabel, QFileDialog, QHBoxLayout,
+    QSpinBox, QDoubleSpinBox
 )
 from PySide6.QtGui import QIcon
 from PySide6.QtCore import Qt, QThread, Signal
 
+from downloader_control import DEFAULT_PORT, send_command
+
 BASE = os.path.dirname(os.path.abspath(__file__))
 
 DEFAULT_CAD_LIST = os.path.join(BASE, "cad_nums.txt")
@@ -119,6 +123,41 @@ class LoaderGUI(QWidget):
 
         layout.addLayout(dl_row)
 
+        # ROW 2b — live control of a running download
+        ctl_row = QHBoxLayout()
+        self.btn_pause = QPushButton("⏸ Пауза")
+        self.btn_pause.clicked.connect(lambda: self.send_control("pause"))
+        ctl_row.addWidget(self.btn_pause)
+
+        self.btn_resume = QPushButton("▶ Продолжить")
+        self.btn_resume.clicked.connect(lambda: self.send_control("resume"))
+        ctl_row.addWidget(self.btn_resume)
+
+        ctl_row.addWidget(QLabel("Потоков:"))
+        self.spin_workers = QSpinBox()
+        self.spin_workers.setRange(1, 64)
+        ctl_row.addWidget(self.spin_workers)
+
+        ctl_row.addWidget(QLabel("Интервал, с:"))
+        self.spin_delay = QDoubleSpinBox()
+        self.spin_delay.setRange(0.0, 60.0)
+        self.spin_delay.setSingleStep(0.1)
+        ctl_row.addWidget(self.spin_delay)
+
+        self.btn_apply = QPushButton("Применить")
+        self.btn_apply.clicked.connect(self.apply_settings)
+        ctl_row.addWidget(self.btn_apply)
+
+        # значения, с которыми работает загрузчик: сначала из config.json,
+        # затем из ответов канала управления; "set" шлёт только изменённое
+        self.running_values = {}
+        self.reset_control_values()
+
+        self.control_buttons = [self.btn_pause, self.btn_resume, self.btn_apply]
+        for b in self.control_buttons:
+            b.setEnabled(False)
+        layout.addLayout(ctl_row)
+
         # ROW 3 — Stages
         stage_row = QHBoxLayout()
 
@@ -175,6 +214,10 @@ class LoaderGUI(QWidget):
 
         self.status.setText("⏳ Работаем…")
         self.btn_stop.setEnabled(script == NORMAL_SCRIPT)
+        if script == NORMAL_SCRIPT:
+            self.reset_control_values()
+        for b in self.control_buttons:
+            b.setEnabled(script == NORMAL_SCRIPT)
 
     # ===== Console stages (Stage2 & Stage3) =====
     def start_stage2_console(self):
@@ -201,9 +244,68 @@ class LoaderGUI(QWidget):
         self.log.append(text)
         self.status.setText("Готово.")
         self.btn_stop.setEnabled(False)
+        for b in self.control_buttons:
+            b.setEnabled(False)
+
+    # ===== Live control channel (downloader_control.py) =====
+    def downloader_config(self):
+        try:
+            with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+                return json.load(f).get("downloader", {})
+        except Exception:
+            return {}
+
+    def control_port(self):
+        return self.downloader_config().get("control_port") or DEFAULT_PORT
+
+    def show_control_values(self, workers=None, delay=None):
+        # поле показывает и запоминает значение в своём округлении
+        if workers is not None:
+            self.spin_workers.setValue(int(workers))
+            self.running_values["workers"] = self.spin_workers.value()
+        if delay is not None:
+            self.spin_delay.setValue(float(delay))
+            self.running_values["delay"] = self.spin_delay.value()
+
+    def reset_control_values(self):
+        # те же значения по умолчанию, что у get_geojson_by_list.py
+        dl = self.downloader_config()
+        self.show_control_values(max(1, int(dl.get("max_workers", 1))), dl.get("delay_seconds", 0.1))
+
+    def apply_settings(self):
+        changed = {
+            key: value
+            for key, value in (("workers", self.spin_workers.value()), ("delay", self.spin_delay.value()))
+            if value != self.running_values.get(key)
+        }
+        if not changed:
+            self.log.append("ℹ️ Настройки не изменены — отправлять нечего.")
+            return
+        self.send_control("set", **changed)
+
+    def send_control(self, cmd, **params):
+        try:
+            reply = send_command(cmd, port=self.control_port(), **params)
+        except OSError as e:
+            self.log.append(f"❌ Загрузчик не отвечает: {e}")
+            return False
+        if not reply.get("ok"):
+            self.log.append(f"❌ {reply.get('error')}")
+            return False
+        st = reply["status"]
+        self.show_control_values(st.get("workers"), st.get("limiter", {}).get("delay"))
+        self.status.setText(
+            f"{'⏸ Пауза' if st['paused'] else '⏳ Работаем…'} "
+            f"(потоков {st['workers']}, {st.get('limiter', {}).get('rate')} запр/с)"
+        )
+        return True
 
     # ===== Soft stop =====
     def stop_loading(self):
+        if self.send_control("stop"):
+            self.log.append("⛔ Остановка запрошена через канал управления…")
+            self.status.setText("Ждём graceful exit…")
+            return
         try:
             with open(STOP_FLAG_PATH, "w", encoding="utf-8") as f:
                 f.write("stop\n")
@@ -0,0 +1,140 @@
+# FILENAME: hit_index.py
+
+#
+# Индекс для поиска участка под курсором (карта Yandex): равномерная сетка
+# ячеек поверх bbox участков.
+#
+# Каждая ячейка знает участки, чей bbox её задевает. Клик: ячейка по
+# координатам (одно деление), несколько кандидатов из неё, проверка bbox и
+# только потом точная проверка кольца — время почти не зависит от числа
+# участков. Размер ячейки — медианный размер участка (не меньше, чем нужно,
+# чтобы ячеек было не больше 4 на участок).
+#
+# Координаты — в порядке пар polygon.json (клиент считает в тех же
+# числах, что и рисует). Файл polygon.hit.json (без пробелов):
+#   version, origin [o0, o1], cell, cols, rows,
+#   offsets  — (cols*rows + 1): участки ячейки c = items[offsets[c]:offsets[c+1]],
+#              c = row * cols + col, col = floor((p0 - o0) / cell);
+#   items    — номера участков;
+#   idtur    — idtur по номеру участка;
+#   bbox     — [min0, min1, max0, max1] по номеру участка подряд (округлены
+#              наружу до сантиметра);
+#   tile     — (только для плиток) номер плитки участка в index.json.
+#
+# HitIndex — эталонный поиск на Python (так же должен работать клиент).
+
+import json
+import math
+import os
+
+import numpy as np
+
+from parcel_set import points_in_polygon
+
+HIT_INDEX_VERSION = 1
+MAX_CELLS_PER_PARCEL = 4
+
+
+def hit_index_path(polygon_path):
+    root, _ = os.path.splitext(polygon_path)
+    return root + ".hit.json"
+
+
+def build_hit_index(parcels, swap_axes, cell=None, tile_of=None):
+    """Индекс (dict) для ParcelSet; swap_axes — порядок пар в выгружаемом polygon.json."""
+    boxes = parcels.ring_bboxes()
+    if swap_axes:
+        boxes = boxes[:, [1, 0, 3, 2]]
+    boxes = np.column_stack((np.floor(boxes[:, :2] * 100) / 100, np.ceil(boxes[:, 2:] * 100) / 100))
+    valid = np.flatnonzero(~np.isnan(boxes[:, 0]))
+
+    index = {"version": HIT_INDEX_VERSION}
+    if len(valid):
+        lo = boxes[valid, :2].min(axis=0)
+        hi = boxes[valid, 2:].max(axis=0)
+    else:
+        lo = hi = np.zeros(2)
+    if cell is None:
+        sides = (boxes[valid, 2:] - boxes[valid, :2]).max(axis=1) if len(valid) else np.ones(1)
+        area = float(np.prod(np.maximum(hi - lo, 1.0)))
+        cell = max(float(np.median(sides)), math.sqrt(area / (MAX_CELLS_PER_PARCEL * max(len(valid), 1))), 1.0)
+        cell = round(cell, 2)
+    cols = int((hi[0] - lo[0]) // cell) + 1
+    rows = int((hi[1] - lo[1]) // cell) + 1
+
+    # пары (ячейка, участок): каждый участок — во все ячейки своего bbox
+    c0 = ((boxes[valid, :2] - lo) // cell).astype(np.int64)
+    c1 = ((boxes[valid, 2:] - lo) // cell).astype(np.int64)
+    spans = c1 - c0 + 1
+    counts = spans[:, 0] * spans[:, 1]
+    owner = np.repeat(np.arange(len(valid)), counts)
+    k = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+    col = c0[owner, 0] + k % spans[owner, 0]
+    row = c0[owner, 1] + k // spans[owner, 0]
+    cell_id = row * cols + col
+    order = np.lexsort((valid[owner], cell_id))
+    offsets = np.zeros(cols * rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(cell_id, minlength=cols * rows), out=offsets[1:])
+
+    index.update({
+        "origin": [float(lo[0]), float(lo[1])],
+        "cell": cell,
+        "cols": cols,
+        "rows": rows,
+        "offsets": offsets.tolist(),
+        "items": valid[owner][order].tolist(),
+        "idtur": [parcels.get("idtur", i) for i in range(len(parcels))],
+        "bbox": np.nan_to_num(boxes).round(2).ravel().tolist(),
+    })
+    if tile_of is not None:
+        index["tile"] = [int(t) for t in tile_of]
+    return index
+
+
+def save_hit_index(path, index):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+
+
+class HitIndex:
+    def __init__(self, index):
+        self.origin = index["origin"]
+        self.cell = index["cell"]
+        self.cols = index["cols"]
+        self.rows = index["rows"]
+        self.offsets = index["offsets"]
+        self.items = index["items"]
+        self.idtur = index["idtur"]
+        self.bbox = index["bbox"]
+        self.tile = index.get("tile")
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def candidates(self, p0, p1):
+        """Номера участков, чей bbox содержит точку (p0, p1)."""
+        col = math.floor((p0 - self.origin[0]) / self.cell)
+        row = math.floor((p1 - self.origin[1]) / self.cell)
+        if not (0 <= col < self.cols and 0 <= row < self.rows):
+            return []
+        c = row * self.cols + col
+        out = []
+        for i in self.items[self.offsets[c]:self.offsets[c + 1]]:
+            b = self.bbox[4 * i:4 * i + 4]
+            if b[0] <= p0 <= b[2] and b[1] <= p1 <= b[3]:
+                out.append(i)
+        return out
+
+    def locate(self, p0, p1, rings):
+        """
+        idtur участка под точкой или None. rings(i) — кольцо участка i
+        (пары как в polygon.json); проверяются только кандидаты из ячейки.
+        """
+        point = np.array([[p0, p1]])
+        for i in self.candidates(p0, p1):
+            ring = np.asarray(rings(i), dtype=np.float64)
+            if len(ring) >= 3 and points_in_polygon(point, ring)[0]:
+                return self.idtur[i]
+        return None
@@ -1,7 +1,9 @@
 # FILENAME: kad_coord_mini.py 
-import subprocess
+import json
 import os
 
+from rosreestr_backend import make_backend
+
 # FILENAME: kad_coord_v1.py
 
 # Получаем путь к директории, где находится скрипт
@@ -13,6 +15,22 @@ kadastr_numbers = [
     "71:09:020201:4763"
 ]
 
+# Бэкенд — как у get_geojson_by_list.py, из config.json (downloader.backend):
+# "inprocess" — библиотека rosreestr2coord в этом процессе (одна HTTP-сессия
+# на все номера), "subprocess" — запуск CLI rosreestr2coord на каждый номер
+config_path = os.path.join(base_dir, "config.json")
+downloader_cfg = {}
+if os.path.isfile(config_path):
+    with open(config_path, "r", encoding="utf-8") as f:
+        downloader_cfg = json.load(f).get("downloader", {})
+
+backend = make_backend(
+    downloader_cfg.get("backend", "subprocess"),
+    timeout=downloader_cfg.get("request_timeout", 5),
+    command=downloader_cfg.get("cli_command", "rosreestr2coord"),
+    api_root=downloader_cfg.get("api_root")
+)
+
 for kad_num in kadastr_numbers:
     print(f"Получаем координаты для {kad_num}...")
 
@@ -20,14 +38,13 @@ for kad_num in kadastr_numbers:
     output_file = os.path.join(base_dir, kad_num.replace(":", "_") + ".geojson")
 
     try:
-        # Запускаем утилиту rosreestr2coord
-        result = subprocess.run(
-            ["rosreestr2coord", "-c", kad_num, "-o", output_file],
-            check=True,
-            capture_output=True,
-            text=True
-        )
-        print(f"✅ Успешно сохранено в: {output_file}")
-    except subprocess.CalledProcessError as e:
+        stderr = backend.fetch(kad_num, output_file)
+    except Exception as e:
         print(f"❌ Ошибка при обработке {kad_num}: {e}")
-        print(e.stderr)
+        continue
+
+    if stderr:
+        print(f"❌ Ошибка при обработке {kad_num}:")
+        print(stderr)
+    else:
+        print(f"✅ Успешно сохранено в: {output_file}")
@@ -5,13 +5,23 @@ import math
 import os
 import xml.etree.ElementTree as ET
 from xml.dom import minidom
+import numpy as np
 import matplotlib.pyplot as plt
 
+import affine
+from coord_codec import encode_ring, encoding_header
+from parcel_set import ParcelSet
+from polygon_store import load_parcels, working_source
+
 # ---- НАСТРОЙКИ -------------------------------------------
 CAMERA_HEIGHT = 100.0       # высота камеры
 INPUT_POLYGON_MAIN = "polygon.json"
 INPUT_POLYGON_FILTERED = "filtered_polygon.json"
 OUTPUT_XML = "hotspots_grid.xml"
+# те же хотспоты компактно для загрузки с JS (coord_decoder.js, addEncodedHotspots):
+# ath/atv в тысячных градуса дельтами; None — не писать
+OUTPUT_HOTSPOTS_JSON = "hotspots_grid.json"
+HOTSPOTS_SCALE = 1000
 # -----------------------------------------------------------
 
 
@@ -19,34 +29,20 @@ def get_input_polygon_path():
     if os.path.exists(INPUT_POLYGON_FILTERED):
         print(f"📌 Использую {INPUT_POLYGON_FILTERED}")
         return INPUT_POLYGON_FILTERED
-    print(f"📌 Использую {INPUT_POLYGON_MAIN}")
-    return INPUT_POLYGON_MAIN
-
-
-def load_polygon(path: str) -> list:
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    items = data.get("data")
-    # Нормализуем формат координат: в `stage1_make_polygon.py` при
-    # APPLY_ROTATE_AND_MIRROR=True координаты сохраняются как [y, x].
-    # Для внутренней работы (matplotlib, проекция) удобнее иметь
-    # стандартный порядок [x, y]. Здесь приводим их в этот вид.
-    for item in items:
-        ring = item.get("coordinates", [None])[0]
-        if not ring:
-            continue
-        # swap each pair (stored_y, stored_x) -> (x, y)
-        item["coordinates"][0] = [[pt[1], pt[0]] for pt in ring]
-    return items
+    path = working_source(INPUT_POLYGON_MAIN)
+    print(f"📌 Использую {path}")
+    return path
 
 
-def centroid(coords):
-    xs = [p[0] for p in coords]
-    ys = [p[1] for p in coords]
-    return sum(xs) / len(xs), sum(ys) / len(ys)
+def load_polygon(path: str) -> ParcelSet:
+    # polygon.parcels (отображается в память), polygon.json или TopoJSON
+    # (polygon_topo.json). В `stage1_make_polygon.py` при
+    # APPLY_ROTATE_AND_MIRROR=True координаты в JSON сохраняются как [y, x];
+    # ParcelSet переставляет их при загрузке — внутри всегда [x, y].
+    return load_parcels(path, swap_axes=True)
 
 
-def select_center_polygon(items):
+def select_center_polygon(parcels: ParcelSet):
     """
     Показывает окно matplotlib, позволяет выбрать ОДИН полигон кликом.
     Центроид выбранного полигона возвращается как (cx, cy).
@@ -54,33 +50,27 @@ def select_center_polygon(items):
     fig, ax = plt.subplots()
     plt.title("Выбери полигон под коптером (клик)")
 
-    polygons_xy = []
-
     # рисуем полигоны
-    for item in items:
-        ring = item["coordinates"][0]
-        xs = [p[0] for p in ring]
-        ys = [p[1] for p in ring]
-        ax.fill(xs, ys, alpha=0.2, edgecolor="black")
-        polygons_xy.append((ring, item))
+    for ring in parcels.rings():
+        ax.fill(ring[:, 0], ring[:, 1], alpha=0.2, edgecolor="black")
 
+    centers = parcels.centroids()
     selected_center = {"value": None}
 
     def onclick(event):
         if event.inaxes != ax:
             return
-        x_click, y_click = event.xdata, event.ydata
 
         # ищем полигон, в который попал клик
-        for ring, item in polygons_xy:
-            if point_in_polygon(x_click, y_click, ring):
-                cx, cy = centroid(ring)
-                selected_center["value"] = (cx, cy)
-                print(f"📍 Выбран участок {item.get('names')} (центр {cx:.2f}, {cy:.2f})")
-                plt.close()
-                return
+        i = parcels.locate(event.xdata, event.ydata)
+        if i is None:
+            print("⚠ Клик не попал ни в один участок.")
+            return
 
-        print("⚠ Клик не попал ни в один участок.")
+        cx, cy = float(centers[i, 0]), float(centers[i, 1])
+        selected_center["value"] = (cx, cy)
+        print(f"📍 Выбран участок {parcels.get('names', i)} (центр {cx:.2f}, {cy:.2f})")
+        plt.close()
 
     fig.canvas.mpl_connect("button_press_event", onclick)
     plt.gca().set_aspect("equal")
@@ -89,24 +79,6 @@ def select_center_polygon(items):
     return selected_center["value"]
 
 
-# ---- Классический ray-casting ----------------------------------
-
-def point_in_polygon(x, y, poly):
-    inside = False
-    n = len(poly)
-    x1, y1 = poly[0]
-
-    for i in range(1, n + 1):
-        x2, y2 = poly[i % n]
-        if ((y1 > y) != (y2 > y)):
-            xinters = (y - y1) * (x2 - x1) / (y2 - y1 + 1e-12) + x1
-            if x < xinters:
-                inside = not inside
-        x1, y1 = x2, y2
-
-    return inside
-
-
 # ---- Проекция ---------------------------------------------------
 
 def project_point_to_panorama(x: float, y: float, camera_height: float):
@@ -128,34 +100,37 @@ def project_point_to_panorama(x: float, y: float, camera_height: float):
     return ath, atv
 
 
-# ---- Перевод координат относительно выбранного центра -----------
-
-def shift_polygon(coords, cx, cy):
-    """Сдвигает все точки полигона так, что (cx,cy) → (0,0)."""
-    return [[x - cx, y - cy] for x, y in coords]
+def project_to_panorama(xy, camera_height: float):
+    """То же, что project_point_to_panorama, для массива точек (N, 2) → (ath, atv)."""
+    vx, vz = xy[:, 0], xy[:, 1]
+    r = np.sqrt(vx * vx + camera_height * camera_height + vz * vz)
+    ratio = np.clip(np.divide(camera_height, r, out=np.zeros_like(r), where=r != 0), -1.0, 1.0)
+    ath = np.where(r == 0, 0.0, np.degrees(np.arctan2(vx, vz)))
+    atv = np.degrees(np.arcsin(ratio))
+    return ath, atv
 
 
 # ---- Формирование хотспотов ------------------------------------
 
-def convert_polygons_to_hotspots(items, camera_height, center_pt):
+def convert_polygons_to_hotspots(parcels: ParcelSet, camera_height, center_pt):
     hotspots = []
 
-    for idx, item in enumerate(items, start=1):
-        coords = item["coordinates"][0]
-        if not coords:
-            continue
+    # сдвигаем все вершины относительно выбранного центра и проецируем разом
+    shifted = affine.apply(affine.translation(-center_pt[0], -center_pt[1]), parcels.xy)
+    ath_all, atv_all = project_to_panorama(shifted, camera_height)
 
-        # сдвигаем координаты относительно выбранного центра
-        shifted = shift_polygon(coords, center_pt[0], center_pt[1])
+    for idx in range(1, len(parcels) + 1):
+        start, end = parcels.offsets[idx - 1], parcels.offsets[idx]
+        if start == end:
+            continue
 
         # убираем повтор последней точки
-        ring = shifted
-        if len(ring) > 1 and ring[0] == ring[-1]:
-            ring = ring[:-1]
+        if end - start > 1 and (shifted[start] == shifted[end - 1]).all():
+            end -= 1
 
         # Use `idtur` from polygon.json as canonical hotspot identifier.
         # Fallback to `names`, then to numeric index if missing.
-        raw_id = str(item.get("idtur") or item.get("names") or idx).strip()
+        raw_id = str(parcels.get("idtur", idx - 1) or parcels.get("names", idx - 1) or idx).strip()
         # If the id is purely numeric, zero-fill to 5 digits to get the form hsXXXXX.
         if raw_id.isdigit():
             hs_id = raw_id.zfill(5)
@@ -167,8 +142,7 @@ def convert_polygons_to_hotspots(items, camera_height, center_pt):
             {"name": f"hs{hs_id}", "style": "plot"}
         )
 
-        for x, y in ring:
-            ath, atv = project_point_to_panorama(x, y, camera_height)
+        for ath, atv in zip(ath_all[start:end].tolist(), atv_all[start:end].tolist()):
             ET.SubElement(
                 hotspot,
                 "point",
@@ -201,23 +175,39 @@ def save_hotspots_xml(hotspots, output_path):
         f.write(pretty_str)
 
 
+def save_hotspots_json(hotspots, output_path, scale=HOTSPOTS_SCALE):
+    # точки берутся из тех же элементов, что ушли в XML (3 знака) — при
+    # scale=1000 декодированные ath/atv совпадают с XML
+    items = []
+    for hs in hotspots:
+        points = [(float(p.get("ath")), float(p.get("atv"))) for p in hs.iter("point")]
+        items.append({"name": hs.get("name"), "style": hs.get("style"),
+                      "points": encode_ring(points, scale)})
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"encoding": encoding_header(scale), "hotspots": items},
+                  f, ensure_ascii=False, separators=(",", ":"))
+
+
 # ---- Основной процесс -------------------------------------------
 
 def main():
     polygon_path = get_input_polygon_path()
-    items = load_polygon(polygon_path)
+    parcels = load_polygon(polygon_path)
 
     print("🎯 Выбери участок под коптером…")
-    center_pt = select_center_polygon(items)
+    center_pt = select_center_polygon(parcels)
 
     if center_pt is None:
         print("❌ Центр не выбран — отмена.")
         return
 
-    hotspots = convert_polygons_to_hotspots(items, CAMERA_HEIGHT, center_pt)
+    hotspots = convert_polygons_to_hotspots(parcels, CAMERA_HEIGHT, center_pt)
     save_hotspots_xml(hotspots, OUTPUT_XML)
+    if OUTPUT_HOTSPOTS_JSON:
+        save_hotspots_json(hotspots, OUTPUT_HOTSPOTS_JSON)
 
-    print(f"\n✅ Hotspots saved → {OUTPUT_XML}")
+    print(f"\n✅ Hotspots saved → {OUTPUT_XML}" + (f", {OUTPUT_HOTSPOTS_JSON}" if OUTPUT_HOTSPOTS_JSON else ""))
     print(f"📍 Панорама центрирована относительно точки {center_pt}")
     print(f"📏 Camera height = {CAMERA_HEIGHT} m")
     print(f"📦 Polygons converted: {len(hotspots)}")
@@ -1,10 +1,11 @@
 ﻿# FILENAME: manual_adjust_polygon_good_twistedaxis.py
 
 import os
-import json
-import math
 import matplotlib.pyplot as plt
 
+import affine
+from polygon_store import add_calibration, load_parcels, working_source
+
 def input_float(prompt, default):
     value = input(f"{prompt} (по умолчанию {default}): ").strip()
     if value == "":
@@ -15,26 +16,13 @@ def input_float(prompt, default):
         print("❌ Введите число.")
         return input_float(prompt, default)
 
-def apply_transform(coords, scale, offset_x, offset_y, rotation_deg):
-    angle = math.radians(rotation_deg)
-    cos_a = math.cos(angle)
-    sin_a = math.sin(angle)
-    transformed = []
-    for x, y in coords:
-        x *= scale
-        y *= scale
-        x_rot = x * cos_a - y * sin_a + offset_x
-        y_rot = x * sin_a + y * cos_a + offset_y
-        transformed.append([round(x_rot, 6), round(y_rot, 6)])
-    return transformed
-
-def plot_polygons(data, filename="output_corrected.png"):
+def plot_polygons(parcels, filename="output_corrected.png"):
     fig, ax = plt.subplots()
     all_x, all_y = [], []
 
-    for item in data:
-        coords = item["coordinates"][0]
-        xs, ys = zip(*coords)
+    for ring in parcels.rings():
+        # картинка в порядке пар polygon.json ([y, x]), как и раньше
+        xs, ys = ring[:, 1].tolist(), ring[:, 0].tolist()
         ax.fill(xs, ys, alpha=0.5, edgecolor='black')
         all_x.extend(xs)
         all_y.extend(ys)
@@ -64,34 +52,50 @@ def plot_polygons(data, filename="output_corrected.png"):
     plt.close()
     print(f"✅ Картинка сохранена: {filename}")
 
+def manual_transform(scale=1.0, shift_x=0.0, shift_y=0.0, rotation=0.0):
+    """
+    Ручная подстройка → калибровка в осях [x, y] ParcelSet. Поворот
+    задаётся в осях пар polygon.json ([y, x]); в осях [x, y] это поворот в
+    обратную сторону.
+    """
+    return {"scale": scale, "rotation_deg": -rotation, "offset_x": shift_x, "offset_y": shift_y}
+
+
+def adjust(project_dir, scale=1.0, shift_x=0.0, shift_y=0.0, rotation=0.0, export=None):
+    """
+    Ручная подстройка на стек калибровок проекта, без input().
+    Возвращает (калибровка, выгружен ли polygon.json).
+    """
+    path = os.path.join(project_dir, "polygon.json")
+    if not os.path.isfile(working_source(path)):
+        raise FileNotFoundError(f"{project_dir}: не найден polygon.json")
+    tr = manual_transform(scale, shift_x, shift_y, rotation)
+    return tr, add_calibration(path, "manual", tr, swap_axes=True, export=export)
+
+
 def main():
-    path = os.path.join(os.getcwd(), "polygon.json")
-    if not os.path.isfile(path):
+    project_dir = os.getcwd()
+    source = working_source(os.path.join(project_dir, "polygon.json"))
+    if not os.path.isfile(source):
         print("❌ Не найден polygon.json")
         return
 
-    with open(path, "r", encoding="utf-8") as f:
-        polygon = json.load(f)
+    parcels = load_parcels(source, swap_axes=True)
 
     print("🔧 Введите корректировки:")
     scale     = input_float("Масштаб", 1.0)
-    offset_y  = input_float("Смещение по X", 0.0)
-    offset_x  = input_float("Смещение по Y", 0.0)
+    shift_x   = input_float("Смещение по X", 0.0)
+    shift_y   = input_float("Смещение по Y", 0.0)
     rotation  = input_float("Поворот (в градусах)", 0.0)
 
-    for item in polygon["data"]:
-        coords = item["coordinates"][0]
-        item["coordinates"][0] = apply_transform(coords, scale, offset_x, offset_y, rotation)
-
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(polygon, f, ensure_ascii=False, indent=2)
-    print("💾 Обновлён: polygon.json")
+    try:
+        tr, exported = adjust(project_dir, scale, shift_x, shift_y, rotation)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        return
+    print("💾 Калибровка добавлена в polygon.manifest.json" + (", обновлён polygon.json" if exported else ""))
 
-    plot_polygons(polygon["data"])
+    plot_polygons(parcels.transformed(affine.similarity(tr)))
 
 if __name__ == "__main__":
     main()
-
-
-
-
@@ -0,0 +1,202 @@
+# FILENAME: parcel_set.py
+
+#
+# ParcelSet — участки в памяти одним массивом.
+#
+# Все вершины всех колец лежат в одном непрерывном массиве float64 (N, 2),
+# кольцо i — xy[offsets[i]:offsets[i+1]]; 16 байт на вершину вместо списков
+# из Python-float. Поля участков (idtur, kadastr, price, ...) хранятся по
+# столбцам: attrs[имя][i].
+#
+# Порядок осей один: внутри ParcelSet всегда [x, y] (x — восток, y — север,
+# метры после центрирования). В polygon.json при APPLY_ROTATE_AND_MIRROR пары
+# записаны как [y, x]; перестановка делается только на входе и выходе:
+# from_items / load(..., swap_axes=True) и to_items(swap_axes=True).
+#
+# Операции (габариты, центры, аффинные преобразования, попадание точки,
+# выбор по контуру) векторизованы по всем вершинам сразу.
+
+import numpy as np
+
+import affine
+from geo_topology import load_items
+
+# поле отсутствует у участка (например, у служебных квадратов Stage 2 нет adres)
+MISSING = object()
+
+
+class ParcelSet:
+    __slots__ = ("xy", "offsets", "attrs", "fields")
+
+    def __init__(self, xy, offsets, attrs=None, fields=None):
+        self.xy = np.ascontiguousarray(xy, dtype=np.float64).reshape(-1, 2)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.attrs = attrs if attrs is not None else {}
+        self.fields = fields if fields is not None else list(self.attrs)
+
+    # ---- polygon.json ------------------------------------------
+
+    @classmethod
+    def from_items(cls, items, swap_axes=True):
+        """Список участков формата polygon.json ("data") → ParcelSet."""
+        rings = [item.get("coordinates", [[]])[0] or [] for item in items]
+        offsets = np.zeros(len(rings) + 1, dtype=np.int64)
+        np.cumsum([len(r) for r in rings], out=offsets[1:])
+        xy = np.array([pt[:2] for r in rings for pt in r], dtype=np.float64).reshape(-1, 2)
+        if swap_axes:
+            xy = xy[:, ::-1]
+
+        fields = []
+        for item in items:
+            for key in item:
+                if key != "coordinates" and key not in fields:
+                    fields.append(key)
+        attrs = {key: [item.get(key, MISSING) for item in items] for key in fields}
+        return cls(xy, offsets, attrs, fields)
+
+    @classmethod
+    def load(cls, path, swap_axes=True):
+        """polygon.json, filtered_polygon.json или polygon_topo.json."""
+        return cls.from_items(load_items(path), swap_axes)
+
+    def to_items(self, swap_axes=True, precision=None):
+        """
+        Обратно в список участков polygon.json (coordinates — последним
+        полем, как пишет Stage 1). precision — округление координат.
+        """
+        return list(self.iter_items(swap_axes, precision))
+
+    def iter_items(self, swap_axes=True, precision=None):
+        """То же, что to_items, по одному участку (для потоковой записи)."""
+        xy = self.xy[:, ::-1] if swap_axes else self.xy
+        for i in range(len(self)):
+            item = {}
+            for key in self.fields:
+                value = self.attrs[key][i]
+                if value is not MISSING:
+                    item[key] = value
+            ring = xy[self.offsets[i]:self.offsets[i + 1]].tolist()
+            if precision is not None:
+                ring = [[round(a, precision), round(b, precision)] for a, b in ring]
+            item["coordinates"] = [ring]
+            yield item
+
+    # ---- доступ ------------------------------------------------
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def nbytes(self):
+        return self.xy.nbytes + self.offsets.nbytes
+
+    def ring(self, i):
+        return self.xy[self.offsets[i]:self.offsets[i + 1]]
+
+    def rings(self):
+        return [self.ring(i) for i in range(len(self))]
+
+    def get(self, key, i, default=None):
+        value = self.attrs.get(key, [MISSING] * len(self))[i]
+        return default if value is MISSING else value
+
+    def ring_index(self):
+        """Номер участка для каждой вершины."""
+        return np.repeat(np.arange(len(self)), np.diff(self.offsets))
+
+    def subset(self, indices):
+        """Новый ParcelSet из участков indices (массив номеров или маска)."""
+        indices = np.arange(len(self))[np.asarray(indices)]
+        sizes = np.diff(self.offsets)[indices]
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+        parts = [self.ring(i) for i in indices]
+        xy = np.vstack(parts) if parts else np.empty((0, 2))
+        attrs = {key: [col[i] for i in indices] for key, col in self.attrs.items()}
+        return ParcelSet(xy, offsets, attrs, list(self.fields))
+
+    def with_xy(self, xy):
+        """Те же участки и поля с новыми координатами вершин."""
+        return ParcelSet(xy, self.offsets, self.attrs, self.fields)
+
+    # ---- геометрия ---------------------------------------------
+
+    def bbox(self):
+        """(min_x, min_y, max_x, max_y); нули, если вершин нет."""
+        if not len(self.xy):
+            return 0.0, 0.0, 0.0, 0.0
+        lo = self.xy.min(axis=0)
+        hi = self.xy.max(axis=0)
+        return float(lo[0]), float(lo[1]), float(hi[0]), float(hi[1])
+
+    def ring_bboxes(self):
+        """(min_x, min_y, max_x, max_y) каждого кольца, (n, 4); у пустых — NaN."""
+        out = np.full((len(self), 4), np.nan)
+        sizes = np.diff(self.offsets)
+        nonempty = sizes > 0
+        if nonempty.any():
+            starts = self.offsets[:-1][nonempty]
+            out[nonempty, :2] = np.minimum.reduceat(self.xy, starts, axis=0)
+            out[nonempty, 2:] = np.maximum.reduceat(self.xy, starts, axis=0)
+        return out
+
+    def centroids(self):
+        """Среднее вершин каждого кольца (как в прежних инструментах), (n, 2)."""
+        sizes = np.diff(self.offsets)
+        out = np.zeros((len(self), 2))
+        nonempty = sizes > 0
+        if nonempty.any():
+            sums = np.add.reduceat(self.xy, self.offsets[:-1][nonempty], axis=0)
+            out[nonempty] = sums / sizes[nonempty][:, None]
+        return out
+
+    def transformed(self, matrix):
+        """Аффинная матрица 3×3 (affine) ко всем вершинам разом."""
+        return self.with_xy(affine.apply(matrix, self.xy))
+
+    def locate(self, x, y):
+        """Номер первого участка, внутри которого точка (x, y), или None."""
+        inside = _crossings(self.xy, self.offsets, x, y)
+        hits = np.flatnonzero(inside)
+        return int(hits[0]) if len(hits) else None
+
+    def inside_region(self, region):
+        """Маска участков, у которых ВСЕ вершины внутри контура region."""
+        region = np.asarray(region, dtype=np.float64).reshape(-1, 2)
+        inside = points_in_polygon(self.xy, region)
+        per_ring = np.ones(len(self), dtype=bool)
+        sizes = np.diff(self.offsets)
+        nonempty = sizes > 0
+        if nonempty.any():
+            per_ring[nonempty] = np.logical_and.reduceat(inside, self.offsets[:-1][nonempty])
+        return per_ring
+
+
+def points_in_polygon(points, poly):
+    """Чётно-нечётное правило (ray casting) для многих точек и одного контура."""
+    px = points[:, 0][:, None]
+    py = points[:, 1][:, None]
+    x1, y1 = poly[:, 0], poly[:, 1]
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+    straddle = (y1 > py) != (y2 > py)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        xinters = (py - y1) * (x2 - x1) / (y2 - y1) + x1
+    return ((straddle & (px < xinters)).sum(axis=1) % 2) == 1
+
+
+def _crossings(xy, offsets, x, y):
+    """Для каждого кольца: лежит ли точка (x, y) внутри (ray casting по всем рёбрам сразу)."""
+    n = len(offsets) - 1
+    if not len(xy):
+        return np.zeros(n, dtype=bool)
+    ring_of = np.repeat(np.arange(n), np.diff(offsets))
+    start = offsets[:-1][ring_of]
+    size = np.diff(offsets)[ring_of]
+    nxt = start + (np.arange(len(xy)) - start + 1) % size
+    x1, y1 = xy[:, 0], xy[:, 1]
+    x2, y2 = xy[nxt, 0], xy[nxt, 1]
+    straddle = (y1 > y) != (y2 > y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        xinters = (y - y1) * (x2 - x1) / (y2 - y1) + x1
+    cross = straddle & (x < xinters)
+    return np.bincount(ring_of[cross], minlength=n) % 2 == 1
@@ -0,0 +1,120 @@
+# FILENAME: polygon_derived.py
+
+#
+# Производные файлы проекта, которые строятся из рабочего файла со стеком
+# калибровок:
+#   polygon_topo.json — общие границы участков (geo_topology);
+#   polygon_lod.json  — уровни детализации (simplify.lod_tolerances).
+#
+# Пишутся заново, когда они старше рабочего файла или манифеста: после
+# Stage 1, калибровки (Stage 2, ручная подстройка, batch_calibrate) и
+# отмены/повтора в calibration_stack.py (см. polygon_store.refresh_derived).
+#
+# Дуги строятся по координатам рабочего файла без калибровок, а стек
+# калибровок применяется к дугам — по разу к каждой вершине
+# (geo_topology.transform_arcs). simplify.snap — допуск сведения вершин
+# соседей и Т-образных стыков (м). simplify.topology: "auto" — писать
+# polygon_topo.json, только если в нём меньше вершин, чем в кольцах;
+# true — всегда; false — никогда (уровни детализации строятся по дугам
+# в любом случае).
+
+import json
+import os
+
+import numpy as np
+
+from geo_topology import save_topology, simplify_topology, topology_from_items, transform_arcs, vertex_counts
+from polygon_export import load_config
+
+
+def topo_path(polygon_path):
+    return os.path.join(os.path.dirname(os.path.abspath(polygon_path)), "polygon_topo.json")
+
+
+def lod_path(polygon_path):
+    return os.path.join(os.path.dirname(os.path.abspath(polygon_path)), "polygon_lod.json")
+
+
+def simplify_settings(base_dir):
+    """(метод, допуски) из раздела simplify config.json."""
+    cfg = load_config(base_dir).get("simplify", {})
+    return cfg.get("method", "douglas_peucker"), cfg.get("lod_tolerances", [])
+
+
+def topology_settings(base_dir):
+    """(snap, режим polygon_topo.json) из раздела simplify config.json."""
+    cfg = load_config(base_dir).get("simplify", {})
+    return float(cfg.get("snap", 0.01)), cfg.get("topology", "auto")
+
+
+def is_stale(path, sources):
+    """Файла нет или он старше любого из sources (отсутствующие не в счёт)."""
+    if not os.path.isfile(path):
+        return True
+    return any(os.path.getmtime(path) < os.path.getmtime(p) for p in sources if os.path.isfile(p))
+
+
+def needs_update(polygon_path, sources):
+    base_dir = os.path.dirname(os.path.abspath(polygon_path))
+    _, tolerances = simplify_settings(base_dir)
+    _, mode = topology_settings(base_dir)
+    # в режиме "auto" polygon_topo.json может быть не записан — тогда
+    # свежесть определяет polygon_lod.json
+    if mode is True or mode == "auto" and not tolerances:
+        if is_stale(topo_path(polygon_path), sources):
+            return True
+    return bool(tolerances) and is_stale(lod_path(polygon_path), sources)
+
+
+def write_topology(path, items, arcs, refs, mode):
+    """
+    polygon_topo.json: общие границы участков записаны один раз (TopoJSON).
+    В режиме "auto" — только если дуги меньше колец; иначе прежний файл
+    удаляется. True — если записан.
+    """
+    in_arcs, in_rings = vertex_counts(arcs, refs)
+    print(f"🧵 Общие границы: {len(arcs)} дуг, вершин {in_arcs} вместо {in_rings}")
+    if mode is True or mode == "auto" and in_arcs < in_rings:
+        save_topology(path, items, arcs, refs)
+        return True
+    if os.path.isfile(path):
+        os.remove(path)
+    if mode == "auto":
+        print("ℹ️ polygon_topo.json не записан — дуги не меньше колец")
+    return False
+
+
+def write_lods(path, items, arcs, refs, method, tolerances):
+    """polygon_lod.json: для каждого участка кольца всех уровней детализации."""
+    # упрощаются дуги, а не кольца: у соседей общая граница упрощается
+    # одинаково, без щелей и наложений
+    levels = simplify_topology(arcs, refs, tolerances, method)
+    data = [
+        {"idtur": item["idtur"], "lods": [np.round(level[i], 6).tolist() for level in levels]}
+        for i, item in enumerate(items)
+    ]
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"method": method, "tolerances": tolerances, "data": data}, f, ensure_ascii=False)
+
+    sizes = [sum(len(it["lods"][k]) for it in data) for k in range(len(tolerances))]
+    print("🔻 Уровни детализации: " + ", ".join(
+        f"{tol} → {n} точек" for tol, n in zip(tolerances, sizes)))
+
+
+def write_derived(polygon_path, items, matrix=None):
+    """
+    Оба файла по участкам items (как в polygon.json, без калибровок) и
+    матрице стека калибровок matrix для пар в порядке polygon.json.
+    """
+    base_dir = os.path.dirname(os.path.abspath(polygon_path))
+    method, tolerances = simplify_settings(base_dir)
+    snap, mode = topology_settings(base_dir)
+    if mode is False and not tolerances:
+        return
+    arcs, refs = topology_from_items(items, snap)
+    arcs = transform_arcs(arcs, matrix)
+    if mode is not False:
+        write_topology(topo_path(polygon_path), items, arcs, refs, mode)
+    if tolerances:
+        write_lods(lod_path(polygon_path), items, arcs, refs, method, tolerances)
@@ -0,0 +1,165 @@
+# FILENAME: polygon_export.py
+
+#
+# Экспорт участков в polygon.json формата Yandex карты.
+#
+# Участки пишутся в файл по одному, по мере обхода: весь ответ в памяти не
+# собирается, пиковая память не зависит от числа участков. Параллельно тот
+# же поток сжимается в соседние polygon.json.gz / polygon.json.br — веб-сервер
+# отдаёт их как есть (gzip_static / brotli_static), без сжатия на лету.
+#
+# Настройки — секция "export" в config.json:
+#   minify     — без отступов и пробелов (по умолчанию false: как раньше, indent=2);
+#   precision  — знаков после запятой в координатах (null — как в рабочем файле,
+#                без округления; калибровки не округляют, поэтому обычно 6);
+#   compress   — какие соседние файлы писать: "gz", "br" (нужен пакет brotli);
+#   quantize   — null или число делений на метр (100 — сантиметры): координаты
+#                квантуются и пишутся дельтами по кольцу (coord_codec), в
+#                заголовке "encoding"; на странице их раскрывает coord_decoder.js;
+#   hit_index  — писать рядом polygon.hit.json: сетка для поиска участка под
+#                курсором (hit_index);
+#   tiles      — папка и размеры плиток для export_polygon.py --tiles (polygon_tiles).
+# Соседние файлы, которые не заказаны, удаляются, чтобы сервер не отдал
+# устаревшую версию.
+
+import gzip
+import json
+import os
+
+from coord_codec import encode_item, encoding_header
+from hit_index import build_hit_index, hit_index_path, save_hit_index
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIONS = ("gz", "br")
+DEFAULT_OPTIONS = {"minify": False, "precision": None, "compress": [], "quantize": None, "hit_index": False}
+DEFAULT_TILES = {"dir": "polygon_tiles", "tile_size": 500.0, "max_per_tile": 500}
+
+
+def load_config(base_dir):
+    path = os.path.join(base_dir, "config.json")
+    if not os.path.isfile(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def auto_export(base_dir):
+    """store.export_json из config.json: выгружать ли polygon.json после каждой стадии."""
+    return load_config(base_dir).get("store", {}).get("export_json", True)
+
+
+def export_options(base_dir):
+    """Секция export из config.json поверх значений по умолчанию (без tiles)."""
+    options = dict(DEFAULT_OPTIONS)
+    options.update({k: v for k, v in load_config(base_dir).get("export", {}).items() if k in options})
+    return options
+
+
+def tiles_options(base_dir):
+    """export.tiles из config.json: папка и размеры плиток (polygon_tiles)."""
+    options = dict(DEFAULT_TILES)
+    options.update(load_config(base_dir).get("export", {}).get("tiles", {}))
+    return options
+
+
+class _Sinks:
+    """Пишет один и тот же текст в файл и в его сжатые копии."""
+
+    def __init__(self, path, compress):
+        self.files = [open(path, "wb")]
+        self.brotli = None
+        self.br_file = None
+        if "gz" in compress:
+            # mtime=0 — одинаковый вход даёт одинаковый .gz
+            self.files.append(gzip.GzipFile(path + ".gz", "wb", compresslevel=9, mtime=0))
+        if "br" in compress:
+            self.brotli = brotli.Compressor(quality=11)
+            self.br_file = open(path + ".br", "wb")
+
+    def write(self, text):
+        data = text.encode("utf-8")
+        for f in self.files:
+            f.write(data)
+        if self.brotli is not None:
+            self.br_file.write(self.brotli.process(data))
+
+    def close(self):
+        for f in self.files:
+            f.close()
+        if self.brotli is not None:
+            self.br_file.write(self.brotli.finish())
+            self.br_file.close()
+
+
+def _round_item(item, precision):
+    item = dict(item)
+    item["coordinates"] = [[[round(a, precision), round(b, precision)] for a, b in ring]
+                           for ring in item["coordinates"]]
+    return item
+
+
+def write_polygon_json(path, items, count, minify=False, precision=None, compress=(), quantize=None):
+    """
+    {"inc": count, "data": [...]} в path, участки из итератора items по
+    одному. Без minify результат совпадает с json.dump(..., indent=2).
+    quantize — кодирование координат дельтами (precision тогда не нужен).
+    Возвращает расширения записанных сжатых копий.
+    """
+    compress = [c for c in compress if c in COMPRESSIONS]
+    if "br" in compress and brotli is None:
+        print("⚠️ Пакет brotli не установлен — polygon.json.br не записан")
+        compress.remove("br")
+    for ext in COMPRESSIONS:
+        if ext not in compress and os.path.isfile(path + "." + ext):
+            os.remove(path + "." + ext)
+
+    opts = {"ensure_ascii": False}
+    opts.update({"separators": (",", ":")} if minify else {"indent": 2})
+    wrapper = {"inc": count}
+    if quantize:
+        wrapper["encoding"] = encoding_header(quantize)
+    wrapper["data"] = []
+    # обёртка с пустым data режется по "[]": участки пишутся между половинами
+    empty = json.dumps(wrapper, **opts)
+    cut = empty.rindex("[]") + 1
+    if minify:
+        head, sep, tail = empty[:cut], ",", empty[cut:]
+    else:
+        head, sep, tail = empty[:cut] + "\n", ",\n", "\n  " + empty[cut:]
+
+    out = _Sinks(path, compress)
+    try:
+        first = True
+        for item in items:
+            if quantize:
+                item = encode_item(item, quantize)
+            elif precision is not None:
+                item = _round_item(item, precision)
+            text = json.dumps(item, **opts)
+            if not minify:
+                text = "    " + text.replace("\n", "\n    ")
+            out.write((head if first else sep) + text)
+            first = False
+        out.write(empty if first else tail)
+    finally:
+        out.close()
+    return compress
+
+
+def export_json(parcels, polygon_path, swap_axes, hit_index=False, **options):
+    """
+    Экспорт для Yandex карты: polygon.json (и сжатые копии, индекс поиска) из
+    ParcelSet. Без hit_index индекс прежнего экспорта удаляется — он уже не
+    соответствует polygon.json.
+    """
+    written = write_polygon_json(polygon_path, parcels.iter_items(swap_axes), len(parcels), **options)
+    path = hit_index_path(polygon_path)
+    if hit_index:
+        save_hit_index(path, build_hit_index(parcels, swap_axes))
+    elif os.path.isfile(path):
+        os.remove(path)
+    return written
@@ -0,0 +1,176 @@
+# FILENAME: polygon_manifest.py
+
+#
+# Манифест polygon.json: из каких файлов собран черновик и что с ним
+# сделали после Stage 1. Лежит рядом: polygon.manifest.json.
+#
+#   origin       — центр (EPSG:3857), вычтенный из координат при сборке;
+#   tolerance    — допуск очистки точек;
+#   swap_axes    — записаны ли координаты как [y, x] (APPLY_ROTATE_AND_MIRROR);
+#   files        — {относительный путь: {size, mtime, sha256, kadastr}};
+#   calibration  — стек калибровок после Stage 1 (stage2_transform.py,
+#                  manual_adjust_polygon.py), по порядку;
+#   baked        — сколько первых калибровок уже вписано в координаты
+#                  рабочего файла (проекты версии 1, где калибровка
+#                  переписывала polygon.json); остальные — ленивые;
+#   redo         — отменённые калибровки (undo), последняя — сверху.
+#
+# Рабочий файл хранит геометрию Stage 1 без потерь; ленивая часть стека
+# собирается в одну матрицу (affine) и применяется при чтении и экспорте
+# (stack_matrix). Калибровка, отмена и повтор меняют только манифест.
+#
+# Stage 1 добавляет новые и изменённые участки с тем же origin; вписанную
+# часть стека (baked) новое кольцо проходит теми же матрицами, что и
+# остальные, — с точностью до бита.
+
+import json
+import os
+
+import numpy as np
+
+import affine
+from download_cache import file_sha256
+
+MANIFEST_VERSION = 2
+
+
+def manifest_path(polygon_path):
+    root, _ = os.path.splitext(polygon_path)
+    return root + ".manifest.json"
+
+
+def load_manifest(polygon_path):
+    """Манифест или None, если его нет или он не читается."""
+    try:
+        with open(manifest_path(polygon_path), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") == 1:
+        # в версии 1 все калибровки уже переписали координаты
+        manifest.update({"version": MANIFEST_VERSION, "baked": len(manifest["calibration"]), "redo": []})
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(polygon_path, manifest):
+    path = manifest_path(polygon_path)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def new_manifest(origin, tolerance, swap_axes):
+    return {
+        "version": MANIFEST_VERSION,
+        "origin": [origin[0], origin[1]],
+        "tolerance": tolerance,
+        "swap_axes": swap_axes,
+        "files": {},
+        "calibration": [],
+        "baked": 0,
+        "redo": []
+    }
+
+
+def file_entry(path, kadastr):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime": st.st_mtime, "sha256": file_sha256(path), "kadastr": kadastr}
+
+
+def file_changed(path, old):
+    """
+    True, если файла нет в манифесте или его содержимое изменилось.
+    Если изменился только mtime (файл перекачан тем же), запись old
+    обновляется на месте, чтобы в следующий раз не считать хэш.
+    """
+    if not old:
+        return True
+    st = os.stat(path)
+    if old.get("size") == st.st_size and old.get("mtime") == st.st_mtime:
+        return False
+    if file_sha256(path) != old.get("sha256"):
+        return True
+    old["mtime"] = st.st_mtime
+    return False
+
+
+def record_calibration(polygon_path, source, transform, swap_axes, baked=False):
+    """
+    Кладёт трансформацию на стек калибровок (если манифест есть); стек
+    повтора очищается. transform: {"scale", "rotation_deg", "offset_x",
+    "offset_y"} или {"matrix": 3×3} (аффинная, проективная); swap_axes —
+    задана ли она для пар [x, y], переставленных из [y, x]. baked — она уже
+    вписана в координаты рабочего файла.
+    """
+    manifest = load_manifest(polygon_path)
+    if manifest is None:
+        return False
+    entry = {"source": source, "swap_axes": swap_axes}
+    keys = ("matrix",) if "matrix" in transform else ("scale", "rotation_deg", "offset_x", "offset_y")
+    entry.update({k: transform[k] for k in keys})
+    manifest["calibration"].append(entry)
+    manifest["redo"] = []
+    if baked:
+        manifest["baked"] = len(manifest["calibration"])
+    save_manifest(polygon_path, manifest)
+    return True
+
+
+def undo_calibration(polygon_path):
+    """Снимает последнюю ленивую калибровку на стек повтора. Снятая запись или None."""
+    manifest = load_manifest(polygon_path)
+    if manifest is None or len(manifest["calibration"]) <= manifest["baked"]:
+        return None
+    entry = manifest["calibration"].pop()
+    manifest["redo"].append(entry)
+    save_manifest(polygon_path, manifest)
+    return entry
+
+
+def redo_calibration(polygon_path):
+    """Возвращает на стек последнюю отменённую калибровку. Запись или None."""
+    manifest = load_manifest(polygon_path)
+    if manifest is None or not manifest["redo"]:
+        return None
+    entry = manifest["redo"].pop()
+    manifest["calibration"].append(entry)
+    save_manifest(polygon_path, manifest)
+    return entry
+
+
+def mark_baked(polygon_path):
+    """Весь текущий стек вписан в координаты рабочего файла."""
+    manifest = load_manifest(polygon_path)
+    if manifest is None:
+        return
+    manifest["baked"] = len(manifest["calibration"])
+    save_manifest(polygon_path, manifest)
+
+
+def calibration_matrix(tr):
+    """Матрица записи калибровки для пар в порядке polygon.json."""
+    m = np.array(tr["matrix"], dtype=np.float64) if "matrix" in tr else affine.similarity(tr)
+    return affine.swap_axes(m) if tr.get("swap_axes") else m
+
+
+def stack_matrix(manifest):
+    """
+    Ленивая часть стека одной матрицей для осей [x, y] рабочего файла
+    (ParcelSet); None, если применять нечего.
+    """
+    pending = manifest["calibration"][manifest["baked"]:]
+    if not pending:
+        return None
+    m = affine.compose(*(calibration_matrix(tr) for tr in pending))
+    return affine.swap_axes(m) if manifest["swap_axes"] else m
+
+
+def apply_calibration(coords, calibration):
+    """Прогоняет кольцо (как оно лежит в polygon.json) через цепочку калибровок."""
+    xy = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    for tr in calibration:
+        xy = affine.apply(calibration_matrix(tr), xy)
+    return xy.tolist()
@@ -0,0 +1,392 @@
+# FILENAME: polygon_store.py
+
+#
+# Рабочий формат пайплайна: polygon.parcels — двоичный файл рядом с
+# polygon.json. Stage 1, Stage 2 и ручная подстройка передают участки друг
+# другу через него; polygon.json для Yandex карты — отдельный шаг экспорта
+# (polygon_export, export_polygon.py).
+#
+# Файл открывается без разбора: массивы отображаются в память (np.memmap),
+# читается только короткий заголовок.
+#
+#   8 байт    — MAGIC
+#   8 байт    — длина заголовка (uint64, little-endian)
+#   заголовок — JSON: число участков и вершин, swap_axes, порядок полей,
+#               виды столбцов и расположение массивов
+#   данные    — массивы, каждый с границы 8 байт (смещения от начала данных):
+#     xy               float64 (N, 2) — вершины в осях [x, y], как в ParcelSet
+#     offsets          int64 (n + 1)  — кольцо i = xy[offsets[i]:offsets[i+1]]
+#     col/<поле>       int64 (n)      — целочисленные поля (id)
+#     col/<поле>/index int64 (n + 1) + col/<поле> uint8 — остальные поля:
+#                      значения в JSON подряд; пустой отрезок — поля у
+#                      участка нет. Разбирается только то, что прочитано.
+#
+# swap_axes в заголовке — порядок пар при экспорте в polygon.json ([y, x] при
+# APPLY_ROTATE_AND_MIRROR); внутри файла оси всегда [x, y].
+#
+# Координаты — геометрия Stage 1; калибровки Stage 2 и ручной подстройки
+# лежат стеком в манифесте (polygon_manifest) и применяются при чтении
+# (load_parcels, load_working) и экспорте. add_calibration только дописывает
+# стек — файл участков не переписывается.
+#
+# polygon.json иногда правят руками (цена, статус). Манифест помнит размер и
+# mtime последнего экспорта (mark_exported); если polygon.json с тех пор
+# изменился, sync_edits переносит поля участков в рабочий файл до того, как
+# его прочитают или выгрузят заново.
+
+import json
+import os
+
+import numpy as np
+
+import affine
+from geo_topology import load_items
+from parcel_set import MISSING, ParcelSet
+from polygon_derived import needs_update, write_derived
+from polygon_export import auto_export, export_json, export_options
+from polygon_manifest import (
+    load_manifest, manifest_path, mark_baked, new_manifest, record_calibration, save_manifest, stack_matrix
+)
+
+MAGIC = b"PARCELS1"
+STORE_VERSION = 1
+STORE_EXT = ".parcels"
+ALIGN = 8
+
+
+def store_path(polygon_path):
+    """polygon.json → polygon.parcels рядом."""
+    root, _ = os.path.splitext(polygon_path)
+    return root + STORE_EXT
+
+
+def is_store(path):
+    return path.endswith(STORE_EXT)
+
+
+def working_source(polygon_path):
+    """
+    Рабочий файл, если он есть, иначе сам polygon.json. Правки polygon.json
+    после последнего экспорта сначала переносятся в рабочий файл (sync_edits).
+    """
+    path = store_path(polygon_path)
+    if not os.path.isfile(path):
+        return polygon_path
+    sync_edits(polygon_path)
+    return path
+
+
+def _file_stamp(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def mark_exported(polygon_path):
+    """Запоминает в манифесте размер и mtime только что выгруженного polygon.json."""
+    manifest = load_manifest(polygon_path)
+    if manifest is None or not os.path.isfile(polygon_path):
+        return
+    manifest["exported"] = _file_stamp(polygon_path)
+    # mtime манифеста — время изменения стека и файлов: производные файлы
+    # (refresh_derived) из-за одной отметки экспорта не устаревают
+    st = os.stat(manifest_path(polygon_path))
+    save_manifest(polygon_path, manifest)
+    os.utime(manifest_path(polygon_path), ns=(st.st_atime_ns, st.st_mtime_ns))
+
+
+def sync_edits(polygon_path):
+    """
+    polygon.json правили руками (цена, статус, ...) после последнего
+    экспорта — поля участков переносятся в рабочий файл по id, иначе
+    следующий экспорт их затрёт. Координаты не переносятся: они считаются
+    из рабочего файла и стека калибровок. Число изменённых участков.
+    """
+    path = store_path(polygon_path)
+    manifest = load_manifest(polygon_path)
+    if (manifest is None or not manifest.get("exported")
+            or not os.path.isfile(path) or not os.path.isfile(polygon_path)
+            or _file_stamp(polygon_path) == manifest["exported"]):
+        return 0
+    try:
+        edited = {item.get("id"): item for item in load_items(polygon_path)}
+    except (ValueError, KeyError, TypeError) as e:
+        print(f"⚠️ {polygon_path} не читается ({e}) — ручные правки не перенесены")
+        return 0
+
+    parcels, header = open_store(path, mmap=False)
+    fields = list(parcels.fields)
+    attrs = {key: list(parcels.attrs[key]) for key in fields}
+    changed = 0
+    for i, pid in enumerate(attrs.get("id", [])):
+        item = edited.get(pid)
+        if item is None:
+            continue
+        for key in item:
+            if key != "coordinates" and key not in attrs:
+                fields.append(key)
+                attrs[key] = [MISSING] * len(parcels)
+        new = {key: item.get(key, MISSING) for key in fields}
+        if any(attrs[key][i] != new[key] for key in fields):
+            for key in fields:
+                attrs[key][i] = new[key]
+            changed += 1
+    if changed:
+        save_store(path, ParcelSet(parcels.xy, parcels.offsets, attrs, fields), header["swap_axes"])
+        print(f"✏️ Ручные правки polygon.json перенесены в polygon.parcels (участков: {changed};"
+              " координаты — из рабочего файла)")
+    mark_exported(polygon_path)
+    return changed
+
+
+class IntColumn:
+    """Целочисленное поле: массив int64 (в т.ч. отображённый в память)."""
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, i):
+        return int(self.data[i])
+
+    def __iter__(self):
+        return iter(self.data.tolist())
+
+
+class JsonColumn:
+    """Поле любого вида: JSON-значения подряд, разбираются при обращении."""
+    __slots__ = ("index", "blob")
+
+    def __init__(self, index, blob):
+        self.index = index
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.index) - 1
+
+    def __getitem__(self, i):
+        a, b = int(self.index[i]), int(self.index[i + 1])
+        if a == b:
+            return MISSING
+        return json.loads(self.blob[a:b].tobytes())
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+def _encode_column(values):
+    """(вид, {суффикс: массив}) для столбца значений."""
+    if isinstance(values, IntColumn):
+        return "int", {"": np.asarray(values.data, dtype="<i8")}
+    values = list(values)
+    if values and all(type(v) is int and -2 ** 63 <= v < 2 ** 63 for v in values):
+        return "int", {"": np.array(values, dtype="<i8")}
+    parts = [b"" if v is MISSING else
+             json.dumps(v, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+             for v in values]
+    index = np.zeros(len(parts) + 1, dtype="<i8")
+    np.cumsum([len(p) for p in parts], out=index[1:])
+    return "json", {"/index": index, "": np.frombuffer(b"".join(parts), dtype=np.uint8)}
+
+
+def save_store(path, parcels, swap_axes):
+    """ParcelSet → polygon.parcels (через временный файл)."""
+    arrays = {
+        "xy": np.ascontiguousarray(parcels.xy, dtype="<f8"),
+        "offsets": np.ascontiguousarray(parcels.offsets, dtype="<i8"),
+    }
+    columns = {}
+    for key in parcels.fields:
+        kind, parts = _encode_column(parcels.attrs[key])
+        columns[key] = kind
+        for suffix, arr in parts.items():
+            arrays[f"col/{key}{suffix}"] = arr
+
+    layout = {}
+    pos = 0
+    for name, arr in arrays.items():
+        layout[name] = [pos, arr.dtype.str, list(arr.shape)]
+        pos += -(-arr.nbytes // ALIGN) * ALIGN
+
+    header = json.dumps({
+        "version": STORE_VERSION,
+        "count": len(parcels),
+        "vertices": len(parcels.xy),
+        "swap_axes": swap_axes,
+        "fields": list(parcels.fields),
+        "columns": columns,
+        "arrays": layout,
+    }, ensure_ascii=False).encode("utf-8")
+    start = -(-(16 + len(header)) // ALIGN) * ALIGN
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.uint64(len(header)).tobytes())
+        f.write(header)
+        f.write(b"\0" * (start - 16 - len(header)))
+        for name, arr in arrays.items():
+            data = arr.tobytes()
+            f.write(data)
+            f.write(b"\0" * (-len(data) % ALIGN))
+    os.replace(tmp, path)
+
+
+def read_header(path):
+    with open(path, "rb") as f:
+        if f.read(8) != MAGIC:
+            raise ValueError(f"{path}: не файл участков")
+        size = int(np.frombuffer(f.read(8), dtype="<u8")[0])
+        header = json.loads(f.read(size).decode("utf-8"))
+    if header.get("version") != STORE_VERSION:
+        raise ValueError(f"{path}: неизвестная версия {header.get('version')}")
+    header["data_start"] = -(-(16 + size) // ALIGN) * ALIGN
+    return header
+
+
+def open_store(path, mmap=True):
+    """
+    polygon.parcels → (ParcelSet, заголовок). mmap=True — массивы
+    отображаются в память (только чтение); mmap=False — файл читается
+    целиком одним куском и не остаётся открытым (для тех, кто потом
+    перезаписывает этот же файл: в Windows отображённый файл не заменить).
+    """
+    header = read_header(path)
+    if mmap:
+        buf = np.memmap(path, dtype=np.uint8, mode="r")
+    else:
+        buf = np.fromfile(path, dtype=np.uint8)
+    start = header["data_start"]
+
+    def array(name):
+        pos, dtype, shape = header["arrays"][name]
+        dtype = np.dtype(dtype)
+        count = int(np.prod(shape, dtype=np.int64))
+        a = start + pos
+        return buf[a:a + count * dtype.itemsize].view(dtype).reshape(shape)
+
+    attrs = {}
+    for key in header["fields"]:
+        if header["columns"][key] == "int":
+            attrs[key] = IntColumn(array(f"col/{key}"))
+        else:
+            attrs[key] = JsonColumn(array(f"col/{key}/index"), array(f"col/{key}"))
+    parcels = ParcelSet(array("xy"), array("offsets"), attrs, list(header["fields"]))
+    return parcels, header
+
+
+def with_calibration(path, parcels):
+    """
+    ParcelSet рабочего файла path с ленивой частью стека калибровок
+    манифеста (новый массив вершин); без калибровок — тот же ParcelSet.
+    """
+    manifest = load_manifest(path)
+    m = stack_matrix(manifest) if manifest is not None else None
+    return parcels if m is None else parcels.transformed(m)
+
+
+def load_parcels(path, swap_axes=True, mmap=True, calibrated=True):
+    """
+    ParcelSet из polygon.parcels, polygon.json или polygon_topo.json.
+    swap_axes — только для JSON: в рабочем файле оси уже [x, y].
+    calibrated=False — координаты рабочего файла как есть, без стека
+    калибровок (JSON — всегда как есть: он уже выгружен откалиброванным).
+    """
+    if is_store(path):
+        parcels = open_store(path, mmap)[0]
+        return with_calibration(path, parcels) if calibrated else parcels
+    return ParcelSet.load(path, swap_axes)
+
+
+def load_working(polygon_path, calibrated=True):
+    """Участки проекта списком polygon.json ("data") — из рабочего файла, если он есть."""
+    path = working_source(polygon_path)
+    if is_store(path):
+        parcels, header = open_store(path, mmap=False)
+        if calibrated:
+            parcels = with_calibration(path, parcels)
+        return parcels.to_items(header["swap_axes"])
+    return load_items(path)
+
+
+def save_working(polygon_path, items, swap_axes, export=None):
+    """Участки списком polygon.json → save_parcels."""
+    return save_parcels(polygon_path, ParcelSet.from_items(items, swap_axes), swap_axes, export)
+
+
+def save_parcels(polygon_path, parcels, swap_axes, export=None):
+    """
+    Записывает ParcelSet в рабочий файл и выгружает polygon.json (с
+    настройками export), если export (None — по store.export_json).
+    True — если выгружен.
+    """
+    save_store(store_path(polygon_path), parcels, swap_axes)
+    return export_working(polygon_path, export)
+
+
+def refresh_derived(polygon_path):
+    """
+    polygon_topo.json и polygon_lod.json (polygon_derived) заново, если они
+    старше рабочего файла или манифеста. True — если переписаны.
+    """
+    path = store_path(polygon_path)
+    if not os.path.isfile(path) or not needs_update(polygon_path, [path, manifest_path(polygon_path)]):
+        return False
+    # дуги — по координатам без калибровок, стек применяется к дугам
+    parcels, header = open_store(path, mmap=False)
+    manifest = load_manifest(path)
+    m = stack_matrix(manifest) if manifest is not None else None
+    if m is not None and header["swap_axes"]:
+        m = affine.swap_axes(m)
+    write_derived(polygon_path, parcels.to_items(header["swap_axes"]), m)
+    return True
+
+
+def export_working(polygon_path, export=None):
+    """
+    Выгружает рабочий файл в polygon.json со стеком калибровок, если export
+    (None — по store.export_json). True — если выгружен. Производные файлы
+    (refresh_derived) обновляются в любом случае — стек мог измениться.
+    Ручные правки polygon.json перед этим переносятся в рабочий файл.
+    """
+    base_dir = os.path.dirname(os.path.abspath(polygon_path))
+    if export is None:
+        export = auto_export(base_dir)
+    path = store_path(polygon_path)
+    if not os.path.isfile(path):
+        return False
+    sync_edits(polygon_path)
+    if export:
+        parcels, header = open_store(path)
+        export_json(with_calibration(path, parcels), polygon_path, header["swap_axes"], **export_options(base_dir))
+        mark_exported(polygon_path)
+    refresh_derived(polygon_path)
+    return bool(export)
+
+
+def add_calibration(polygon_path, source, transform, swap_axes, export=None):
+    """
+    Кладёт калибровку на стек манифеста и выгружает polygon.json (как
+    export_working). transform — {"scale", "rotation_deg", "offset_x",
+    "offset_y"} или {"matrix": 3×3} в осях [x, y] ParcelSet; swap_axes —
+    порядок пар polygon.json.
+    Рабочий файл не переписывается. True — если polygon.json выгружен.
+    ValueError — манифест есть, но не читается (повреждён, неизвестная
+    версия): он не перезаписывается.
+    """
+    if not os.path.isfile(manifest_path(polygon_path)):
+        # проект старше манифеста: заводится манифест только под стек;
+        # Stage 1 такой проект соберёт заново (допуск не совпадёт)
+        save_manifest(polygon_path, new_manifest((None, None), None, swap_axes))
+    elif load_manifest(polygon_path) is None:
+        raise ValueError(f"{manifest_path(polygon_path)}: манифест повреждён или неизвестной версии"
+                         " — калибровка не записана")
+    path = store_path(polygon_path)
+    if not os.path.isfile(path):
+        # есть только polygon.json — все прежние калибровки уже в нём
+        save_store(path, ParcelSet.load(polygon_path, swap_axes), swap_axes)
+        mark_baked(polygon_path)
+    record_calibration(polygon_path, source, transform, swap_axes)
+    return export_working(polygon_path, export)
@@ -0,0 +1,155 @@
+# FILENAME: polygon_tiles.py
+
+#
+# Экспорт polygon.json кусками для ленивой загрузки на карте.
+#
+# Участки раскладываются по файлам-плиткам, каждая плитка — обычный
+# {"inc", "data"} (тот же загрузчик на странице, те же id и idtur), и рядом
+# пишется index.json с габаритами плиток: страница грузит только те плитки,
+# чей bbox пересекает видимую область, и первая отрисовка не зависит от
+# общего числа участков.
+#
+# Способы разбиения (в локальной системе Stage 1, по центру участка —
+# каждый участок ровно в одной плитке):
+#   grid      — квадратная сетка со стороной tile_size метров;
+#   quadtree  — квадродерево: ячейка делится на 4, пока в ней больше
+#               max_per_tile участков (плотная застройка — мелкие плитки);
+#   quarter   — по кадастровым кварталам (первые три блока номера).
+#
+# bbox плитки — объединение bbox её участков (а не ячейки разбиения), так что
+# участок, вылезающий за границу ячейки, не пропадёт. Координаты bbox — в
+# порядке пар polygon.json ([y, x] при swap_axes): [min0, min1, max0, max1].
+#
+# index.json:
+#   {"version": 1, "mode": "quadtree", "count": 2998, "bbox": [...],
+#    "tiles": [{"file": "q01.json", "count": 412, "bbox": [...]}, ...]}
+#
+# С hit_index рядом пишется hit.json — один индекс поиска на все плитки, с
+# номером плитки каждого участка (hit_index).
+
+import glob
+import json
+import os
+
+import numpy as np
+
+from hit_index import build_hit_index, save_hit_index
+from polygon_export import write_polygon_json
+
+TILE_MODES = ("grid", "quadtree", "quarter")
+INDEX_NAME = "index.json"
+HIT_NAME = "hit.json"
+INDEX_VERSION = 1
+QUADTREE_MAX_DEPTH = 16
+
+
+def grid_groups(centers, tile_size):
+    """[(имя, номера участков)] по квадратной сетке."""
+    cells = np.floor(centers / tile_size).astype(np.int64)
+    keys, inverse = np.unique(cells, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    return [(f"g{kx}_{ky}", np.flatnonzero(inverse == k)) for k, (kx, ky) in enumerate(keys.tolist())]
+
+
+def quadtree_groups(centers, max_per_tile):
+    """[(имя, номера участков)]: q, q0..q3, q00..; 0 — юго-запад, 1 — юго-восток, 2 — северо-запад, 3 — северо-восток."""
+    out = []
+    if not len(centers):
+        return out
+    lo = centers.min(axis=0)
+    side = float((centers.max(axis=0) - lo).max()) or 1.0
+    stack = [("q", np.arange(len(centers)), lo[0], lo[1], side, 0)]
+    while stack:
+        name, idx, x0, y0, size, depth = stack.pop()
+        if len(idx) <= max_per_tile or depth >= QUADTREE_MAX_DEPTH:
+            out.append((name, idx))
+            continue
+        half = size / 2
+        east = centers[idx, 0] >= x0 + half
+        north = centers[idx, 1] >= y0 + half
+        quadrant = east.astype(int) + 2 * north.astype(int)
+        for q in (3, 2, 1, 0):
+            sub = idx[quadrant == q]
+            if len(sub):
+                stack.append((name + str(q), sub, x0 + half * (q & 1), y0 + half * (q >> 1), half, depth + 1))
+    return out
+
+
+def quarter_groups(parcels, indices):
+    """[(имя, номера участков)] по кадастровому кварталу (02:26:081802 → 02_26_081802)."""
+    groups = {}
+    for i in indices.tolist():
+        kadastr = str(parcels.get("kadastr", i, ""))
+        quarter = "_".join(kadastr.split(":")[:3]) or "unknown"
+        groups.setdefault(quarter, []).append(i)
+    return [(name, np.array(idx)) for name, idx in groups.items()]
+
+
+def _bbox(boxes, swap_axes):
+    box = [float(np.nanmin(boxes[:, 0])), float(np.nanmin(boxes[:, 1])),
+           float(np.nanmax(boxes[:, 2])), float(np.nanmax(boxes[:, 3]))]
+    if swap_axes:
+        box = [box[1], box[0], box[3], box[2]]
+    return [round(v, 6) for v in box]
+
+
+def remove_tiles(out_dir):
+    """Удаляет плитки прежнего экспорта (по его index.json) вместе со сжатыми копиями."""
+    path = os.path.join(out_dir, INDEX_NAME)
+    if not os.path.isfile(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        old = json.load(f)
+    for tile in old.get("tiles", []):
+        for file in glob.glob(os.path.join(out_dir, glob.escape(tile["file"])) + "*"):
+            os.remove(file)
+
+
+def export_tiles(parcels, out_dir, swap_axes, mode="quadtree", tile_size=500.0, max_per_tile=500,
+                 hit_index=False, **options):
+    """
+    Плитки и index.json в out_dir; options — как у write_polygon_json
+    (minify, precision, compress, quantize). Возвращает индекс.
+    """
+    if mode not in TILE_MODES:
+        raise ValueError(f"неизвестный способ разбиения: {mode}")
+    boxes = parcels.ring_bboxes()
+    nonempty = ~np.isnan(boxes[:, 0])
+    centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+
+    keep = np.flatnonzero(nonempty)
+    if mode == "grid":
+        groups = [(name, keep[idx]) for name, idx in grid_groups(centers[keep], tile_size)]
+    elif mode == "quadtree":
+        groups = [(name, keep[idx]) for name, idx in quadtree_groups(centers[keep], max_per_tile)]
+    else:
+        groups = quarter_groups(parcels, keep)
+
+    os.makedirs(out_dir, exist_ok=True)
+    remove_tiles(out_dir)
+
+    tiles = []
+    tile_of = np.full(len(parcels), -1)
+    for name, idx in sorted(groups, key=lambda g: g[0]):
+        idx = np.sort(idx)
+        file = name + ".json"
+        tile = parcels.subset(idx)
+        write_polygon_json(os.path.join(out_dir, file), tile.iter_items(swap_axes), len(tile), **options)
+        tile_of[idx] = len(tiles)
+        tiles.append({"file": file, "count": len(idx), "bbox": _bbox(boxes[idx], swap_axes)})
+
+    index = {
+        "version": INDEX_VERSION,
+        "mode": mode,
+        "count": int(sum(t["count"] for t in tiles)),
+        "bbox": _bbox(boxes[keep], swap_axes) if len(keep) else None,
+        "tiles": tiles,
+    }
+    with open(os.path.join(out_dir, INDEX_NAME), "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+    hit_path = os.path.join(out_dir, HIT_NAME)
+    if hit_index:
+        save_hit_index(hit_path, build_hit_index(parcels, swap_axes, tile_of=tile_of))
+    elif os.path.isfile(hit_path):
+        os.remove(hit_path)
+    return index
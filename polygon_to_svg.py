@@ -4,7 +4,8 @@
 """
 polygon_to_swg.py
 
-Конвертирует `polygon.json` (или `filtered_polygon.json`) в векторный SVG.
+Конвертирует `polygon.json` (или `filtered_polygon.json`, `polygon_topo.json`,
+рабочий `polygon.parcels`) в векторный SVG.
 
 Особенности:
 - Поддержка опционального swap координат (если записи в JSON хранятся как [y,x]).
@@ -17,10 +18,14 @@ polygon_to_swg.py
 """
 from __future__ import annotations
 
-import json
 import math
 import argparse
-from typing import List, Tuple, Dict, Optional
+from typing import Optional
+
+import numpy as np
+
+from parcel_set import ParcelSet
+from polygon_store import load_parcels
 
 # -------------------- Настройки (редактируйте здесь) --------------------
 # По умолчанию рисуем только контуры (без заливки) и без лейблов.
@@ -35,49 +40,17 @@ DEFAULT_SHOW_LABELS = False
 # ------------------------------------------------------------------------
 
 
-def load_polygons(path: str, swap: bool = False) -> List[Dict]:
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    items = data.get("data") or []
-    # normalize coordinates optionally
-    for it in items:
-        coords = it.get("coordinates", [[]])[0]
-        if swap:
-            it["coordinates"][0] = [[pt[1], pt[0]] for pt in coords]
-        else:
-            # ensure numbers
-            it["coordinates"][0] = [[float(pt[0]), float(pt[1])] for pt in coords]
-    return items
-
-
-def bbox_of_items(items: List[Dict]) -> Tuple[float, float, float, float]:
-    minx = miny = float("inf")
-    maxx = maxy = float("-inf")
-    for it in items:
-        for x, y in it.get("coordinates", [[]])[0]:
-            if x < minx:
-                minx = x
-            if y < miny:
-                miny = y
-            if x > maxx:
-                maxx = x
-            if y > maxy:
-                maxy = y
-    if minx == float("inf"):
-        return 0, 0, 0, 0
-    return minx, miny, maxx, maxy
-
-
-def polygon_centroid(coords: List[Tuple[float, float]]) -> Tuple[float, float]:
-    xs = [p[0] for p in coords]
-    ys = [p[1] for p in coords]
-    return sum(xs) / len(xs), sum(ys) / len(ys)
-
-
-def build_svg(items: List[Dict], width: int = DEFAULT_WIDTH, height: Optional[int] = DEFAULT_HEIGHT,
+def load_polygons(path: str, swap: bool = False) -> ParcelSet:
+    # polygon.json или polygon_topo.json (дуги разворачиваются в кольца);
+    # swap — пары записаны как [y,x], внутри ParcelSet всегда [x,y].
+    # В polygon.parcels оси уже [x,y] — swap не нужен.
+    return load_parcels(path, swap_axes=swap)
+
+
+def build_svg(parcels: ParcelSet, width: int = DEFAULT_WIDTH, height: Optional[int] = DEFAULT_HEIGHT,
               padding: int = DEFAULT_PADDING, stroke: str = DEFAULT_STROKE, fill: Optional[str] = DEFAULT_FILL,
               stroke_width: float = DEFAULT_STROKE_WIDTH, show_labels: bool = DEFAULT_SHOW_LABELS) -> str:
-    minx, miny, maxx, maxy = bbox_of_items(items)
+    minx, miny, maxx, maxy = parcels.bbox()
     if maxx - minx == 0 or maxy - miny == 0:
         raise ValueError("Empty or degenerate geometry")
 
@@ -94,35 +67,32 @@ def build_svg(items: List[Dict], width: int = DEFAULT_WIDTH, height: Optional[in
     scale_y = avail_h / (maxy - miny)
     scale = min(scale_x, scale_y)
 
-    # shift so min maps to padding
-    def project(pt):
-        x, y = pt
-        px = (x - minx) * scale + padding
-        # SVG Y goes downwards; keep Y upwards by flipping
-        py = height - ((y - miny) * scale + padding)
-        return px, py
+    # shift so min maps to padding; SVG Y goes downwards, keep Y upwards by flipping
+    def project(xy: np.ndarray) -> np.ndarray:
+        px = (xy[:, 0] - minx) * scale + padding
+        py = height - ((xy[:, 1] - miny) * scale + padding)
+        return np.column_stack((px, py))
+
+    # all vertices are projected at once
+    points = project(parcels.xy).tolist()
+    centers = project(parcels.centroids()).tolist() if show_labels else None
 
     svg_lines = []
     svg_lines.append(f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">')
     svg_lines.append('<rect width="100%" height="100%" fill="white"/>')
 
     # draw polygons
-    for it in items:
-        ring = it.get("coordinates", [[]])[0]
-        if not ring:
+    svg_fill = (fill if fill is not None else "none")
+    for i in range(len(parcels)):
+        start, end = parcels.offsets[i], parcels.offsets[i + 1]
+        if start == end:
             continue
-        points = [project(pt) for pt in ring]
-        pts_str = " ".join(f"{x:.2f},{y:.2f}" for x, y in points)
-        svg_fill = (fill if fill is not None else "none")
+        pts_str = " ".join(f"{x:.2f},{y:.2f}" for x, y in points[start:end])
         svg_lines.append(f'<polygon points="{pts_str}" fill="{svg_fill}" stroke="{stroke}" stroke-width="{stroke_width}" />')
         if show_labels:
-            try:
-                cx, cy = polygon_centroid(ring)
-                px, py = project((cx, cy))
-                label = str(it.get("idtur") or it.get("names") or "")
-                svg_lines.append(f'<text x="{px:.1f}" y="{py:.1f}" font-size="12" text-anchor="middle" fill="#000">{label}</text>')
-            except Exception:
-                pass
+            px, py = centers[i]
+            label = str(parcels.get("idtur", i) or parcels.get("names", i) or "")
+            svg_lines.append(f'<text x="{px:.1f}" y="{py:.1f}" font-size="12" text-anchor="middle" fill="#000">{label}</text>')
 
     svg_lines.append('</svg>')
     return "\n".join(svg_lines)
@@ -143,8 +113,8 @@ def main():
     p.add_argument("--labels", action="store_true", default=DEFAULT_SHOW_LABELS, help="show labels from idtur/names")
     args = p.parse_args()
 
-    items = load_polygons(args.input, swap=args.swap)
-    svg = build_svg(items, width=args.width, height=args.height, padding=args.padding,
+    parcels = load_polygons(args.input, swap=args.swap)
+    svg = build_svg(parcels, width=args.width, height=args.height, padding=args.padding,
                     stroke=args.stroke, fill=(args.fill_color if args.fill_color is not None else None),
                     stroke_width=args.stroke_width, show_labels=args.labels)
     with open(args.output, "w", encoding="utf-8") as f:
@@ -0,0 +1,173 @@
+# FILENAME: rosreestr_backend.py
+
+#
+# Бэкенды загрузки одного участка из росреестра.
+#
+#   subprocess — запуск CLI rosreestr2coord на каждый кадастровый номер
+#                (старое поведение, запасной вариант);
+#   inprocess  — вызов библиотеки rosreestr2coord в текущем процессе через
+#                общую requests.Session с пулом соединений: без старта
+#                интерпретатора, импортов и нового TLS-рукопожатия на каждый
+#                участок.
+#
+# Контракт: backend.fetch(cad_num, out_path) -> str
+#   - результат кладётся в out_path (файл) или в out_path/geojson/<имя>.geojson
+#     (структура каталогов CLI);
+#   - возвращается текст ошибки в стиле stderr CLI ("" — ошибок нет), его
+#     разбирает classify_error() загрузчика;
+#   - исключение означает, что сам запуск не удался.
+# backend.set_pool_size(n) — число потоков загрузчика изменилось на ходу.
+
+import json
+import os
+import shlex
+import ssl
+import subprocess
+
+
+NSPD_ROOT = "https://nspd.gov.ru"
+
+
+class SubprocessBackend:
+    name = "subprocess"
+
+    def __init__(self, command="rosreestr2coord"):
+        # строка ("rosreestr2coord") или список (["python", "rosreestr_stub.py", "cli"])
+        self.command = shlex.split(command) if isinstance(command, str) else list(command)
+
+    def fetch(self, cad_num, out_path):
+        result = subprocess.run(
+            self.command + ["-c", cad_num, "-o", out_path],
+            text=True,
+            capture_output=True
+        )
+        return result.stderr or ""
+
+    def set_pool_size(self, n):
+        # общих соединений нет: каждый запуск CLI — свой процесс
+        pass
+
+
+class InProcessBackend:
+    name = "inprocess"
+
+    def __init__(self, pool_size=4, timeout=5, api_root=None):
+        # импорт здесь, чтобы отсутствие библиотеки не ломало subprocess-режим
+        import requests
+        import urllib3
+        from requests.adapters import HTTPAdapter
+        from rosreestr2coord.parser import Area
+        from rosreestr2coord.request.base_adapter import RequestAdapter
+        from rosreestr2coord.request.request import make_request
+
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+        class LegacyTLSAdapter(HTTPAdapter):
+            # nspd.gov.ru отдаёт цепочку, которую стандартный контекст не
+            # принимает; rosreestr2coord работает с теми же настройками.
+            def init_poolmanager(self, *args, **kwargs):
+                ctx = ssl.create_default_context()
+                ctx.check_hostname = False
+                ctx.verify_mode = ssl.CERT_NONE
+                ctx.set_ciphers("ALL:@SECLEVEL=1")
+                kwargs["ssl_context"] = ctx
+                return super().init_poolmanager(*args, **kwargs)
+
+        class SessionAdapter(RequestAdapter):
+            def __init__(self):
+                self.session = requests.Session()
+                self.pool_size = 0
+                self.mount(pool_size)
+
+            def mount(self, size):
+                # новый адаптер вместо прежнего: запросы в работе дорабатывают
+                # на старом пуле, новые идут через пул нужного размера
+                http = LegacyTLSAdapter(pool_connections=1, pool_maxsize=size, max_retries=0)
+                self.session.mount("https://", http)
+                self.session.mount("http://", http)
+                self.pool_size = size
+
+            def _make_request(self, url, proxy, timeout, headers, method="GET", body=None):
+                if body and isinstance(body, dict):
+                    body = json.dumps(body).encode("utf-8")
+                proxies = {"http": proxy, "https": proxy} if proxy else None
+                resp = self.session.request(
+                    method, url, data=body, headers=headers,
+                    timeout=timeout, verify=False, proxies=proxies
+                )
+                resp.raise_for_status()
+                return resp.json()
+
+            def get_specific_http_error(self):
+                return requests.HTTPError
+
+            def is_specific_error(self, er):
+                return er.response is not None and er.response.status_code == 400
+
+        adapter = SessionAdapter()
+
+        class SessionArea(Area):
+            def _build_url(self, area_type):
+                url = super()._build_url(area_type)
+                # api_root — подмена сервера, например локальный rosreestr_stub.py
+                if api_root:
+                    url = url.replace(NSPD_ROOT, api_root.rstrip("/"), 1)
+                return url
+
+            def make_request(self, url, method="GET", body=None):
+                return make_request(
+                    url=url,
+                    adapter=adapter,
+                    logger=self.logger,
+                    timeout=self.timeout,
+                    headers={"Content-Type": "application/json"},
+                    method=method,
+                    body=body
+                )
+
+        self.area_cls = SessionArea
+        self.adapter = adapter
+        self.session = adapter.session
+        self.timeout = timeout
+
+    def set_pool_size(self, n):
+        """
+        Пул соединений — не меньше n (число потоков поднято через канал
+        управления): иначе лишние потоки открывают соединения, которые
+        пул не сохраняет, и каждый запрос снова делает TLS-рукопожатие.
+        """
+        if n > self.adapter.pool_size:
+            self.adapter.mount(n)
+
+    def fetch(self, cad_num, out_path):
+        try:
+            area = self.area_cls(
+                cad_num,
+                media_path=os.path.dirname(out_path),
+                with_log=False,
+                coord_out="EPSG:4326",
+                timeout=self.timeout
+            )
+        except Exception as e:
+            # ошибки сети/сервера — в тот же текстовый вид, что и у CLI
+            return f"{type(e).__name__}: {getattr(e, 'reason', e)}"
+
+        geojson = area.to_geojson()
+        if not geojson:
+            return "Nothing found: object not found"
+
+        with open(out_path, "w", encoding="utf-8") as f:
+            f.write(geojson)
+        return ""
+
+
+def make_backend(name="subprocess", pool_size=4, timeout=5, command="rosreestr2coord",
+                 api_root=None):
+    if name == "inprocess":
+        try:
+            return InProcessBackend(pool_size=pool_size, timeout=timeout, api_root=api_root)
+        except ImportError as e:
+            print(f"⚠️ inprocess-бэкенд недоступен ({e}) — использую CLI rosreestr2coord")
+    elif name != "subprocess":
+        print(f"⚠️ Неизвестный бэкенд '{name}' — использую CLI rosreestr2coord")
+    return SubprocessBackend(command=command)
@@ -0,0 +1,277 @@
+# FILENAME: rosreestr_stub.py
+
+#
+# Локальная замена росреестра для нагрузочных тестов загрузчика.
+#
+#   serve — HTTP-сервер с тем же API поиска, что и nspd.gov.ru
+#           (/api/geoportal/v2/search/geoportal?query=...). Отдаёт записанные
+#           ранее GeoJSON из --fixtures (по умолчанию output/), добавляет
+#           задержку и по заказу отвечает 429/503 или "не найдено".
+#           Для inprocess-бэкенда: downloader.api_root = "http://127.0.0.1:8800".
+#
+#   cli   — подмена CLI rosreestr2coord (-c CAD -o OUT) для subprocess-бэкенда:
+#           отдельный процесс на каждый номер, запрос к serve, результат в
+#           OUT/geojson/<имя>.geojson, ошибки — в stderr.
+#           downloader.cli_command = "python rosreestr_stub.py cli --server http://127.0.0.1:8800"
+#
+# Исход каждого запроса детерминирован: он зависит от --seed, номера и
+# номера попытки по этому номеру, поэтому последовательный и параллельный
+# прогоны видят одинаковую картину отказов. --max-rps дополнительно
+# имитирует троттлинг: сверх N запросов за последнюю секунду — 429.
+#
+# Пример:
+#   python rosreestr_stub.py serve --latency 80 --jitter 40 --error-rate 0.05 --max-rps 20
+
+import argparse
+import glob
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PORT = 8800
+SEARCH_PATH = "/api/geoportal/v2/search/geoportal"
+
+
+# участок 30×20 м под Уфой — если в --fixtures ничего нет
+SYNTHETIC_FEATURE = {
+    "type": "Feature",
+    "properties": {"options": {"specified_area": 600, "readable_address": "stub"}},
+    "geometry": {"type": "Polygon", "coordinates": [[
+        [56.0, 54.8], [56.00047, 54.8], [56.00047, 54.80018], [56.0, 54.80018], [56.0, 54.8]
+    ]]}
+}
+
+
+def lonlat2xy(lon, lat):
+    # обратное к rosreestr2coord.utils.xy2lonlat: API отдаёт EPSG:3857
+    x = lon * math.pi / 180.0 * 6378137.0
+    y = math.log(math.tan(math.pi / 4 + lat * math.pi / 360.0)) * 6378137.0
+    return [x, y]
+
+
+def load_fixtures(fixtures_dir):
+    fixtures = {}
+    for path in sorted(glob.glob(os.path.join(fixtures_dir, "**", "*.geojson"), recursive=True)):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            feature = data.get("features", [data])[0]
+            cad = feature.get("properties", {}).get("label") or \
+                os.path.splitext(os.path.basename(path))[0].replace("_", ":")
+            fixtures[cad] = feature
+        except Exception as e:
+            print(f"⚠️ Пропущен фикстур {path}: {e}", file=sys.stderr)
+    return fixtures
+
+
+def to_api_feature(feature, cad):
+    geom = feature.get("geometry", {})
+    rings = [[lonlat2xy(lon, lat) for lon, lat in ring] for ring in geom.get("coordinates", [])]
+    props = dict(feature.get("properties", {}))
+    props["label"] = cad
+    return {
+        "type": "Feature",
+        "properties": props,
+        "geometry": {"type": "Polygon", "coordinates": rings}
+    }
+
+
+class StubState:
+    def __init__(self, fixtures, latency, jitter, error_rate, not_found_rate, max_rps, seed):
+        self.fixtures = fixtures
+        self.cads = sorted(fixtures)
+        self.latency = latency / 1000.0
+        self.jitter = jitter / 1000.0
+        self.error_rate = error_rate
+        self.not_found_rate = not_found_rate
+        self.max_rps = max_rps
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Сбрасывает счётчики попыток: следующий прогон увидит те же отказы."""
+        with self.lock:
+            self.attempts = {}
+            self.recent = deque()
+            self.stats = {"requests": 0, "ok": 0, "not_found": 0, "throttled": 0, "errors": 0}
+
+    def decide(self, cad):
+        """(http_status, payload | None, задержка в секундах)."""
+        now = time.monotonic()
+        with self.lock:
+            attempt = self.attempts.get(cad, 0) + 1
+            self.attempts[cad] = attempt
+            self.stats["requests"] += 1
+
+            self.recent.append(now)
+            while self.recent and now - self.recent[0] > 1.0:
+                self.recent.popleft()
+            if self.max_rps and len(self.recent) > self.max_rps:
+                self.stats["throttled"] += 1
+                return 429, None, 0.0
+
+        rng = random.Random(f"{self.seed}:{cad}:{attempt}")
+        delay = max(0.0, self.latency + rng.uniform(-self.jitter, self.jitter))
+        roll = rng.random()
+
+        if roll < self.error_rate:
+            status = 429 if rng.random() < 0.5 else 503
+            with self.lock:
+                self.stats["errors"] += 1
+            return status, None, delay
+
+        # для одного номера "не найдено" не зависит от попытки
+        if random.Random(f"{self.seed}:{cad}:nf").random() < self.not_found_rate:
+            with self.lock:
+                self.stats["not_found"] += 1
+            return 200, {"data": {"features": []}}, delay
+
+        feature = self.fixtures.get(cad)
+        if feature is None and self.cads:
+            # синтетические номера — по кругу из записанных участков
+            feature = self.fixtures[self.cads[sum(map(ord, cad)) % len(self.cads)]]
+        elif feature is None:
+            feature = SYNTHETIC_FEATURE
+        with self.lock:
+            self.stats["ok"] += 1
+        return 200, {"data": {"features": [to_api_feature(feature, cad)]}}, delay
+
+
+def make_handler(state):
+    class StubHandler(BaseHTTPRequestHandler):
+        # keep-alive, как у настоящего сервера: иначе соединение рвётся после
+        # каждого ответа и выигрыш общей сессии inprocess-бэкенда не виден.
+        # Поэтому у каждого ответа (в т.ч. 429/5xx/404) есть Content-Length.
+        protocol_version = "HTTP/1.1"
+
+        def send_json(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urllib.parse.urlparse(self.path)
+            if url.path == "/stats":
+                with state.lock:
+                    self.send_json(200, dict(state.stats))
+                return
+            if url.path != SEARCH_PATH:
+                self.send_json(404, {"error": {"message": "unknown endpoint"}})
+                return
+
+            cad = urllib.parse.parse_qs(url.query).get("query", [""])[0]
+            status, payload, delay = state.decide(cad)
+            if delay:
+                time.sleep(delay)
+            if payload is None:
+                self.send_json(status, {"error": {"message": f"stub HTTP {status}"}})
+            else:
+                self.send_json(status, payload)
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return StubHandler
+
+
+def start_server(fixtures_dir="output", host="127.0.0.1", port=DEFAULT_PORT, latency=0.0,
+                 jitter=0.0, error_rate=0.0, not_found_rate=0.0, max_rps=0, seed=0):
+    """Запускает сервер в фоновом потоке. Возвращает (server, state)."""
+    state = StubState(load_fixtures(fixtures_dir), latency, jitter, error_rate,
+                      not_found_rate, max_rps, seed)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+def run_cli(server, cad, output, timeout):
+    """Ведёт себя как `rosreestr2coord -c CAD -o OUTPUT`."""
+    query = urllib.parse.urlencode({"thematicSearchId": 1, "query": cad, "CRS": "EPSG:4326"})
+    try:
+        with urllib.request.urlopen(f"{server.rstrip('/')}{SEARCH_PATH}?{query}", timeout=timeout) as resp:
+            data = json.loads(resp.read().decode("utf-8"))
+    except urllib.error.HTTPError as e:
+        print(f"HTTP Error {e.code}: {e.reason}", file=sys.stderr)
+        return 1
+    except Exception as e:
+        print(f"Request failed: {e}", file=sys.stderr)
+        return 1
+
+    features = data.get("data", {}).get("features", [])
+    if not features:
+        print("Nothing found: object not found", file=sys.stderr)
+        return 1
+
+    feature = features[0]
+    rings = feature["geometry"]["coordinates"]
+    feature["geometry"]["coordinates"] = [
+        [[x / (math.pi / 180.0) / 6378137.0,
+          (2 * math.atan(math.exp(y / 6378137)) - math.pi / 2) / (math.pi / 180)]
+         for x, y in ring]
+        for ring in rings
+    ]
+
+    directory = os.path.join(output, "geojson")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, cad.replace(":", "_").replace("/", "-") + ".geojson")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(feature, f)
+    print(f"geojson - {path}")
+    return 0
+
+
+def main():
+    p = argparse.ArgumentParser(description="Локальная замена росреестра (сервер и CLI)")
+    sub = p.add_subparsers(dest="mode", required=True)
+
+    ps = sub.add_parser("serve", help="HTTP-сервер с API поиска nspd")
+    ps.add_argument("--fixtures", default="output", help="каталог с записанными .geojson")
+    ps.add_argument("--host", default="127.0.0.1")
+    ps.add_argument("--port", type=int, default=DEFAULT_PORT)
+    ps.add_argument("--latency", type=float, default=0.0, help="задержка ответа, мс")
+    ps.add_argument("--jitter", type=float, default=0.0, help="разброс задержки ±, мс")
+    ps.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 429/503")
+    ps.add_argument("--not-found-rate", type=float, default=0.0, help="доля номеров 'не найдено'")
+    ps.add_argument("--max-rps", type=int, default=0, help="порог троттлинга, запр/с (0 — нет)")
+    ps.add_argument("--seed", type=int, default=0)
+
+    pc = sub.add_parser("cli", help="подмена CLI rosreestr2coord")
+    pc.add_argument("--server", default=f"http://127.0.0.1:{DEFAULT_PORT}")
+    pc.add_argument("--timeout", type=float, default=5)
+    pc.add_argument("-c", "--code", required=True)
+    pc.add_argument("-o", "--output", default=os.path.join(os.getcwd(), "output"))
+
+    args = p.parse_args()
+
+    if args.mode == "cli":
+        sys.exit(run_cli(args.server, args.code, args.output, args.timeout))
+
+    server, state = start_server(
+        args.fixtures, args.host, args.port, args.latency, args.jitter,
+        args.error_rate, args.not_found_rate, args.max_rps, args.seed
+    )
+    print(f"🧪 Заглушка росреестра: http://{args.host}:{args.port} (фикстур: {len(state.fixtures)})")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(f"\n📊 {state.stats}")
+
+
+if __name__ == "__main__":
+    main()
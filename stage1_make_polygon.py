@@ -3,39 +3,32 @@
 import os
 import glob
 import json
-import math
+import argparse
 import matplotlib.pyplot as plt
-from pyproj import Transformer
+
+from geo_normalize import cache_from_config, load_normalized
+from polygon_manifest import (
+    apply_calibration, file_changed, file_entry, load_manifest, new_manifest, save_manifest
+)
+from parcel_set import ParcelSet
+from polygon_store import export_working, load_working, refresh_derived, save_store, store_path, sync_edits
 
 # === Stage 1: загрузка и нормализация участков ===
 
 min_distance_between_points = 2.0
-transformer = Transformer.from_crs("EPSG:4326", "EPSG:3857", always_xy=True)
 base_dir = os.getcwd()
 polygon_path = os.path.join(base_dir, "polygon.json")
+# рабочий файл пайплайна (polygon_store); polygon.json — экспорт из него
+parcels_path = store_path(polygon_path)
 
 APPLY_ROTATE_AND_MIRROR = True
 
+# процессов для разбора GeoJSON (None — по числу ядер)
+INGEST_WORKERS = None
 
-def extract_coords_geojson(filename):
-    with open(filename, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    feature = data.get("features", [data])[0]
-    geom = feature.get("geometry", {})
-    coords = geom.get("coordinates", [[]])[0]
-
-    return [transformer.transform(lon, lat) for lon, lat in coords]
-
-
-def clean_polygon(coords, tolerance=min_distance_between_points):
-    cleaned = []
-    last = None
-    for x, y in coords:
-        if last is None or math.hypot(x - last[0], y - last[1]) >= tolerance:
-            cleaned.append((x, y))
-            last = (x, y)
-    return cleaned
+# Общий кэш нормализованных колец (paths.normalized_dir): его же читают
+# get_interactive_debug_tool.py и потоковый режим загрузчика.
+cache = cache_from_config(base_dir)
 
 
 def plot_polygons(coords_list, filename="output_1_stage.png"):
@@ -53,142 +46,275 @@ def plot_polygons(coords_list, filename="output_1_stage.png"):
     plt.close()
 
 
-# === 1) читаем geojson ===
+def load_records(files):
+    """Нормализованные участки в порядке files: {"ring", "meta"} | None."""
+    # промахи кэша разбираются один раз + пакетная перепроекция, кусками по
+    # процессам; результаты приходят в порядке файлов — id детерминированы
+    results, hits = load_normalized(files, cache, min_distance_between_points, workers=INGEST_WORKERS)
+    if hits:
+        print(f"⚡ Из кэша геометрии: {hits}")
+
+    out = []
+    for file, (rec, err) in zip(files, results):
+        if err:
+            print(f"⚠️ Ошибка в {file}: {err}")
+        out.append(rec if rec and rec["ring"] else None)
+    return out
 
-coords_raw = []
-metadata = []   # {kadastr, price, size, adres}
 
-geojson_files = sorted(glob.glob(os.path.join(base_dir, "**", "*.geojson"), recursive=True))
-print(f"📂 Найдено файлов: {len(geojson_files)}")
+def shift_ring(ring, center_x, center_y):
+    shifted = [(x - center_x, y - center_y) for x, y in ring]
+    shifted.append((shifted[0][0], shifted[0][1]))
+    return shifted
+
 
-for file in geojson_files:
-    try:
-        coords = extract_coords_geojson(file)
-        coords = clean_polygon(coords)
-        if len(coords) < 3:
+def to_stored(coords):
+    """Кольцо (x, y) → пары в том виде, как они лежат в polygon.json."""
+    if APPLY_ROTATE_AND_MIRROR:
+        return [[round(y, 6), round(x, 6)] for x, y in coords]
+    return [[round(x, 6), round(y, 6)] for x, y in coords]
+
+
+def make_item(item_id, idtur, meta, coords):
+    kadastr = meta["kadastr"]
+    # Порядок полей — по алфавиту, coordinates последним
+    return {
+        "adres": meta["adres"],
+        "id": item_id,
+        "idtur": idtur,
+        "kadastr": kadastr,
+        "kadastrurl": f"https://nspd.gov.ru/map?query={kadastr.replace(':','%3A')}&zoom=16&theme_id=1&active_layers=36048",
+        "names": idtur,                          # то же самое
+        "number": str(int(kadastr.split(":")[-1])),  # только последний блок
+        "price": meta["price"],
+        "size": meta["size"],
+        "status": "sale",
+        "coordinates": [coords]
+    }
+
+
+def write_polygon(result_data, manifest):
+    """
+    Рабочий файл, манифест и экспорт polygon.json (если store.export_json).
+    Экспорт — после манифеста: он применяет стек калибровок из манифеста
+    (и обновляет polygon_topo.json / polygon_lod.json). Имена записанных файлов.
+    """
+    save_store(parcels_path, ParcelSet.from_items(result_data, APPLY_ROTATE_AND_MIRROR), APPLY_ROTATE_AND_MIRROR)
+    save_manifest(polygon_path, manifest)
+    exported = export_working(polygon_path)
+    return "polygon.parcels" + (", polygon.json" if exported else "")
+
+
+def relative(file):
+    return os.path.relpath(file, base_dir).replace(os.sep, "/")
+
+
+def full_build(geojson_files):
+    # === 1) читаем geojson ===
+
+    coords_raw = []
+    metadata = []   # {kadastr, price, size, adres}
+    sources = []    # файл каждого участка
+
+    for file, rec in zip(geojson_files, load_records(geojson_files)):
+        if rec is None:
             continue
+        coords_raw.append([tuple(pt) for pt in rec["ring"]])
+        metadata.append(rec["meta"])
+        sources.append(file)
 
-        coords_raw.append(coords)
 
-        with open(file, "r", encoding="utf-8") as f:
-            data = json.load(f)
+    if not coords_raw:
+        print("❌ Нет полигонов.")
+        return
 
-        feature = data.get("features", [data])[0]
-        props = feature.get("properties", {})
-        opts = props.get("options", {})
 
-        kadastr = props.get("label", "")
-        price = ""
-        size = opts.get("specified_area")
-        adres = opts.get("readable_address", "")
+    # === Построение карты повторов последних блоков ===
 
-        metadata.append({
-            "kadastr": kadastr,
-            "price": price,
-            "size": size,
-            "adres": adres
-        })
+    num_groups = {}   # { "468": ["081802", "085802"] }
 
-    except Exception as e:
-        print(f"⚠️ Ошибка в {file}: {e}")
+    for m in metadata:
+        parts = m["kadastr"].split(":")
+        quarter = parts[-2]
+        num = parts[-1]
 
+        if num not in num_groups:
+            num_groups[num] = []
+        num_groups[num].append(quarter)
 
-if not coords_raw:
-    print("❌ Нет полигонов.")
-    exit()
+    # сортируем кварталы в группе
+    for n in num_groups:
+        num_groups[n].sort()
 
 
-# === Построение карты повторов последних блоков ===
+    # === 2) центрирование ===
 
-num_groups = {}   # { "468": ["081802", "085802"] }
+    all_points = [pt for poly in coords_raw for pt in poly]
+    xs, ys = zip(*all_points)
+    center_x = (min(xs) + max(xs)) / 2
+    center_y = (min(ys) + max(ys)) / 2
+    print(f"📌 Центр: ({round(center_x, 2)}, {round(center_y, 2)})")
 
-for m in metadata:
-    parts = m["kadastr"].split(":")
-    quarter = parts[-2]
-    num = parts[-1]
+    coords_shifted = [shift_ring(poly, center_x, center_y) for poly in coords_raw]
 
-    if num not in num_groups:
-        num_groups[num] = []
-    num_groups[num].append(quarter)
 
-# сортируем кварталы в группе
-for n in num_groups:
-    num_groups[n].sort()
+    # === 3) визуализация ===
 
+    plot_polygons(coords_shifted, filename="output_1_stage.png")
 
-# === 2) центрирование ===
 
-all_points = [pt for poly in coords_raw for pt in poly]
-xs, ys = zip(*all_points)
-center_x = (min(xs) + max(xs)) / 2
-center_y = (min(ys) + max(ys)) / 2
-print(f"📌 Центр: ({round(center_x, 2)}, {round(center_y, 2)})")
+    # === 4) формирование polygon.json ===
 
-coords_shifted = []
-for poly in coords_raw:
-    shifted = [(x - center_x, y - center_y) for x, y in poly]
-    shifted.append((shifted[0][0], shifted[0][1]))
-    coords_shifted.append(shifted)
+    result_data = []
 
+    for i, coords in enumerate(coords_shifted):
 
-# === 3) визуализация ===
+        # Разбор кадастра
+        parts = metadata[i]["kadastr"].split(":")
+        quarter = parts[-2]
+        num_str = parts[-1]
 
-plot_polygons(coords_shifted, filename="output_1_stage.png")
+        # === Логика уникальных номеров ===
+        repeat_index = num_groups[num_str].index(quarter)
+        offset = repeat_index * 10000
+        idtur = str(offset + int(num_str)).zfill(5)
 
+        result_data.append(make_item(i + 1, idtur, metadata[i], to_stored(coords)))
 
-# === 4) формирование polygon.json ===
+    # === 5) манифест для инкрементальных пересборок (калибровки сбрасываются) ===
 
-result_data = []
+    manifest = new_manifest((center_x, center_y), min_distance_between_points, APPLY_ROTATE_AND_MIRROR)
+    kadastr_by_file = dict(zip(sources, (m["kadastr"] for m in metadata)))
+    for file in geojson_files:
+        manifest["files"][relative(file)] = file_entry(file, kadastr_by_file.get(file))
 
-for i, coords in enumerate(coords_shifted):
+    written = write_polygon(result_data, manifest)
 
-    meta = metadata[i]
-    kadastr = meta["kadastr"]
-    price = meta["price"]
-    size = meta["size"]
-    adres = meta["adres"]
-
-    # Разбор кадастра
-    parts = kadastr.split(":")
-    quarter = parts[-2]
-    num_str = parts[-1]
-    num_int = int(num_str)
-
-    # === Логика уникальных номеров ===
-    repeat_index = num_groups[num_str].index(quarter)
-    offset = repeat_index * 10000
-    unique_num = offset + num_int
-
-    idtur = str(unique_num).zfill(5)
-    names = idtur            # то же самое
-    number = str(num_int)    # только последний блок
-
-    # Координаты
-    if APPLY_ROTATE_AND_MIRROR:
-        transformed = [[round(y, 6), round(x, 6)] for x, y in coords]
-    else:
-        transformed = [[round(x, 6), round(y, 6)] for x, y in coords]
+    print(f"💾 Черновик сохранён: {written}")
 
-    # Порядок полей — по алфавиту, coordinates последним
-    result_data.append({
-        "adres": adres,
-        "id": i + 1,
-        "idtur": idtur,
-        "kadastr": kadastr,
-        "kadastrurl": f"https://nspd.gov.ru/map?query={kadastr.replace(':','%3A')}&zoom=16&theme_id=1&active_layers=36048",
-        "names": names,
-        "number": number,
-        "price": price,
-        "size": size,
-        "status": "sale",
-        "coordinates": [transformed]
-    })
 
+def incremental_update(geojson_files, manifest):
+    """
+    Добавляет новые и изменённые участки в рабочий файл. Центр берётся из
+    манифеста; калибровки, вписанные в координаты (baked), применяются и к
+    новым кольцам, ленивые остаются на стеке. id и idtur существующих
+    участков не меняются.
+    """
+    before = json.dumps(manifest)
+    if not os.path.isfile(parcels_path):
+        # рабочего файла нет — участки берутся из polygon.json, а он выгружен
+        # уже со всем стеком: стек считается вписанным, иначе при экспорте
+        # он применится второй раз
+        manifest["baked"] = len(manifest["calibration"])
+    data = load_working(polygon_path, calibrated=False)
+
+    old_files = manifest["files"]
+    current = {relative(f): f for f in geojson_files}
+
+    changed = [f for rel, f in current.items() if file_changed(f, old_files.get(rel))]
+    removed = [rel for rel in old_files if rel not in current]
+
+    if not changed and not removed:
+        # манифест — только если он изменился (mtime в file_changed, baked),
+        # иначе производные файлы считались бы устаревшими
+        if json.dumps(manifest) != before:
+            save_manifest(polygon_path, manifest)
+        print("✅ Изменений нет — polygon.parcels актуален.")
+        return
+
+    # участки удалённых и изменённых файлов убираются; изменённые вернутся ниже
+    drop = {old_files[rel].get("kadastr") for rel in removed}
+    drop |= {old_files.get(relative(f), {}).get("kadastr") for f in changed}
+    drop.discard(None)
+    kept = {item["kadastr"]: item for item in data if item["kadastr"] in drop}
+    data = [item for item in data if item["kadastr"] not in drop]
+
+    center_x, center_y = manifest["origin"]
+    next_id = max((item["id"] for item in data), default=0) + 1
+    taken = {item["idtur"] for item in data}
+    added = updated = 0
+
+    for file, rec in zip(changed, load_records(changed)):
+        rel = relative(file)
+        kadastr = rec["meta"]["kadastr"] if rec else None
+        old_files[rel] = file_entry(file, kadastr)
+        if rec is None:
+            continue
+
+        coords = to_stored(shift_ring(rec["ring"], center_x, center_y))
+        coords = apply_calibration(coords, manifest["calibration"][:manifest["baked"]])
+
+        prev = kept.get(kadastr)
+        if prev is not None:
+            # изменилась геометрия: номер и ручные правки (цена, статус) сохраняются
+            prev.update({"adres": rec["meta"]["adres"], "size": rec["meta"]["size"],
+                         "coordinates": [coords]})
+            data.append(kept.pop(kadastr))
+            updated += 1
+            continue
+
+        # idtur: первый свободный повтор номера, как в полной сборке (+10000 на повтор)
+        num_int = int(kadastr.split(":")[-1])
+        offset = 0
+        while str(offset + num_int).zfill(5) in taken:
+            offset += 10000
+        idtur = str(offset + num_int).zfill(5)
+        taken.add(idtur)
+
+        data.append(make_item(next_id, idtur, rec["meta"], coords))
+        next_id += 1
+        added += 1
+
+    for rel in removed:
+        del old_files[rel]
+
+    data.sort(key=lambda item: item["id"])
+    written = write_polygon(data, manifest)
+
+    print(f"➕ Добавлено: {added}, обновлено: {updated}, удалено: {len(kept)}")
+    print(f"💾 Обновлено: {written} (калибровка сохранена)")
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Stage 1: сборка polygon.json из GeoJSON")
+    p.add_argument("--full", action="store_true",
+                   help="пересобрать с нуля (новый центр, калибровка Stage 2 сбрасывается)")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    geojson_files = sorted(glob.glob(os.path.join(base_dir, "**", "*.geojson"), recursive=True))
+    print(f"📂 Найдено файлов: {len(geojson_files)}")
+
+    if not args.full:
+        # ручные правки polygon.json (цена, статус) — в рабочий файл до сборки
+        sync_edits(polygon_path)
+    manifest = None if args.full else load_manifest(polygon_path)
+    if manifest is not None and (
+        manifest.get("tolerance") != min_distance_between_points
+        or manifest.get("swap_axes") != APPLY_ROTATE_AND_MIRROR
+        or not (os.path.isfile(parcels_path) or os.path.isfile(polygon_path))
+    ):
+        print("⚠️ Манифест не соответствует настройкам — полная пересборка")
+        manifest = None
+
+    if manifest is not None:
+        incremental_update(geojson_files, manifest)
+    else:
+        full_build(geojson_files)
+
+    # polygon_topo.json и polygon_lod.json (simplify.lod_tolerances) — если
+    # рабочий файл новее их
+    refresh_derived(polygon_path)
 
-with open(polygon_path, "w", encoding="utf-8") as f:
-    json.dump({"inc": len(result_data), "data": result_data}, f, ensure_ascii=False, indent=2)
+    removed = cache.evict()
+    if removed:
+        print(f"🧹 Из кэша геометрии вытеснено записей: {removed}")
 
-print("💾 Черновик сохранён: polygon.json")
-print("=== DONE STAGE 1 ===")
+    print("=== DONE STAGE 1 ===")
 
 
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,26 @@
 ﻿# FILENAME: stage2_transform.py
 
+#
+# Stage 2: калибровка по разметочной сетке. Интерактивно (main) или из кода:
+#
+#   calibrate(project_dir, [("bm74", "ai76"), ("as92", "as97")])
+#   calibrate(project_dir, load_control_points("points.csv"), model="affine")
+#
+# Пары — имена квадратов сетки или координаты (x, y); без input(), можно
+# вызывать для многих проектов подряд (batch_calibrate.py).
+
 import os
-import json
-import math
 
-polygon_path = os.path.join(os.getcwd(), "polygon.json")
+from control_points import (
+    MIN_POINTS, load_control_points, residuals, rms, similarity_params, solve
+)
+from polygon_export import COMPRESSIONS, export_options, write_polygon_json
+from polygon_store import add_calibration, load_parcels, working_source
+
+POLYGON_NAME = "polygon.json"
+# разметочная сетка — отдельный слой для карты на время калибровки;
+# polygon.json и рабочий файл она не трогает
+GRID_NAME = "polygon.grid.json"
 APPLY_ROTATE_AND_MIRROR = True
 
 DEFAULT_STEP = 50
@@ -58,77 +74,113 @@ def generate_debug_grid(
     return data, centers
 
 
-def apply_transform(coords, transform, allow_rotation=True):
-    out = []
-    s = transform["scale"]
+def build_grid(project_dir, step=DEFAULT_STEP):
+    """
+    Сетка проекта: (участки-квадраты в формате polygon.json, {имя: центр}).
+    Номера квадратов — после участков, чтобы не совпадали с ними на карте.
+    """
+    source = working_source(os.path.join(project_dir, POLYGON_NAME))
+    if not os.path.isfile(source):
+        raise FileNotFoundError(f"{project_dir}: нет polygon.json — сначала Stage1")
+    real_count = len(load_parcels(source, swap_axes=APPLY_ROTATE_AND_MIRROR, calibrated=False))
 
-    if allow_rotation:
-        ang = math.radians(transform["rotation_deg"])
-        ca, sa = math.cos(ang), math.sin(ang)
-    else:
-        ca, sa = 1, 0  # rotation disabled
+    grid_data, grid_centers = generate_debug_grid(step=step, start_index=real_count)
 
-    ox, oy = transform["offset_x"], transform["offset_y"]
+    centers = {}
+    grid_items = []
+    for square, gid, grid_name in grid_data:
+        if APPLY_ROTATE_AND_MIRROR:
+            sq = [[round(y, 6), round(x, 6)] for x, y in square]
+        else:
+            sq = square
+
+        grid_items.append({
+            "id": real_count + len(grid_items) + 1,
+            "number": grid_name,
+            "names": grid_name,
+            "kadastr": f"99:99:9999999:{gid}",
+            "kadastrurl": "",
+            "idtur": str(gid).zfill(5),
+            "status": "sale",
+            "coordinates": [sq]
+        })
 
-    for x, y in coords:
-        x *= s
-        y *= s
-        xr = x * ca - y * sa + ox
-        yr = x * sa + y * ca + oy
-        out.append([round(xr, 6), round(yr, 6)])
+        centers[grid_name] = grid_centers[str(gid)]
 
-    return out
+    return grid_items, centers
 
 
-def compute_similarity_transform(f1, t1, f2, t2, allow_rotation=True):
-    dx1, dy1 = f1
-    dx2, dy2 = f2
-    tx1, ty1 = t1
-    tx2, ty2 = t2
+def write_grid_overlay(project_dir, grid_items):
+    path = os.path.join(project_dir, GRID_NAME)
+    # тот же формат, что polygon.json (та же загрузка на странице), без индекса поиска
+    options = export_options(project_dir)
+    options.pop("hit_index", None)
+    write_polygon_json(path, grid_items, len(grid_items), **options)
+    return path
 
-    vf = (dx2 - dx1, dy2 - dy1)
-    vt = (tx2 - tx1, ty2 - ty1)
 
-    lf = math.hypot(*vf)
-    lt = math.hypot(*vt)
+def remove_grid_overlay(project_dir):
+    path = os.path.join(project_dir, GRID_NAME)
+    for file in [path] + [path + "." + ext for ext in COMPRESSIONS]:
+        if os.path.isfile(file):
+            os.remove(file)
 
-    if lf == 0:
-        raise ValueError("Исходные точки совпадают")
 
-    scale = lt / lf
+def calibrate(project_dir, pairs, model="similarity", allow_rotation=True, step=DEFAULT_STEP,
+              export=None, centers=None):
+    """
+    Решает трансформацию по парам и кладёт её на стек калибровок проекта.
+    pairs — [(исходная, целевая)], точка — имя квадрата сетки шага step или
+    (x, y); centers — уже построенная сетка ({имя: центр}), если есть.
+    Возвращает {"transform", "residuals", "rms", "exported"}; ValueError —
+    неизвестные квадраты или мало пар.
+    """
+    if centers is None and any(isinstance(p, str) for pair in pairs for p in pair):
+        centers = build_grid(project_dir, step)[1]
+    unknown = sorted({p for pair in pairs for p in pair if isinstance(p, str) and p not in centers})
+    if unknown:
+        raise ValueError("в сетке нет квадратов: " + ", ".join(unknown))
 
-    if allow_rotation:
-        af = math.atan2(vf[1], vf[0])
-        at = math.atan2(vt[1], vt[0])
-        r = at - af
-        rd = math.degrees(r)
+    def point(p):
+        return centers[p] if isinstance(p, str) else p
 
-        ca, sa = math.cos(r), math.sin(r)
-        ox = tx1 - scale * (ca * dx1 - sa * dy1)
-        oy = ty1 - scale * (sa * dx1 + ca * dy1)
-    else:
-        rd = 0
-        ox = tx1 - scale * dx1
-        oy = ty1 - scale * dy1
+    src = [point(a) for a, _ in pairs]
+    dst = [point(b) for _, b in pairs]
+    m = solve(src, dst, model, allow_rotation=allow_rotation)
+    res = residuals(m, src, dst)
 
-    return {
-        "scale": scale,
-        "rotation_deg": rd,
-        "offset_x": ox,
-        "offset_y": oy
-    }
+    tr = similarity_params(m) if model == "similarity" else {"matrix": m.tolist()}
+    # трансформация ложится на стек калибровок проекта, рабочий файл не переписывается
+    exported = add_calibration(os.path.join(project_dir, POLYGON_NAME), "stage2", tr,
+                               APPLY_ROTATE_AND_MIRROR, export)
+    return {"transform": tr, "residuals": res.tolist(), "rms": rms(res), "exported": exported}
 
 
-def input_valid_square(prompt, name_to_gid):
+def input_valid_square(prompt, centers):
     while True:
         v = input(prompt).strip()
-        if v in name_to_gid:
+        if v in centers:
             return v
         print("❌ Квадрат не найден. Повтори ввод.")
 
 
+def input_pairs(centers, need):
+    """Пары квадратов «исходный → целевой», пока не пустой ввод (не меньше need)."""
+    pairs = []
+    while True:
+        n = len(pairs) + 1
+        src = input(f"{n}. Исходная → ").strip()
+        if not src and len(pairs) >= need:
+            return pairs
+        if src not in centers:
+            print("❌ Квадрат не найден. Повтори ввод." if src else f"❌ Нужно не меньше {need} пар.")
+            continue
+        pairs.append((src, input_valid_square(f"{n}. Целевая   → ", centers)))
+
+
 def main():
-    if not os.path.isfile(polygon_path):
+    project_dir = os.getcwd()
+    if not os.path.isfile(working_source(os.path.join(project_dir, POLYGON_NAME))):
         print("❌ Нет polygon.json — сначала Stage1.")
         return
 
@@ -141,105 +193,49 @@ def main():
             step = v
             print(f"Используем шаг: {step}")
 
-    allow_rot = True
-    inp = input("Разрешать поворот при трансформации сетки? (1 — да, 0 — нет, Enter — да): ").strip()
-    if inp == "0":
-        allow_rot = False
-        print("Поворот ОТКЛЮЧЕН (фиксированный север).")
-    else:
-        print("Поворот разрешён.")
-
-    with open(polygon_path, "r", encoding="utf-8") as f:
-        obj = json.load(f)
-
-    data = obj["data"]
+    inp = input("Модель: 1 — подобие, 2 — аффинная, 3 — проективная (Enter — подобие): ").strip()
+    model = {"2": "affine", "3": "projective"}.get(inp, "similarity")
+    print(f"Модель: {model}, пар нужно не меньше {MIN_POINTS[model]}.")
 
-    real_count = sum(
-        1 for item in data
-        if not item["kadastr"].startswith("99:99:9999999:")
-    )
-    start_index = real_count
-
-    print("🔧 Генерирую разметочную сетку...")
-    grid_data, grid_centers = generate_debug_grid(step=step, start_index=start_index)
-
-    name_to_gid = {}
-    for square, gid, grid_name in grid_data:
-        if APPLY_ROTATE_AND_MIRROR:
-            sq = [[round(y, 6), round(x, 6)] for x, y in square]
+    allow_rot = True
+    if model == "similarity":
+        inp = input("Разрешать поворот при трансформации сетки? (1 — да, 0 — нет, Enter — да): ").strip()
+        if inp == "0":
+            allow_rot = False
+            print("Поворот ОТКЛЮЧЕН (фиксированный север).")
         else:
-            sq = square
-
-        data.append({
-            "id": len(data) + 1,
-            "number": grid_name,
-            "names": grid_name,
-            "kadastr": f"99:99:9999999:{gid}",
-            "kadastrurl": "",
-            "idtur": str(gid).zfill(5),
-            "status": "sale",
-            "coordinates": [sq]
-        })
-
-        name_to_gid[grid_name] = str(gid)
-
-    obj["data"] = data
-
-    with open(polygon_path, "w", encoding="utf-8") as f:
-        json.dump(obj, f, ensure_ascii=False, indent=2)
-
-    print("💾 Сетка добавлена.")
-
-    print("\n🧭 Введите 4 квадрата для трансформации (например aa03):")
+            print("Поворот разрешён.")
 
-    g1 = input_valid_square("1. Исходная → ", name_to_gid)
-    g2 = input_valid_square("2. Целевая   → ", name_to_gid)
-    g3 = input_valid_square("3. Исходная2 → ", name_to_gid)
-    g4 = input_valid_square("4. Целевая2  → ", name_to_gid)
-
-    tr = compute_similarity_transform(
-        grid_centers[name_to_gid[g1]],
-        grid_centers[name_to_gid[g2]],
-        grid_centers[name_to_gid[g3]],
-        grid_centers[name_to_gid[g4]],
-        allow_rotation=allow_rot
-    )
-
-    print("🔧 Трансформация:", tr)
-
-    final = []
-    for item in data:
-        kid = item["kadastr"]
-        coords = item["coordinates"][0]
-
-        if not kid.startswith("99:99:"):
-            if APPLY_ROTATE_AND_MIRROR:
-                coords = [[y, x] for x, y in coords]
-
-            tcoords = apply_transform(coords, tr, allow_rotation=allow_rot)
-
-            if APPLY_ROTATE_AND_MIRROR:
-                tcoords = [[round(y, 6), round(x, 6)] for x, y in tcoords]
-
-            item["coordinates"] = [tcoords]
-
-        final.append(item)
-
-    final_clean = [
-        item for item in final
-        if not item["kadastr"].startswith("99:99:9999999:")
-    ]
-
-    obj["data"] = final_clean
-
-    with open(polygon_path, "w", encoding="utf-8") as f:
-        json.dump(obj, f, ensure_ascii=False, indent=2)
+    print("🔧 Генерирую разметочную сетку...")
+    grid_items, centers = build_grid(project_dir, step)
+    grid_path = write_grid_overlay(project_dir, grid_items)
+
+    print(f"💾 Сетка: {os.path.basename(grid_path)} (слой поверх polygon.json)")
+
+    try:
+        csv_path = input("\nCSV с контрольными точками (Enter — ввод квадратов): ").strip().strip('"')
+        if not csv_path:
+            print("🧭 Пары квадратов для трансформации (например aa03), пустой ввод — конец:")
+            pairs = input_pairs(centers, MIN_POINTS[model])
+    finally:
+        remove_grid_overlay(project_dir)
+    print("🧹 Слой сетки удалён.")
+
+    try:
+        if csv_path:
+            pairs = load_control_points(csv_path)
+        result = calibrate(project_dir, pairs, model, allow_rot, step, centers=centers)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        return
 
-    print("🧹 Разметочные квадраты удалены.")
-    print("✅ polygon.json сохранён после применения трансформации.")
+    print("📏 Остатки по точкам:")
+    for (a, b), r in zip(pairs, result["residuals"]):
+        print(f"   {a} → {b}: {r:.3f}")
+    print(f"📏 RMS: {result['rms']:.3f} ({len(pairs)} пар)")
+    print("🔧 Трансформация:", result["transform"])
+    print("✅ Калибровка добавлена" + (", polygon.json выгружен." if result["exported"] else "."))
 
 
 if __name__ == "__main__":
     main()
-
-